@@ -0,0 +1,234 @@
+"""
+Admission control in front of the Apps Script quota.
+
+Two layers:
+
+- Token buckets per key (client IP in the middleware; phone number and
+  user id from inside the endpoints that know them). Buckets live in
+  memory; with several workers each one enforces its share of the rate
+  (ADMISSION_WORKERS, else worker_count()), so the fleet-wide limit
+  holds without a shared store.
+- Concurrency limits per route and priority shedding. Every route is
+  classed critical (accept, verify), normal or low (catalog, polling).
+  When the total number of requests in flight passes a class's share of
+  ADMISSION_MAX_INFLIGHT, that class is turned away first, so polling
+  backs off before accepts and OTP checks do.
+
+Rejections are 429 with a Retry-After header.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Pattern, Tuple
+import json
+import math
+import os
+import re
+import time
+
+from fastapi import HTTPException, status
+
+CRITICAL, NORMAL, LOW = "critical", "normal", "low"
+
+# Share of ADMISSION_MAX_INFLIGHT a class may run into before it is shed
+SHED_AT = {LOW: 0.5, NORMAL: 0.8, CRITICAL: 1.0}
+
+# (method, path pattern, route name, class); first match wins, unmatched paths are not limited
+ROUTES: List[Tuple[str, Pattern, str, str]] = [
+    (method, re.compile(pattern), name, priority)
+    for method, pattern, name, priority in [
+        ("POST", r"^/orders/[^/]+/accept$", "accept_order", CRITICAL),
+        ("POST", r"^/orders/[^/]+/verify_otp$", "verify_order_otp", CRITICAL),
+        ("POST", r"^/login/verify_otp$", "verify_otp", CRITICAL),
+        ("POST", r"^/orders$", "create_order", NORMAL),
+        ("POST", r"^/orders/bulk$", "create_orders_bulk", NORMAL),
+        ("POST", r"^/login/send_otp$", "send_otp", NORMAL),
+        ("POST", r"^/users/register$", "register_user", NORMAL),
+        ("GET", r"^/orders/available$", "available_orders", LOW),
+        ("GET", r"^/orders/partner/status$", "partner_status", LOW),
+        ("GET", r"^/items/", "catalog", LOW),
+        ("GET", r"^/blockchain/transactions$", "transactions", LOW),
+        ("GET", r"^/partners/nearby$", "nearby_partners", LOW),
+        ("GET", r"^/orders$", "order_lookup", NORMAL),
+        ("POST", r"^/orders/lookup$", "order_lookup", NORMAL),
+        ("GET", r"^/orders/[^/]+/eta$", "order_eta", NORMAL),
+        ("GET", r"^/orders/[^/]+$", "order_details", NORMAL),
+    ]
+]
+
+
+def _env_float(name: str, default: str) -> float:
+    return float(os.getenv(name, default))
+
+
+class TokenBuckets:
+    """
+    Token buckets for many keys: `rate` tokens per second up to `burst`.
+    Idle keys are dropped oldest first past `max_keys`; a dropped bucket
+    would have refilled by then anyway.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # {key: (tokens, updated_at)}, least recently used first
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.rejected = 0
+
+    def acquire(self, key: str, now: Optional[float] = None) -> float:
+        """Take one token; returns 0 on success, else seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        tokens, updated = self.buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate if self.rate > 0 else 60.0
+            self.rejected += 1
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return wait
+
+
+def worker_count(parent_cmdline: Optional[List[str]] = None) -> int:
+    """
+    uvicorn workers on this host: WEB_CONCURRENCY (uvicorn's own default for
+    --workers), else a --workers flag on the parent uvicorn process.
+    """
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    if parent_cmdline is None:
+        try:
+            with open(f"/proc/{os.getppid()}/cmdline", "rb") as f:
+                parent_cmdline = f.read().decode(errors="replace").split("\0")
+        except OSError:
+            return 1
+    for i, arg in enumerate(parent_cmdline):
+        if arg == "--workers" and i + 1 < len(parent_cmdline) and parent_cmdline[i + 1].isdigit():
+            return int(parent_cmdline[i + 1])
+        if arg.startswith("--workers=") and arg[len("--workers="):].isdigit():
+            return int(arg[len("--workers="):])
+    return 1
+
+
+class AdmissionController:
+    def __init__(self, max_inflight: Optional[int] = None, workers: Optional[int] = None):
+        self.enabled = os.getenv("ADMISSION_CONTROL", "1").lower() not in ("0", "false", "no")
+        self.workers = workers or int(os.getenv("ADMISSION_WORKERS", "0")) or worker_count()
+        self.max_inflight = max_inflight or int(os.getenv("ADMISSION_MAX_INFLIGHT", "256"))
+        self.route_limits = {
+            CRITICAL: int(os.getenv("ADMISSION_ROUTE_LIMIT_CRITICAL", "128")),
+            NORMAL: int(os.getenv("ADMISSION_ROUTE_LIMIT_NORMAL", "64")),
+            LOW: int(os.getenv("ADMISSION_ROUTE_LIMIT_LOW", "32")),
+        }
+        share = 1.0 / max(self.workers, 1)
+        self.limits: Dict[str, TokenBuckets] = {
+            # Generous: carrier NAT puts many phones behind one IP
+            "ip": TokenBuckets(_env_float("ADMISSION_IP_RATE", "50") * share,
+                               _env_float("ADMISSION_IP_BURST", "200") * share),
+            # OTP sends per phone number: 3 at once, then one every 20 s
+            "phone": TokenBuckets(_env_float("ADMISSION_PHONE_RATE", "0.05") * share,
+                                  max(_env_float("ADMISSION_PHONE_BURST", "3") * share, 1)),
+            "user": TokenBuckets(_env_float("ADMISSION_USER_RATE", "2") * share,
+                                 max(_env_float("ADMISSION_USER_BURST", "10") * share, 1)),
+        }
+        self.inflight: Dict[str, int] = {}
+        self.total_inflight = 0
+        self.shed: Dict[str, int] = {CRITICAL: 0, NORMAL: 0, LOW: 0}
+
+    @staticmethod
+    def classify(method: str, path: str) -> Optional[Tuple[str, str]]:
+        for route_method, pattern, name, priority in ROUTES:
+            if method == route_method and pattern.match(path):
+                return name, priority
+        return None
+
+    def limit(self, kind: str, key: Optional[str]):
+        """Per-key check for endpoints; raises 429 when the key is over its rate."""
+        if not self.enabled or not key:
+            return
+        wait = self.limits[kind].acquire(key)
+        if wait > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Too many requests for this {kind}, retry later",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+
+    def try_enter(self, name: str, priority: str) -> bool:
+        if self.inflight.get(name, 0) >= self.route_limits[priority] \
+                or self.total_inflight >= self.max_inflight * SHED_AT[priority]:
+            self.shed[priority] += 1
+            return False
+        self.inflight[name] = self.inflight.get(name, 0) + 1
+        self.total_inflight += 1
+        return True
+
+    def leave(self, name: str):
+        self.inflight[name] -= 1
+        self.total_inflight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "inflight": self.total_inflight,
+            "max_inflight": self.max_inflight,
+            "inflight_by_route": {name: count for name, count in self.inflight.items() if count},
+            "shed": dict(self.shed),
+            "rate_limited": {kind: buckets.rejected for kind, buckets in self.limits.items()},
+            "tracked_keys": {kind: len(buckets.buckets) for kind, buckets in self.limits.items()}
+        }
+
+
+class AdmissionMiddleware:
+    """Per-IP buckets, per-route concurrency and priority shedding for HTTP routes."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+        # Behind a proxy (e.g. Vercel) every request comes from the proxy's address
+        self.trust_forwarded = os.getenv("ADMISSION_TRUST_FORWARDED", "0").lower() in ("1", "true", "yes")
+
+    def client_address(self, scope) -> Optional[str]:
+        if self.trust_forwarded:
+            for name, value in scope.get("headers", []):
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else None
+
+    async def __call__(self, scope, receive, send):
+        controller = self.controller
+        route = controller.classify(scope.get("method", ""), scope.get("path", "")) \
+            if scope["type"] == "http" and controller.enabled else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        name, priority = route
+        address = self.client_address(scope)
+        wait = controller.limits["ip"].acquire(address) if address else 0.0
+        if wait > 0:
+            await self._reject(send, "Too many requests from this address, retry later", wait)
+            return
+        if not controller.try_enter(name, priority):
+            await self._reject(send, "Server busy, retry later", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.leave(name)
+
+    @staticmethod
+    async def _reject(send, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_429_TOO_MANY_REQUESTS,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"retry-after", str(max(math.ceil(retry_after), 1)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: import time and time to first response (coldstart.py).
+
+Every run is a fresh interpreter, as on a serverless cold start. The
+backend talks to a local fake Apps Script over HTTP with a fixed latency
+standing in for the real one, and each run reports:
+
+- import: `import main`, including what cold-start mode moves to init
+- startup: the ASGI startup hooks (connection prewarming)
+- first catalog / first order list: the first /items/nearby and the first
+  /orders/available request, i.e. what the user who triggered the cold
+  start waits for
+- total: process spawn to both responses, measured by the parent
+
+Runs alternate between COLD_START_MODE=0 and 1. A local fake has no DNS
+or TLS, so the prewarm saving against the real Apps Script is not shown.
+
+    python bench_coldstart.py
+    python bench_coldstart.py --runs 10 --upstream-latency fixed:1500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIELDS = ["import_ms", "startup_ms", "first_catalog_ms", "first_orders_ms", "total_ms"]
+
+
+async def child():
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    await main.app.router.startup()
+    started = time.perf_counter()
+
+    result = {"import_ms": (imported - start) * 1000, "startup_ms": (started - imported) * 1000}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://vicino.test") as client:
+        for name, path in (("first_catalog_ms", "/items/nearby?q=milk"), ("first_orders_ms", "/orders/available")):
+            begin = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            result[name] = (time.perf_counter() - begin) * 1000
+    print(json.dumps(result))
+
+
+def wait_for(url: str, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.post(url, params={"path": "get_nearby_items"}, json={}, timeout=timeout)
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def run_child(env: dict) -> dict:
+    begin = time.perf_counter()
+    output = subprocess.run([sys.executable, __file__, "--child"], env=env, cwd=HERE,
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["total_ms"] = (time.perf_counter() - begin) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serverless cold starts")
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per mode")
+    parser.add_argument("--port", type=int, default=9031)
+    parser.add_argument("--upstream-latency", default="fixed:800", help="fake Apps Script latency")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child())
+        return
+
+    url = f"http://127.0.0.1:{args.port}/exec"
+    fake = subprocess.Popen([sys.executable, "fake_appscript.py", "--port", str(args.port),
+                             "--latency", args.upstream_latency],
+                            cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(url)
+        with tempfile.TemporaryDirectory() as tmp:
+            snapshot = os.path.join(tmp, "catalog_snapshot.json")
+            base_env = dict(os.environ, APP_SCRIPT_URL=url, CATALOG_SNAPSHOT=snapshot,
+                            COLD_START_PREWARM_URLS="", PYTHONDONTWRITEBYTECODE="1")
+            subprocess.run([sys.executable, "coldstart.py", "snapshot", "--out", snapshot],
+                           env=base_env, cwd=HERE, check=True, capture_output=True)
+
+            results = {"0": [], "1": []}
+            for _ in range(args.runs):
+                for mode in results:
+                    results[mode].append(run_child(dict(base_env, COLD_START_MODE=mode)))
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    print(f"{args.runs} cold starts per mode, upstream latency {args.upstream_latency} (medians, ms)")
+    print(f"{'mode':<16}" + "".join(f"{field[:-3]:>18}" for field in FIELDS))
+    for mode, label in (("0", "standard"), ("1", "cold-start mode")):
+        row = [statistics.median(run[field] for run in results[mode]) for field in FIELDS]
+        print(f"{label:<16}" + "".join(f"{value:>18.1f}" for value in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark for batch dispatch (dispatch.py).
+
+Places random orders and partners around Chennai and reports candidate
+generation and solve time, plus average pickup distance against a
+greedy first-come baseline (each order takes the nearest free partner,
+which is roughly what the broadcast free-for-all converges to).
+
+    python bench_dispatch.py
+    python bench_dispatch.py --sizes 1000x1000,5000x5000 --candidates 16
+"""
+
+import argparse
+import random
+import time
+
+from dispatch import DispatchConfig, build_candidates, hungarian, solve
+from spatial_index import haversine_km
+
+CENTER = (13.0827, 80.2707)
+SPREAD_DEG = 0.15   # roughly a 30 km box
+
+
+def random_points(rng: random.Random, count: int):
+    return [(CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+             CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)) for _ in range(count)]
+
+
+def greedy(orders, partners, max_km):
+    taken = set()
+    assignment = []
+    for lat, lng in orders:
+        best, best_d = -1, max_km
+        for j, (plat, plng) in enumerate(partners):
+            if j in taken:
+                continue
+            d = haversine_km(lat, lng, plat, plng)
+            if d < best_d:
+                best, best_d = j, d
+        if best >= 0:
+            taken.add(best)
+        assignment.append(best)
+    return assignment
+
+
+def pickup_stats(orders, partners, assignment):
+    distances = [haversine_km(*orders[i], *partners[j]) for i, j in enumerate(assignment) if j >= 0]
+    assigned = len(distances)
+    return assigned, (sum(distances) / assigned if assigned else 0.0)
+
+
+def run(n_orders: int, n_partners: int, config: DispatchConfig, seed: int, with_greedy: bool):
+    rng = random.Random(seed)
+    orders = random_points(rng, n_orders)
+    partners = random_points(rng, n_partners)
+    idle = [0.0] * n_partners
+
+    start = time.perf_counter()
+    candidates = build_candidates(orders, partners, idle, config)
+    candidate_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    assignment = solve(candidates, n_partners, config)
+    solve_ms = (time.perf_counter() - start) * 1000
+    assigned, avg_km = pickup_stats(orders, partners, assignment)
+
+    line = (f"{n_orders:>6} x {n_partners:<6} candidates {candidate_ms:>9.1f} ms   "
+            f"solve {solve_ms:>9.1f} ms   assigned {assigned:>6}   avg pickup {avg_km:6.3f} km")
+    if with_greedy:
+        base_assigned, base_km = pickup_stats(orders, partners, greedy(orders, partners, config.max_radius_km))
+        line += f"   | greedy assigned {base_assigned:>6} avg {base_km:6.3f} km"
+    print(line)
+
+
+def check_optimality(config: DispatchConfig, seed: int):
+    """Auction vs exact Hungarian on dense random problems."""
+    rng = random.Random(seed)
+    worst_gap = 0.0
+    for _ in range(5):
+        n = 40
+        cost = [[rng.uniform(0, 10) for _ in range(n)] for _ in range(n)]
+        exact = hungarian(cost)
+        candidates = [[(j, cost[i][j]) for j in range(n)] for i in range(n)]
+        approx_config = DispatchConfig(dense_limit=0, max_radius_km=1000)
+        approx = solve(candidates, n, approx_config)
+        exact_cost = sum(cost[i][j] for i, j in enumerate(exact))
+        approx_cost = sum(cost[i][j] for i, j in enumerate(approx) if j >= 0)
+        worst_gap = max(worst_gap, (approx_cost - exact_cost) / exact_cost)
+    print(f"auction vs hungarian (40x40 dense, 5 trials): worst cost gap {worst_gap * 100:.3f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch dispatch")
+    parser.add_argument("--sizes", default="100x100,1000x1000,2000x3000,5000x5000")
+    parser.add_argument("--candidates", type=int, default=16)
+    parser.add_argument("--radius", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--greedy-limit", type=int, default=2000,
+                        help="skip the O(n*m) greedy baseline above this many orders")
+    args = parser.parse_args()
+
+    config = DispatchConfig(candidates_per_order=args.candidates, max_radius_km=args.radius)
+    print("🚚 Batch dispatch benchmark\n")
+    check_optimality(config, args.seed)
+    print()
+    for size in args.sizes.split(","):
+        n_orders, n_partners = (int(x) for x in size.lower().split("x"))
+        run(n_orders, n_partners, config, args.seed, n_orders <= args.greedy_limit)
+
+
+if __name__ == "__main__":
+    main()
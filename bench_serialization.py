@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for order list serialization (serialization.py).
+
+Compares the current FastAPI path (build Order/Item models, validate them
+again against response_model, encode with json) with the OrderEncoder
+path, with and without validation, cold (empty cache) and warm.
+
+    python bench_serialization.py
+    python bench_serialization.py --orders 100,1000,10000 --repeat 5
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import List
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import serialization
+from main import Item, Order, OrderStatus, validate_order_payload
+from serialization import OrderEncoder
+
+PRODUCTS = [("Carrot", "kg", 10.0), ("Aspirin", "strip", 50.0), ("Banana", "dozen", 5.0),
+            ("Milk", "l", 30.0), ("Bread", "unit", 40.0), ("Rice", "kg", 60.0)]
+
+
+def backend_orders(count: int, seed: int) -> List[dict]:
+    """Orders as Apps Script returns them from get_available_orders."""
+    rng = random.Random(seed)
+    orders = []
+    for i in range(count):
+        items = [{"name": name, "quantity": rng.randint(1, 5), "unit": unit, "price": price}
+                 for name, unit, price in rng.sample(PRODUCTS, rng.randint(1, 4))]
+        orders.append({
+            "id": f"order-{i}",
+            "customerId": f"customer-{rng.randint(1, 5000)}",
+            "items": items,
+            "totalAmount": sum(item["quantity"] * item["price"] for item in items),
+            "status": "Pending",
+            "assignedPartnerId": None,
+            "otp": None
+        })
+    return orders
+
+
+async def fastapi_path(orders: List[dict], field) -> bytes:
+    models = [Order(
+        id=data["id"],
+        customer_id=data["customerId"],
+        items=[Item(**item) for item in data["items"]],
+        total_amount=data["totalAmount"],
+        status=OrderStatus(data["status"]),
+        assigned_partner_id=data.get("assignedPartnerId"),
+        otp=data.get("otp")
+    ) for data in orders]
+    content = await serialize_response(field=field, response_content=models)
+    # What JSONResponse.render does
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run(count: int, repeat: int, seed: int):
+    import asyncio
+
+    orders = backend_orders(count, seed)
+    field = create_response_field(name="Response_get_available_orders", type_=List[Order])
+    baseline = asyncio.run(fastapi_path(orders, field))
+
+    results = {"fastapi (models + response_model + json)":
+               timed(lambda: asyncio.run(fastapi_path(orders, field)), repeat)}
+    for label, validate in (("encoder, validated", validate_order_payload), ("encoder, trusted", None)):
+        results[f"{label}, cold"] = timed(lambda: OrderEncoder(validate).encode_list(orders), repeat)
+        warm = OrderEncoder(validate)
+        encoded = warm.encode_list(orders)
+        assert json.loads(encoded) == json.loads(baseline)
+        results[f"{label}, warm"] = timed(lambda: warm.encode_list(orders), repeat)
+
+    base = results["fastapi (models + response_model + json)"]
+    print(f"{count} orders ({len(baseline) / 1024:.0f} KiB)")
+    for label, ms in results.items():
+        print(f"  {label:<44} {ms:9.2f} ms  {base / ms:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark order serialization")
+    parser.add_argument("--orders", default="100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"🧾 Order serialization benchmark (encoder: {'orjson' if serialization.orjson else 'json'})\n")
+    for count in args.orders.split(","):
+        run(int(count), args.repeat, args.seed)
+
+
+if __name__ == "__main__":
+    main()
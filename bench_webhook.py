@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark for booking fan-out in webhook.py.
+
+Registers a large partner fleet, creates bookings, lists pending bookings
+per partner and races pickups, reporting time and memory per booking.
+The old layout (a {partner: status} dict per booking, rewritten on
+pickup) is measured on a few bookings and extrapolated, since it cannot
+hold the full run in memory.
+
+--delivery instead measures webhook delivery throughput against the
+in-process receiver (webhook_receiver.py) with a fixed per-request
+latency, for different numbers of partner endpoints.
+
+    python bench_webhook.py
+    python bench_webhook.py --partners 100000 --bookings 1000000
+    python bench_webhook.py --delivery 10,100,1000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+import uuid
+
+import httpx
+
+import webhook_receiver
+from webhook import Booking, BookingStore, PartnerRegistry
+from webhook_delivery import WebhookDelivery
+
+
+def legacy(partner_names, n_bookings: int):
+    """The previous webhook.py layout: per booking, one dict entry per partner."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = {}
+    for _ in range(n_bookings):
+        store[str(uuid.uuid4())] = {"partners": {partner: "pending" for partner in partner_names}}
+    create_s = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for booking in store.values():
+        statuses = booking["partners"]
+        statuses[partner_names[0]] = "picked"
+        for partner in partner_names[1:]:
+            statuses[partner] = "removed"
+    pickup_s = time.perf_counter() - start
+    return create_s / n_bookings, pickup_s / n_bookings, memory / n_bookings
+
+
+def delivery_throughput(n_endpoints: int, n_bookings: int, latency: float):
+    webhook_receiver.configure(latency=latency)
+
+    async def run():
+        delivery = WebhookDelivery(transport=httpx.ASGITransport(app=webhook_receiver.app))
+        for i in range(n_endpoints):
+            delivery.register(i, f"Partner{i + 1}", f"http://receiver.local/hooks/p{i}")
+        start = time.perf_counter()
+        for i in range(n_bookings):
+            delivery.enqueue(f"booking-{i}", {"service_name": "Pet Grooming"}, n_endpoints)
+        enqueue_s = time.perf_counter() - start
+        await delivery.drain(timeout=600)
+        elapsed = time.perf_counter() - start
+        await delivery.close()
+        return enqueue_s, elapsed, delivery.stats()
+
+    enqueue_s, elapsed, stats = asyncio.run(run())
+    print(f"{n_endpoints:>6} endpoints  enqueue {enqueue_s / n_bookings * 1e6:6.2f} µs/booking   "
+          f"delivered {stats['delivered_events']:>8} events in {stats['batches']:>6} batches, "
+          f"{elapsed:6.2f} s   {stats['delivered_events'] / elapsed:10.0f} events/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark webhook booking fan-out")
+    parser.add_argument("--partners", type=int, default=100_000)
+    parser.add_argument("--bookings", type=int, default=1_000_000)
+    parser.add_argument("--legacy-bookings", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--delivery", help="endpoint counts, e.g. 10,100,1000: benchmark delivery only")
+    parser.add_argument("--delivery-bookings", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="receiver latency per request (s)")
+    args = parser.parse_args()
+    if args.delivery:
+        print(f"📨 Webhook delivery: {args.delivery_bookings} bookings, {args.latency * 1000:.0f} ms per request\n")
+        for n_endpoints in args.delivery.split(","):
+            delivery_throughput(int(n_endpoints), args.delivery_bookings, args.latency)
+        return
+    rng = random.Random(args.seed)
+    service = Booking(user_id="user1", service_name="Pet Grooming", service_details="Full grooming session")
+    print(f"📦 Booking fan-out: {args.partners} partners, {args.bookings} bookings\n")
+
+    start = time.perf_counter()
+    partners = PartnerRegistry(f"Partner{i + 1}" for i in range(args.partners))
+    print(f"register partners     {(time.perf_counter() - start) * 1000:10.1f} ms")
+    store = BookingStore(partners)
+
+    # 100 partners join while bookings come in, so the newest ones see fewer bookings
+    join_every = max(args.bookings // 100, 1)
+    ids = [str(uuid.uuid4()) for _ in range(args.bookings)]
+    tracemalloc.start()
+    for i, booking_id in enumerate(ids):
+        if i % join_every == 0:
+            partners.add(f"Late{i // join_every + 1}")
+        store.create(booking_id, service)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Same again untraced for the timing
+    timed = BookingStore(partners)
+    start = time.perf_counter()
+    for booking_id in ids:
+        timed.create(booking_id, service)
+    create_s = time.perf_counter() - start
+    del timed
+    print(f"create bookings       {create_s * 1000:10.1f} ms   {create_s / args.bookings * 1e6:6.2f} µs/booking   "
+          f"{memory / args.bookings:6.0f} B/booking (store and open index, ids excluded)")
+
+    samples = [rng.randrange(len(partners)) for _ in range(1000)]
+    start = time.perf_counter()
+    for partner in samples:
+        store.pending_for(partner, limit=50)
+    print(f"pending, limit 50     {(time.perf_counter() - start) / len(samples) * 1e6:10.1f} µs/listing")
+    start = time.perf_counter()
+    newest = store.pending_for(len(partners) - 1)
+    print(f"pending, newest partner {(time.perf_counter() - start) * 1000:8.1f} ms   k={len(newest)}")
+    start = time.perf_counter()
+    everything = store.pending_for(0)
+    print(f"pending, first partner  {(time.perf_counter() - start) * 1000:8.1f} ms   k={len(everything)}")
+
+    # Two partners race for every booking; exactly one wins each time
+    start = time.perf_counter()
+    wins = 0
+    for booking_id in ids:
+        first, second = rng.randrange(args.partners), rng.randrange(args.partners)
+        wins += store.claim(booking_id, first) == first
+        wins += store.claim(booking_id, second) == second and second != first
+    claim_s = time.perf_counter() - start
+    print(f"contended pickups     {claim_s * 1000:10.1f} ms   {claim_s / (2 * args.bookings) * 1e6:6.2f} µs/pickup   "
+          f"winners {wins} / {args.bookings}, open left {len(store.open)}")
+
+    names = partners.names[:args.partners]
+    create_each, pickup_each, memory_each = legacy(names, args.legacy_bookings)
+    print(f"\nprevious layout ({args.legacy_bookings} bookings, extrapolated to {args.bookings}):")
+    print(f"create                {create_each * 1000:10.1f} ms/booking  -> {create_each * args.bookings / 3600:8.1f} h")
+    print(f"pickup                {pickup_each * 1000:10.1f} ms/booking  -> {pickup_each * args.bookings / 3600:8.1f} h")
+    print(f"memory                {memory_each / 1e6:10.1f} MB/booking  -> {memory_each * args.bookings / 1e12:8.1f} TB")
+
+
+if __name__ == "__main__":
+    main()
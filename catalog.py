@@ -0,0 +1,346 @@
+"""
+In-process catalog index behind /items/nearby.
+
+The catalog is fetched from the backend and turned into an immutable
+`CatalogIndex`: a token -> item positions inverted index with a sorted
+vocabulary for prefix search, items pre-sorted by price for range
+queries, positions grouped by store, and a grid index over store
+coordinates (`store_lat`/`store_lng`) for radius queries. A refresh
+builds a new index off to the side and swaps it in, so searches never
+see a half-built one.
+
+Each refresh that changes anything bumps the catalog version and records
+the item upserts and deletes in a bounded change log, so clients can
+sync with `changes_since(version)` instead of refetching everything.
+Versions are "<epoch>.<counter>"; the epoch is random per process, so a
+version from another worker or before a restart gets a full snapshot.
+Fetched from the shared cache tier instead (`VersionedItems`), the epoch
+and counter come from the shared snapshot and agree across workers.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+import asyncio
+import os
+import re
+import secrets
+import time
+
+from spatial_index import GridIndex, valid_coordinates
+
+TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+SORTS = ("relevance", "price_asc", "price_desc", "name")
+STORE_CELL_KM = 2.0
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class CatalogIndex:
+    def __init__(self, items: List[dict], version: str = ""):
+        self.items = items
+        self.version = version
+        self.postings: Dict[str, List[int]] = {}
+        for pos, item in enumerate(items):
+            for token in set(tokenize(item.get("name", ""))):
+                self.postings.setdefault(token, []).append(pos)
+        self.vocabulary = sorted(self.postings)
+
+        self.by_price = sorted(range(len(items)), key=lambda pos: items[pos].get("price", 0.0))
+        self.prices = [items[pos].get("price", 0.0) for pos in self.by_price]
+        self.by_store: Dict[str, List[int]] = {}
+        for pos, item in enumerate(items):
+            self.by_store.setdefault(item.get("store_name", "").lower(), []).append(pos)
+
+        # Store locations are static between refreshes; one grid build per refresh
+        self.store_locations = GridIndex(cell_km=STORE_CELL_KM)
+        for store, positions in self.by_store.items():
+            for pos in positions:
+                lat, lng = items[pos].get("store_lat"), items[pos].get("store_lng")
+                if lat is not None and lng is not None and valid_coordinates(lat, lng):
+                    self.store_locations.upsert(store, lat, lng, 0.0)
+                    break
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def stores(self) -> Dict[str, int]:
+        return {self.items[positions[0]]["store_name"]: len(positions)
+                for positions in self.by_store.values()}
+
+    def _matching(self, token: str) -> Set[int]:
+        """Positions of items with a name word starting with token."""
+        vocabulary = self.vocabulary
+        start = bisect_left(vocabulary, token)
+        end = bisect_left(vocabulary, token + "\uffff", start)
+        if end - start == 1:
+            return set(self.postings[vocabulary[start]])
+        matched: Set[int] = set()
+        for word in vocabulary[start:end]:
+            matched.update(self.postings[word])
+        return matched
+
+    def _price_range(self, min_price: Optional[float], max_price: Optional[float]) -> List[int]:
+        start = 0 if min_price is None else bisect_left(self.prices, min_price)
+        end = len(self.prices) if max_price is None else bisect_right(self.prices, max_price)
+        return self.by_price[start:end]
+
+    def search(self, query: Optional[str] = None, store: Optional[str] = None,
+               min_price: Optional[float] = None, max_price: Optional[float] = None,
+               sort: str = "relevance", limit: Optional[int] = None, offset: int = 0,
+               lat: Optional[float] = None, lng: Optional[float] = None,
+               radius_km: float = 5.0) -> List[dict]:
+        """
+        Items whose name words start with every query token, filtered and
+        sorted. With lat/lng, only items from stores within radius_km, as
+        copies carrying distance_km; "relevance" then means nearest store first.
+        """
+        tokens = tokenize(query) if query else []
+        candidates: Optional[Set[int]] = None
+        for token in sorted(tokens, key=lambda t: -len(t)):
+            # Longest tokens first: usually the most selective
+            matched = self._matching(token)
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return []
+
+        if store is not None:
+            in_store = self.by_store.get(store.lower(), [])
+            candidates = set(in_store) if candidates is None else candidates.intersection(in_store)
+
+        distances: Optional[Dict[str, float]] = None
+        if lat is not None and lng is not None:
+            distances = {key: d for d, key in self.store_locations.within(lat, lng, radius_km)}
+            in_range = set()
+            for key in distances:
+                in_range.update(self.by_store[key])
+            candidates = in_range if candidates is None else candidates & in_range
+
+        priced = min_price is not None or max_price is not None
+        if candidates is None:
+            # No text or store filter: the price index already gives the answer in order
+            positions = self._price_range(min_price, max_price)
+            if sort == "price_desc":
+                positions = positions[::-1]
+            elif sort != "price_asc":
+                positions = sorted(positions)
+        else:
+            if priced:
+                low = -float("inf") if min_price is None else min_price
+                high = float("inf") if max_price is None else max_price
+                candidates = {pos for pos in candidates if low <= self.items[pos].get("price", 0.0) <= high}
+            positions = self._order(candidates, tokens, sort)
+
+        if sort == "name":
+            positions = sorted(positions, key=lambda pos: self.items[pos].get("name", "").lower())
+        if distances is None:
+            end = None if limit is None else offset + limit
+            return [self.items[pos] for pos in positions[offset:end]]
+
+        def store_distance(pos: int) -> float:
+            return distances[self.items[pos].get("store_name", "").lower()]
+        if sort == "relevance":
+            # Stable: text relevance still orders items within one store
+            positions = sorted(positions, key=store_distance)
+        end = None if limit is None else offset + limit
+        return [dict(self.items[pos], distance_km=round(store_distance(pos), 3))
+                for pos in positions[offset:end]]
+
+    def _order(self, positions: Set[int], tokens: List[str], sort: str) -> List[int]:
+        items = self.items
+        if sort == "price_asc":
+            return sorted(positions, key=lambda pos: items[pos].get("price", 0.0))
+        if sort == "price_desc":
+            return sorted(positions, key=lambda pos: -items[pos].get("price", 0.0))
+        if sort == "relevance" and tokens:
+            wanted = set(tokens)
+
+            def score(pos: int):
+                words = tokenize(items[pos].get("name", ""))
+                exact = len(wanted.intersection(words))
+                starts = 1 if words and words[0].startswith(tokens[0]) else 0
+                return -exact, -starts, len(words), pos
+            return sorted(positions, key=score)
+        return sorted(positions)
+
+
+class VersionedItems(NamedTuple):
+    """Catalog items with a version assigned upstream (the shared cache tier)."""
+    items: List[dict]
+    epoch: str
+    counter: int
+
+
+class CatalogService:
+    """
+    Holds the current CatalogIndex and refreshes it from `fetch` every
+    `refresh_interval` seconds in the background (unless background_refresh
+    is off because something else, e.g. the prefetch scheduler, calls
+    refresh()). Requests only wait for the very first load; later ones are
+    served from the current index.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[Union[List[dict], VersionedItems]]],
+                 refresh_interval: Optional[float] = None,
+                 max_logged_changes: Optional[int] = None, background_refresh: bool = True):
+        self.fetch = fetch
+        self.background_refresh = background_refresh
+        self.refresh_interval = refresh_interval if refresh_interval is not None else float(
+            os.getenv("CATALOG_REFRESH_INTERVAL", "60"))
+        self.max_logged_changes = max_logged_changes if max_logged_changes is not None else int(
+            os.getenv("CATALOG_CHANGELOG_SIZE", "5000"))
+        self.index: Optional[CatalogIndex] = None
+        self.loaded_at = 0.0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._reset_versions()
+        self._loading: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _reset_versions(self):
+        self.epoch = secrets.token_hex(4)
+        self.counter = 0
+        # deque[(counter, {item_id: item dict, or None when deleted})]
+        self.changelog: deque = deque()
+        self.logged_changes = 0
+        # Changes after this counter are all still in the log
+        self.log_floor = 0
+
+    @property
+    def version(self) -> str:
+        return f"{self.epoch}.{self.counter}"
+
+    async def current(self) -> CatalogIndex:
+        if self.index is None:
+            loop = asyncio.get_running_loop()
+            loading = self._loading
+            if loading is None or loading.done() or loading.get_loop() is not loop:
+                # Concurrent first requests share one fetch
+                loading = self._loading = loop.create_task(self.refresh())
+            await loading
+        self._ensure_refresher()
+        return self.index
+
+    async def refresh(self):
+        fetched = await self.fetch()
+        previous = self.index
+        if isinstance(fetched, VersionedItems):
+            items, counter = fetched.items, fetched.counter
+            if fetched.epoch != self.epoch:
+                # A new shared history: nothing logged so far applies to it
+                self._reset_versions()
+                self.epoch = fetched.epoch
+                previous = None
+        else:
+            items, counter = fetched, None
+        if previous is None:
+            self.counter = self.counter + 1 if counter is None else counter
+            self.log_floor = self.counter
+        elif previous.items == items:
+            # Nothing changed: keep the old index (and its version)
+            self.loaded_at = time.time()
+            self.refreshes += 1
+            return
+        else:
+            # A pure reordering logs an empty change set but still gets a new version
+            self.counter = self.counter + 1 if counter is None else counter
+            self._log(self.counter, self._diff(previous.items, items))
+        self.index = CatalogIndex(items, self.version)
+        self.loaded_at = time.time()
+        self.refreshes += 1
+
+    @staticmethod
+    def _diff(old: List[dict], new: List[dict]) -> Dict[str, Optional[dict]]:
+        old_by_id = {item.get("id"): item for item in old}
+        changes: Dict[str, Optional[dict]] = {}
+        for item in new:
+            item_id = item.get("id")
+            if old_by_id.pop(item_id, None) != item:
+                changes[item_id] = item
+        for item_id in old_by_id:
+            changes[item_id] = None
+        return changes
+
+    def _log(self, counter: int, changes: Dict[str, Optional[dict]]):
+        self.changelog.append((counter, changes))
+        self.logged_changes += len(changes)
+        while self.logged_changes > self.max_logged_changes and self.changelog:
+            dropped, dropped_changes = self.changelog.popleft()
+            self.logged_changes -= len(dropped_changes)
+            self.log_floor = dropped
+
+    def changes_since(self, version: Optional[str]) -> Optional[Tuple[List[dict], List[str]]]:
+        """
+        (upserted items, deleted ids) since version, or None when the
+        client needs a full snapshot (unknown epoch, or log truncated).
+        """
+        epoch, _, counter = (version or "").partition(".")
+        if epoch != self.epoch or not counter.isdigit():
+            return None
+        since = int(counter)
+        if since == self.counter:
+            return [], []
+        if since < self.log_floor or since > self.counter:
+            return None
+        if since != self.log_floor and all(logged != since for logged, _ in self.changelog):
+            # A shared version this worker skipped over: its diffs would not add up
+            return None
+        merged: Dict[str, Optional[dict]] = {}
+        for logged, changes in self.changelog:
+            if logged > since:
+                merged.update(changes)
+        upserts = [item for item in merged.values() if item is not None]
+        deletes = [item_id for item_id, item in merged.items() if item is None]
+        return upserts, deletes
+
+    def load_snapshot(self, items: List[dict], taken_at: float):
+        """
+        Serve a bundled catalog until the first refresh. The refresh runs as
+        soon as a request starts the refresher if the snapshot is already
+        older than refresh_interval.
+        """
+        self._reset_versions()
+        self.counter = self.log_floor = 1
+        self.index = CatalogIndex(items, self.version)
+        self.loaded_at = taken_at
+
+    def clear(self):
+        self.index = None
+        self._reset_versions()
+
+    def _ensure_refresher(self):
+        if not self.background_refresh:
+            return
+        loop = asyncio.get_running_loop()
+        task = self._task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._task = loop.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        delay = self.loaded_at + self.refresh_interval - time.time()
+        while True:
+            await asyncio.sleep(max(delay, 0))
+            delay = self.refresh_interval
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep serving the previous index
+                self.refresh_errors += 1
+                print(f"Catalog refresh failed: {e}")
+
+    def stats(self) -> dict:
+        index = self.index
+        return {
+            "version": self.version,
+            "logged_changes": self.logged_changes,
+            "items": len(index) if index else 0,
+            "stores": len(index.by_store) if index else 0,
+            "located_stores": len(index.store_locations) if index else 0,
+            "tokens": len(index.vocabulary) if index else 0,
+            "loaded_at": self.loaded_at,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors
+        }
@@ -0,0 +1,105 @@
+"""
+Cold-start mode for serverless deployments (Vercel).
+
+A serverless instance imports the app for its first request, so anything
+main.py would otherwise set up lazily on that request is done at init
+instead:
+
+- the Apps Script HTTP client (building its TLS context takes ~40 ms)
+  and the ASGI middleware stack are created at import;
+- the catalog index is built from `catalog_snapshot.json`, written at
+  deploy time with `python coldstart.py snapshot`, so the first catalog
+  request does not wait for Apps Script; the live catalog replaces it
+  on the first background refresh;
+- on startup, connections to the Apps Script hosts are opened ahead of
+  the first upstream call (DNS + TLS), with HEAD requests that never
+  reach the script itself.
+
+COLD_START_MODE=1/0 forces it on or off; by default it is on when running
+on Vercel (the VERCEL environment variable is set).
+
+Usage:
+    python coldstart.py snapshot [--out catalog_snapshot.json]
+"""
+
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+DEFAULT_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog_snapshot.json")
+# Apps Script answers from a redirect on this host
+DEFAULT_PREWARM_URLS = "https://script.googleusercontent.com/"
+
+
+def enabled() -> bool:
+    mode = os.getenv("COLD_START_MODE", "auto").lower()
+    if mode == "auto":
+        return bool(os.getenv("VERCEL"))
+    return mode in ("1", "true", "yes")
+
+
+def snapshot_path() -> str:
+    return os.getenv("CATALOG_SNAPSHOT", DEFAULT_SNAPSHOT)
+
+
+def load_catalog_snapshot(path: Optional[str] = None) -> Optional[Tuple[List[dict], float]]:
+    """(items, taken_at) from a snapshot file, or None if there is no usable one."""
+    path = path or snapshot_path()
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+        return snapshot["items"], float(snapshot["taken_at"])
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Ignoring catalog snapshot {path}: {e}")
+        return None
+
+
+def write_catalog_snapshot(items: List[dict], path: Optional[str] = None):
+    path = path or snapshot_path()
+    with open(path, "w") as f:
+        json.dump({"taken_at": time.time(), "items": items}, f, separators=(",", ":"))
+
+
+def prewarm_urls(appscript_url: str) -> List[str]:
+    parts = urlsplit(appscript_url)
+    urls = [f"{parts.scheme}://{parts.netloc}/"]
+    extra = os.getenv("COLD_START_PREWARM_URLS", DEFAULT_PREWARM_URLS)
+    urls.extend(url.strip() for url in extra.split(",") if url.strip())
+    return urls
+
+
+async def prewarm(client: httpx.AsyncClient, urls: List[str]) -> float:
+    """Open pooled connections to each host; returns seconds spent. Failures are ignored."""
+    start = time.perf_counter()
+    for url in urls:
+        try:
+            await client.head(url, follow_redirects=False, timeout=5)
+        except httpx.HTTPError as e:
+            print(f"Prewarm of {url} failed: {e}")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start helpers for serverless deploys")
+    sub = parser.add_subparsers(dest="command", required=True)
+    snap = sub.add_parser("snapshot", help="fetch the catalog and write the bundled snapshot")
+    snap.add_argument("--out", default=None, help=f"output file (default {DEFAULT_SNAPSHOT})")
+    args = parser.parse_args()
+
+    from main import fetch_catalog
+
+    items = asyncio.run(fetch_catalog())
+    write_catalog_snapshot(items, args.out)
+    print(f"Wrote {len(items)} items to {args.out or snapshot_path()}")
+
+
+if __name__ == "__main__":
+    main()
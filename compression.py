@@ -0,0 +1,168 @@
+"""
+Response compression middleware (brotli or gzip).
+
+Small bodies are sent as-is: below `minimum_size` bytes the CPU cost
+outweighs the saved bytes. Single-body responses are compressed in one
+go. Streaming responses (SSE, NDJSON) are compressed chunk by chunk with
+a sync flush after every chunk, so each event reaches the client
+immediately instead of waiting in the compressor's buffer.
+
+When a response is compressed its ETag is marked weak, since the bytes
+differ from the identity encoding. If-None-Match uses weak comparison,
+so revalidation keeps working. Every response of a compressible type
+gets `Vary: Accept-Encoding`, compressed or not, so a cache never hands
+one client's encoding to another.
+"""
+
+from typing import Dict, Optional
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """{coding: quality} for every coding the client lists."""
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: Optional[int] = None, gzip_level: Optional[int] = None,
+                 brotli_quality: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else int(
+            os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+        self.gzip_level = gzip_level if gzip_level is not None else int(os.getenv("COMPRESSION_LEVEL", "6"))
+        self.brotli_quality = brotli_quality if brotli_quality is not None else int(
+            os.getenv("BROTLI_QUALITY", "4"))
+
+    def choose(self, accept_encoding: str) -> Optional[str]:
+        """Brotli when the client rates it at least as high as gzip, else gzip."""
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        gzip_q = accepted.get("gzip", wildcard)
+        br_q = accepted.get("br", wildcard) if brotli is not None else 0.0
+        if br_q > 0 and br_q >= gzip_q:
+            return "br"
+        return "gzip" if gzip_q > 0 else None
+
+    def compressor(self, coding: str):
+        return _Brotli(self.brotli_quality) if coding == "br" else _Gzip(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = self.choose(Headers(scope=scope).get("accept-encoding", ""))
+        await self.app(scope, receive, _CompressingSend(self, coding, send))
+
+
+class _CompressingSend:
+    """Wraps `send` for one response; decides on the first body chunk."""
+
+    def __init__(self, middleware: CompressionMiddleware, coding: Optional[str], send):
+        self.middleware = middleware
+        self.coding = coding
+        self.send = send
+        self.start = None
+        self.encoder = None
+        self.passthrough = False
+
+    def _compressible(self, headers: MutableHeaders) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _mark_encoded(self, headers: MutableHeaders):
+        headers["Content-Encoding"] = self.coding
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+
+    async def __call__(self, message):
+        if self.passthrough:
+            await self.send(message)
+            return
+        if message["type"] == "http.response.start":
+            message = dict(message, headers=list(message.get("headers", [])))
+            headers = MutableHeaders(raw=message["headers"])
+            if self._compressible(headers):
+                # Compressed or not, the body depends on Accept-Encoding
+                headers.add_vary_header("Accept-Encoding")
+            if self.coding is None:
+                self.passthrough = True
+                await self.send(message)
+                return
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            headers = MutableHeaders(raw=self.start["headers"])
+            if not self._compressible(headers) or (not more_body and len(body) < self.middleware.minimum_size):
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+
+            self.encoder = self.middleware.compressor(self.coding)
+            self._mark_encoded(headers)
+            if not more_body:
+                compressed = self.encoder.finish(body)
+                headers["Content-Length"] = str(len(compressed))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            # Streaming: length unknown up front
+            del headers["Content-Length"]
+            await self.send(self.start)
+
+        compressed = self.encoder.chunk(body) if more_body else self.encoder.finish(body)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
@@ -0,0 +1,380 @@
+"""
+Batch dispatch: assign pending orders to free delivery partners.
+
+Instead of broadcasting every order and letting the fastest partner win,
+the dispatcher collects pending orders and free partners over a short
+window, builds a cost for each (order, partner) pair from pickup
+distance and partner idle time, and solves the assignment:
+
+- exact Hungarian algorithm for small windows (dense matrix), or
+- sparse forward auction on each order's k nearest partners for large
+  windows.
+
+Each order is then offered to its chosen partner only. Offers that
+expire or are declined go back into the next window, and orders that
+cannot be placed are rebroadcast to everyone as before.
+"""
+
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+import asyncio
+import heapq
+import os
+import time
+
+from spatial_index import GridIndex
+
+INF = float("inf")
+
+
+# ------------------ Solvers ------------------
+
+
+def hungarian(cost: Sequence[Sequence[float]]) -> List[int]:
+    """
+    Minimum-cost assignment (shortest augmenting path with potentials,
+    O(n^2 m)). Rows are assigned to distinct columns; returns the column
+    for each row, or -1 when there are more rows than columns.
+    """
+    n = len(cost)
+    if n == 0:
+        return []
+    m = len(cost[0])
+    if n > m:
+        transposed = [[cost[i][j] for i in range(n)] for j in range(m)]
+        columns = hungarian(transposed)
+        result = [-1] * n
+        for j, i in enumerate(columns):
+            result[i] = j
+        return result
+
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)      # p[j]: row (1-based) matched to column j
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [INF] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            ui0 = u[i0]
+            delta = INF
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - ui0 - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+
+    result = [-1] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            result[p[j] - 1] = j - 1
+    return result
+
+
+def auction(candidates: Sequence[Sequence[Tuple[int, float]]], n_objects: int,
+            unassigned_cost: float, eps: float = 0.05) -> List[int]:
+    """
+    Sparse forward auction (Bertsekas) for the asymmetric assignment problem.
+
+    candidates[i] lists (object, cost) pairs bidder i may take. Every bidder
+    also has an "unassigned" option at unassigned_cost, which keeps the
+    auction finite when objects are scarce. Prices start at zero and are
+    not carried across epsilon phases: objects nobody bids on must keep a
+    zero price for the result to be optimal. Returns the object per bidder
+    or -1; the total cost is within n * eps of the optimum.
+    """
+    n = len(candidates)
+    prices = [0.0] * n_objects
+    owner = [-1] * n_objects
+    assignment = [-1] * n
+    dummy_value = -unassigned_cost
+    queue = deque(i for i in range(n) if candidates[i])
+    while queue:
+        i = queue.popleft()
+        best_j = -1
+        v1 = dummy_value
+        v2 = -INF
+        for j, c in candidates[i]:
+            value = -c - prices[j]
+            if value > v1:
+                v2 = v1
+                v1 = value
+                best_j = j
+            elif value > v2:
+                v2 = value
+        if best_j < 0:
+            continue
+        prices[best_j] += v1 - v2 + eps
+        previous = owner[best_j]
+        if previous >= 0:
+            assignment[previous] = -1
+            queue.append(previous)
+        owner[best_j] = i
+        assignment[i] = best_j
+    return assignment
+
+# ------------------ Cost model ------------------
+
+
+class DispatchConfig:
+    """Dispatch settings, overridable through environment variables."""
+
+    def __init__(self, **overrides):
+        env = os.getenv
+        self.enabled = overrides.get("enabled", env("DISPATCH_MODE", "broadcast") == "batch")
+        self.window = overrides.get("window", float(env("DISPATCH_WINDOW", "2")))
+        self.offer_timeout = overrides.get("offer_timeout", float(env("DISPATCH_OFFER_TIMEOUT", "15")))
+        self.max_offers = overrides.get("max_offers", int(env("DISPATCH_MAX_OFFERS", "3")))
+        self.max_wait = overrides.get("max_wait", float(env("DISPATCH_MAX_WAIT", "30")))
+        self.max_radius_km = overrides.get("max_radius_km", float(env("DISPATCH_MAX_RADIUS_KM", "10")))
+        self.candidates_per_order = overrides.get("candidates_per_order", int(env("DISPATCH_CANDIDATES", "16")))
+        self.dense_limit = overrides.get("dense_limit", int(env("DISPATCH_DENSE_LIMIT", "2500")))
+        # cost = km * distance_weight - idle_minutes * idle_weight (idle credit capped)
+        self.distance_weight = overrides.get("distance_weight", 1.0)
+        self.idle_weight = overrides.get("idle_weight", 0.05)
+        self.idle_cap_minutes = overrides.get("idle_cap_minutes", 30.0)
+        self.unknown_distance_km = overrides.get("unknown_distance_km", 5.0)
+
+    @property
+    def unassigned_cost(self) -> float:
+        # Any partner inside the radius beats leaving the order for the next window
+        return self.max_radius_km * self.distance_weight + 1.0
+
+
+def build_candidates(orders: Sequence[Tuple[Optional[float], Optional[float]]],
+                     partners: Sequence[Tuple[float, float]],
+                     idle_minutes: Sequence[float],
+                     config: DispatchConfig, eta=None) -> List[List[Tuple[int, float]]]:
+    """
+    Candidate (partner index, cost) lists for each order. With an EtaModel,
+    nearby partners are rescored by estimated travel time, expressed as the
+    straight-line km that take as long at the model's default speed (fixed
+    minutes and detour taken out), so weights and the radius keep their meaning.
+    """
+    grid = GridIndex(cell_km=max(config.max_radius_km / 4, 0.5))
+    for j, (lat, lng) in enumerate(partners):
+        grid.upsert(j, lat, lng, 0.0)
+    idle_credit = [min(m, config.idle_cap_minutes) * config.idle_weight for m in idle_minutes]
+    k = config.candidates_per_order
+    most_idle = heapq.nlargest(k, range(len(partners)), key=lambda j: idle_credit[j])
+
+    candidates = []
+    for lat, lng in orders:
+        if lat is None or lng is None:
+            distance = config.unknown_distance_km * config.distance_weight
+            candidates.append([(j, distance - idle_credit[j]) for j in most_idle])
+            continue
+        nearest = grid.nearest(lat, lng, k, config.max_radius_km)
+        if eta is not None and nearest:
+            minutes = eta.batch([(*partners[j], lat, lng) for _, j in nearest])
+            nearest = [(max(m - eta.fixed_minutes, 0.0) * eta.default_kmh / 60 / eta.detour, j)
+                       for m, (_, j) in zip(minutes, nearest)]
+        candidates.append([(j, d * config.distance_weight - idle_credit[j]) for d, j in nearest])
+    return candidates
+
+
+def solve(candidates: List[List[Tuple[int, float]]], n_partners: int, config: DispatchConfig) -> List[int]:
+    """Exact Hungarian for small windows, sparse auction otherwise."""
+    n = len(candidates)
+    if n == 0 or n_partners == 0:
+        return [-1] * n
+    if n * n_partners <= config.dense_limit:
+        blocked = config.unassigned_cost
+        # Extra "leave unassigned" columns make the dense problem rectangular-safe
+        matrix = []
+        for i, row in enumerate(candidates):
+            dense = [INF] * n_partners + [blocked] * n
+            for j, c in row:
+                dense[j] = c
+            matrix.append([c if c != INF else blocked * 10 for c in dense])
+        result = hungarian(matrix)
+        return [j if j < n_partners and matrix[i][j] < blocked else -1 for i, j in enumerate(result)]
+    return auction(candidates, n_partners, config.unassigned_cost)
+
+# ------------------ Dispatcher ------------------
+
+
+def plan_window(orders: Sequence[Tuple[Optional[float], Optional[float]]], declined: Sequence[Set[str]],
+                partner_ids: Sequence[str], partners: Sequence[Tuple[float, float]],
+                idle_minutes: Sequence[float], config: DispatchConfig, eta=None) -> List[int]:
+    """Partner index (or -1) per order for one window, skipping partners who declined it."""
+    candidates = build_candidates(orders, partners, idle_minutes, config, eta)
+    for skip, row in zip(declined, candidates):
+        if skip:
+            row[:] = [(j, c) for j, c in row if partner_ids[j] not in skip]
+    return solve(candidates, len(partner_ids), config)
+
+
+class Dispatcher:
+    """
+    Holds orders waiting for assignment and live offers. Network side
+    effects are injected: send_offer(partner_id, order, timeout) returns
+    whether the partner could be reached, rebroadcast(order) falls back to
+    the broadcast-to-everyone path.
+    """
+
+    def __init__(self, config: DispatchConfig,
+                 send_offer: Callable[[str, dict, float], Awaitable[bool]],
+                 rebroadcast: Callable[[dict], Awaitable[None]],
+                 partner_positions: Callable[[], Dict[str, Tuple[float, float]]],
+                 eta=None):
+        self.config = config
+        self.eta = eta
+        self.send_offer = send_offer
+        self.rebroadcast = rebroadcast
+        self.partner_positions = partner_positions
+        self.pending: Dict[str, dict] = {}     # {order_id: {order, lat, lng, submitted_at, declined, offers}}
+        self.offers: Dict[str, dict] = {}      # {order_id: {partner_id, deadline, entry}}
+        self.busy: Set[str] = set()
+        self.idle_since: Dict[str, float] = {}
+        self.stats = {"windows": 0, "offers": 0, "accepted": 0, "expired": 0,
+                      "declined": 0, "rebroadcast": 0, "last_solve_ms": 0.0}
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, order: dict, lat: Optional[float] = None, lng: Optional[float] = None):
+        self.pending[order["id"]] = {
+            "order": order, "lat": lat, "lng": lng,
+            "submitted_at": time.monotonic(), "declined": set(), "offers": 0
+        }
+        self._ensure_running()
+
+    def offered_to(self, order_id: str) -> Optional[str]:
+        offer = self.offers.get(order_id)
+        return offer["partner_id"] if offer else None
+
+    def on_accepted(self, order_id: str, partner_id: str):
+        if self.offers.pop(order_id, None) is not None:
+            self.stats["accepted"] += 1
+        self.pending.pop(order_id, None)
+        self.busy.add(partner_id)
+
+    def on_declined(self, order_id: str, partner_id: str):
+        offer = self.offers.get(order_id)
+        if offer is None or offer["partner_id"] != partner_id:
+            return
+        self.stats["declined"] += 1
+        self._requeue(order_id, offer)
+
+    def partner_free(self, partner_id: str):
+        self.busy.discard(partner_id)
+        self.idle_since[partner_id] = time.monotonic()
+
+    def _requeue(self, order_id: str, offer: dict):
+        del self.offers[order_id]
+        entry = offer["entry"]
+        entry["declined"].add(offer["partner_id"])
+        self.pending[order_id] = entry
+
+    def _free_partners(self, now: float) -> Tuple[List[str], List[Tuple[float, float]], List[float]]:
+        offered = {offer["partner_id"] for offer in self.offers.values()}
+        ids, points, idle = [], [], []
+        for partner_id, position in self.partner_positions().items():
+            if partner_id in self.busy or partner_id in offered:
+                continue
+            ids.append(partner_id)
+            points.append(position)
+            idle.append((now - self.idle_since.setdefault(partner_id, now)) / 60.0)
+        return ids, points, idle
+
+    async def run_window(self):
+        """Expire offers, solve the current window and send offers."""
+        now = time.monotonic()
+        self.stats["windows"] += 1
+        for order_id, offer in list(self.offers.items()):
+            if offer["deadline"] <= now:
+                self.stats["expired"] += 1
+                self._requeue(order_id, offer)
+
+        fallback = [
+            order_id for order_id, entry in self.pending.items()
+            if entry["offers"] >= self.config.max_offers
+            or now - entry["submitted_at"] >= self.config.max_wait
+        ]
+        for order_id in fallback:
+            entry = self.pending.pop(order_id)
+            self.stats["rebroadcast"] += 1
+            await self.rebroadcast(entry["order"])
+
+        if not self.pending:
+            return
+        partner_ids, points, idle = self._free_partners(now)
+        order_ids = list(self.pending)
+        entries = [self.pending[order_id] for order_id in order_ids]
+
+        # Large windows take seconds to solve: do it off the event loop, on copies
+        start = time.perf_counter()
+        assignment = await asyncio.to_thread(
+            plan_window, [(e["lat"], e["lng"]) for e in entries], [set(e["declined"]) for e in entries],
+            partner_ids, points, idle, self.config, self.eta)
+        self.stats["last_solve_ms"] = (time.perf_counter() - start) * 1000
+
+        now = time.monotonic()
+        offered = {offer["partner_id"] for offer in self.offers.values()}
+        for order_id, entry, j in zip(order_ids, entries, assignment):
+            if j < 0:
+                continue
+            partner_id = partner_ids[j]
+            # Accepts and declines may have arrived while solving
+            if self.pending.get(order_id) is not entry or partner_id in self.busy \
+                    or partner_id in offered or partner_id in entry["declined"]:
+                continue
+            offered.add(partner_id)
+            del self.pending[order_id]
+            entry["offers"] += 1
+            self.offers[order_id] = {
+                "partner_id": partner_id,
+                "deadline": now + self.config.offer_timeout,
+                "entry": entry
+            }
+            self.stats["offers"] += 1
+            if not await self.send_offer(partner_id, entry["order"], self.config.offer_timeout):
+                if order_id in self.offers:
+                    self._requeue(order_id, self.offers[order_id])
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        task = self._task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._task = loop.create_task(self._loop())
+
+    async def _loop(self):
+        while self.pending or self.offers:
+            await asyncio.sleep(self.config.window)
+            try:
+                await self.run_window()
+            except Exception as e:
+                print(f"Dispatch window failed: {e}")
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.config.enabled,
+            "pending": len(self.pending),
+            "offers": len(self.offers),
+            "busy_partners": len(self.busy),
+            **self.stats
+        }
@@ -0,0 +1,290 @@
+"""
+Delivery ETA estimates from cached grid-cell travel times.
+
+Coordinates are snapped to the same lat/lng grid as the spatial index.
+Travel time between two cells is road distance (haversine times a detour
+factor) over a speed looked up for that cell pair, its origin cell, or the
+default. Speeds can be loaded from an offline JSON table and are refined
+from completed deliveries (accept -> store -> OTP verify, leg by leg). Results are cached per
+cell pair and invalidated per origin cell when its speed changes, so a
+lookup on every location tick is two floor divisions and a dict hit.
+
+Speed table format (also written by `save_table`):
+
+    {"cell_km": 0.5, "default_kmh": 20,
+     "cells": {"<x>,<y>": kmh, ...},
+     "pairs": {"<x>,<y>|<x>,<y>": kmh, ...}}
+"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import json
+import math
+import os
+import time
+
+from spatial_index import KM_PER_DEGREE, haversine_km
+
+Cell = Tuple[int, int]
+
+
+def _cell_name(cell: Cell) -> str:
+    return f"{cell[0]},{cell[1]}"
+
+
+def _parse_cell(name: str) -> Cell:
+    x, y = name.split(",")
+    return int(x), int(y)
+
+
+class EtaModel:
+    def __init__(self, cell_km: float = 0.5, default_kmh: float = 20.0, detour: float = 1.3,
+                 fixed_minutes: float = 2.0, cache_size: int = 200_000, learn_rate: float = 0.2):
+        self.cell_km = cell_km
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self.default_kmh = default_kmh
+        # Road distance is longer than the great-circle distance
+        self.detour = detour
+        # Parking, handover and stairs, independent of distance
+        self.fixed_minutes = fixed_minutes
+        self.cache_size = cache_size
+        self.learn_rate = learn_rate
+        self.cell_speeds: Dict[Cell, float] = {}
+        self.pair_speeds: Dict[Tuple[Cell, Cell], float] = {}
+        # {(from_cell, to_cell): (minutes, origin cell version)}
+        self.cache: Dict[Tuple[Cell, Cell], Tuple[float, int]] = {}
+        self.versions: Dict[Cell, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.observed = 0
+
+    @classmethod
+    def from_env(cls) -> "EtaModel":
+        model = cls(cell_km=float(os.getenv("ETA_CELL_KM", "0.5")),
+                    default_kmh=float(os.getenv("ETA_DEFAULT_SPEED_KMH", "20")),
+                    detour=float(os.getenv("ETA_DETOUR_FACTOR", "1.3")),
+                    fixed_minutes=float(os.getenv("ETA_FIXED_MINUTES", "2")))
+        table = os.getenv("ETA_SPEED_TABLE")
+        if table and os.path.exists(table):
+            model.load_table(table)
+        return model
+
+    def cell(self, lat: float, lng: float) -> Cell:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def _center(self, cell: Cell) -> Tuple[float, float]:
+        return (cell[0] + 0.5) * self.cell_deg, (cell[1] + 0.5) * self.cell_deg
+
+    def speed_kmh(self, origin: Cell, dest: Cell) -> float:
+        speed = self.pair_speeds.get((origin, dest))
+        if speed is None:
+            speed = self.cell_speeds.get(origin, self.default_kmh)
+        return speed
+
+    def _travel_minutes(self, distance_km: float, origin: Cell, dest: Cell) -> float:
+        return self.fixed_minutes + 60 * distance_km * self.detour / self.speed_kmh(origin, dest)
+
+    # ------------------ Queries ------------------
+
+    def minutes(self, lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+        """Estimated travel time in minutes from point 1 to point 2."""
+        deg = self.cell_deg
+        origin = (int(math.floor(lat1 / deg)), int(math.floor(lng1 / deg)))
+        dest = (int(math.floor(lat2 / deg)), int(math.floor(lng2 / deg)))
+        if abs(origin[0] - dest[0]) <= 1 and abs(origin[1] - dest[1]) <= 1:
+            # Cell centres are too coarse for short hops; measure directly
+            return self._travel_minutes(haversine_km(lat1, lng1, lat2, lng2), origin, dest)
+
+        key = (origin, dest)
+        entry = self.cache.get(key)
+        version = self.versions.get(origin, 0)
+        if entry is not None and entry[1] == version:
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        minutes = self._travel_minutes(haversine_km(*self._center(origin), *self._center(dest)), origin, dest)
+        if entry is None and len(self.cache) >= self.cache_size:
+            # pop: dispatch windows also read through this cache from a worker thread
+            self.cache.pop(next(iter(self.cache)), None)
+        self.cache[key] = (minutes, version)
+        return minutes
+
+    def batch(self, pairs: Iterable[Tuple[float, float, float, float]]) -> List[float]:
+        """Minutes for many (lat1, lng1, lat2, lng2) pairs, e.g. dispatch candidates."""
+        minutes = self.minutes
+        return [minutes(lat1, lng1, lat2, lng2) for lat1, lng1, lat2, lng2 in pairs]
+
+    def warm(self, origins: Sequence[Tuple[float, float]], destinations: Sequence[Tuple[float, float]]):
+        """Precompute every origin -> destination cell pair (e.g. stores to service area)."""
+        for lat1, lng1 in origins:
+            for lat2, lng2 in destinations:
+                self.minutes(lat1, lng1, lat2, lng2)
+
+    # ------------------ Learning ------------------
+
+    def observe(self, start: Tuple[float, float], end: Tuple[float, float], elapsed_seconds: float) -> bool:
+        """Fold one completed trip into the speed estimates; False if implausible."""
+        distance = haversine_km(start[0], start[1], end[0], end[1]) * self.detour
+        travel_hours = (elapsed_seconds / 60 - self.fixed_minutes) / 60
+        if distance < 0.2 or travel_hours <= 0:
+            return False
+        speed = distance / travel_hours
+        if not 3 <= speed <= 80:
+            return False
+
+        origin, dest = self.cell(*start), self.cell(*end)
+        rate = self.learn_rate
+        self.pair_speeds[(origin, dest)] = (1 - rate) * self.pair_speeds.get(
+            (origin, dest), self.speed_kmh(origin, dest)) + rate * speed
+        self.cell_speeds[origin] = (1 - rate) * self.cell_speeds.get(origin, self.default_kmh) + rate * speed
+        self.versions[origin] = self.versions.get(origin, 0) + 1
+        self.observed += 1
+        return True
+
+    # ------------------ Speed table ------------------
+
+    def load_table(self, path: str):
+        with open(path) as f:
+            table = json.load(f)
+        self.cell_km = table.get("cell_km", self.cell_km)
+        self.cell_deg = self.cell_km / KM_PER_DEGREE
+        self.default_kmh = table.get("default_kmh", self.default_kmh)
+        self.cell_speeds = {_parse_cell(name): kmh for name, kmh in table.get("cells", {}).items()}
+        self.pair_speeds = {}
+        for name, kmh in table.get("pairs", {}).items():
+            origin, dest = name.split("|")
+            self.pair_speeds[(_parse_cell(origin), _parse_cell(dest))] = kmh
+        self.cache.clear()
+        print(f"Loaded ETA speed table {path}: {len(self.cell_speeds)} cells, {len(self.pair_speeds)} pairs")
+
+    def save_table(self, path: str):
+        table = {
+            "cell_km": self.cell_km,
+            "default_kmh": self.default_kmh,
+            "cells": {_cell_name(cell): round(kmh, 2) for cell, kmh in self.cell_speeds.items()},
+            "pairs": {f"{_cell_name(o)}|{_cell_name(d)}": round(kmh, 2)
+                      for (o, d), kmh in self.pair_speeds.items()}
+        }
+        with open(path, "w") as f:
+            json.dump(table, f)
+
+    def stats(self) -> dict:
+        return {
+            "cached_pairs": len(self.cache),
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "learned_cells": len(self.cell_speeds),
+            "learned_pairs": len(self.pair_speeds),
+            "trips_observed": self.observed
+        }
+
+
+class DeliveryTracker:
+    """
+    Pickup and drop-off points of recent orders and start fixes of accepted
+    ones, so ETAs can be answered per order and completed trips fed back to
+    the model. Until the partner has been at the store the ETA is
+    partner -> store -> drop-off; fixes (`located`, called for every fix
+    received) within `pickup_radius_km` of the store mark the handover,
+    and each leg is learned over its own time (the wait at the store
+    excluded). ETA queries only read this state.
+    """
+
+    def __init__(self, model: EtaModel, max_orders: int = 10_000, pickup_radius_km: float = 0.15):
+        self.model = model
+        self.max_orders = max_orders
+        self.pickup_radius_km = pickup_radius_km
+        self.destinations: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.pickups: Dict[str, Tuple[float, float]] = {}
+        # {order_id: (accepted_at, partner_id, partner start fix or None)}
+        self.active: Dict[str, Tuple[float, str, Optional[Tuple[float, float]]]] = {}
+        # {order_id: [first, last] time the partner was seen at the store}
+        self.at_store: Dict[str, List[float]] = {}
+        self.by_partner: Dict[str, Set[str]] = {}
+
+    def created(self, order_id: str, lat: Optional[float], lng: Optional[float],
+                pickup_lat: Optional[float] = None, pickup_lng: Optional[float] = None):
+        if lat is None or lng is None:
+            return
+        self.destinations[order_id] = (lat, lng)
+        if pickup_lat is not None and pickup_lng is not None:
+            self.pickups[order_id] = (pickup_lat, pickup_lng)
+        while len(self.destinations) > self.max_orders:
+            stale, _ = self.destinations.popitem(last=False)
+            self._forget(stale)
+
+    def _forget(self, order_id: str):
+        self.pickups.pop(order_id, None)
+        self.at_store.pop(order_id, None)
+        self._unassign(order_id)
+
+    def _unassign(self, order_id: str):
+        accepted = self.active.pop(order_id, None)
+        if accepted is not None:
+            orders = self.by_partner.get(accepted[1])
+            if orders is not None:
+                orders.discard(order_id)
+                if not orders:
+                    del self.by_partner[accepted[1]]
+
+    def accepted(self, order_id: str, partner_id: str, start: Optional[Tuple[float, float]],
+                 now: Optional[float] = None):
+        if order_id in self.destinations:
+            now = time.time() if now is None else now
+            self._unassign(order_id)
+            self.active[order_id] = (now, partner_id, start)
+            self.by_partner.setdefault(partner_id, set()).add(order_id)
+            self._track(order_id, start, now)
+
+    def partner_of(self, order_id: str) -> Optional[str]:
+        accepted = self.active.get(order_id)
+        return accepted[1] if accepted else None
+
+    def located(self, partner_id: str, position: Tuple[float, float], now: Optional[float] = None):
+        """A fix from `partner_id` taken at `now`: note it for the orders they are delivering."""
+        order_ids = self.by_partner.get(partner_id)
+        if order_ids:
+            now = time.time() if now is None else now
+            for order_id in order_ids:
+                self._track(order_id, position, now)
+
+    def _track(self, order_id: str, position: Optional[Tuple[float, float]], now: float):
+        """Note fixes at the store; the last one is when the partner left with the order."""
+        pickup = self.pickups.get(order_id)
+        if pickup is None or position is None or order_id not in self.active:
+            return
+        if haversine_km(position[0], position[1], pickup[0], pickup[1]) <= self.pickup_radius_km:
+            seen = self.at_store.setdefault(order_id, [now, now])
+            seen[1] = now
+
+    def eta_minutes(self, order_id: str, position: Optional[Tuple[float, float]]) -> Optional[float]:
+        destination = self.destinations.get(order_id)
+        if destination is None or position is None:
+            return None
+        pickup = self.pickups.get(order_id)
+        if pickup is not None and order_id not in self.at_store:
+            # Not collected yet: go via the store
+            return (self.model.minutes(position[0], position[1], pickup[0], pickup[1])
+                    + self.model.minutes(pickup[0], pickup[1], destination[0], destination[1]))
+        return self.model.minutes(position[0], position[1], destination[0], destination[1])
+
+    def completed(self, order_id: str, now: Optional[float] = None) -> bool:
+        """Learn from the legs travelled between accept and verify; True if any was used."""
+        destination = self.destinations.pop(order_id, None)
+        pickup = self.pickups.get(order_id)
+        accepted = self.active.get(order_id)
+        seen = self.at_store.get(order_id)
+        self._forget(order_id)
+        if destination is None or accepted is None:
+            return False
+        now = time.time() if now is None else now
+        accepted_at, _, start = accepted
+        if pickup is None:
+            return start is not None and self.model.observe(start, destination, now - accepted_at)
+        if seen is None:
+            return False   # never seen at the store: the time cannot be split into legs
+        arrived_at, left_at = seen
+        to_store = start is not None and self.model.observe(start, pickup, arrived_at - accepted_at)
+        to_customer = self.model.observe(pickup, destination, now - left_at)
+        return to_store or to_customer
@@ -0,0 +1,93 @@
+"""
+Sequenced, bounded per-user notification log.
+
+Every notification gets the next sequence number for its user and is
+kept (already JSON encoded) in a small ring buffer, so a client that
+reconnects with the last sequence it saw can be sent only what it
+missed. Memory is bounded per user and globally; when the global cap is
+hit, the oldest events of the least recently active users go first.
+A user whose buffer empties that way is forgotten; if it comes back, its
+sequence continues above every number already handed out, so a client
+still holding an old one is sent to resync rather than replayed a
+partial gap.
+"""
+
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+import json
+
+
+class EventLog:
+    def __init__(self, capacity_per_user: int = 128, max_events: int = 100_000):
+        self.capacity_per_user = capacity_per_user
+        self.max_events = max_events
+        # {key: deque[(seq, frame)]}, least recently appended first
+        self.buffers: "OrderedDict[str, deque]" = OrderedDict()
+        self.last_seq: Dict[str, int] = {}
+        # Highest sequence number of any forgotten key; new keys continue from it
+        self.retired_seq = 0
+        self.total = 0
+        self.evicted = 0
+
+    def latest(self, key: str) -> int:
+        return self.last_seq.get(key, self.retired_seq)
+
+    def append(self, key: str, event: dict) -> str:
+        """Assign the next sequence number and return the encoded frame."""
+        seq = self.latest(key) + 1
+        self.last_seq[key] = seq
+        frame = json.dumps(dict(event, seq=seq))
+
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = deque()
+        else:
+            self.buffers.move_to_end(key)
+        if len(buffer) >= self.capacity_per_user:
+            buffer.popleft()
+            self.total -= 1
+            self.evicted += 1
+        buffer.append((seq, frame))
+        self.total += 1
+
+        while self.total > self.max_events:
+            self._evict_oldest()
+        return frame
+
+    def _evict_oldest(self):
+        key, buffer = next(iter(self.buffers.items()))
+        buffer.popleft()
+        self.total -= 1
+        self.evicted += 1
+        if not buffer:
+            # Forget the key; its numbers are never reused, so since() sends a
+            # client holding one of them to resync
+            del self.buffers[key]
+            self.retired_seq = max(self.retired_seq, self.last_seq.pop(key))
+
+    def since(self, key: str, last_seq: int) -> Optional[List[Tuple[int, str]]]:
+        """
+        Events after last_seq, oldest first. None means the client cannot
+        be caught up (events were evicted, or the sequence is from before
+        a restart) and has to resync its state over HTTP.
+        """
+        latest = self.latest(key)
+        if last_seq == latest:
+            return []
+        if last_seq > latest:
+            return None
+        buffer = self.buffers.get(key)
+        if not buffer or buffer[0][0] > last_seq + 1:
+            return None
+        # Sequence numbers in a buffer are contiguous, so index directly
+        return list(islice(buffer, last_seq + 1 - buffer[0][0], None))
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.buffers),
+            "events": self.total,
+            "evicted": self.evicted,
+            "capacity_per_user": self.capacity_per_user,
+            "max_events": self.max_events
+        }
@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Google Apps Script deployment.
+
+Implements every `path` action that main.py calls and keeps its state in
+in-memory "sheets" (Users, OTPS, Orders, Transactions, Items), so the
+backend can be benchmarked, profiled and debugged without the network.
+
+Upstream behaviour can be shaped to reproduce slow or flaky incidents:
+
+    python fake_appscript.py --latency lognormal:800,0.6 --error-rate 0.02
+    python fake_appscript.py --latency fixed:50 --path-latency get_available_orders=uniform:500,3000
+    python fake_appscript.py --timeout-rate 0.01 --timeout-seconds 35
+
+Real traffic can be captured and played back later:
+
+    python fake_appscript.py --record captures.jsonl --upstream https://script.google.com/macros/s/.../exec
+    python fake_appscript.py --replay captures.jsonl
+
+Point the backend at it with APP_SCRIPT_URL=http://127.0.0.1:9000/exec.
+"""
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+
+import httpx
+
+DEFAULT_ITEMS = [
+    {
+        "id": "1",
+        "name": "Carrot",
+        "price": 10.0,
+        "store_name": "Local Grocery",
+        "store_lat": 13.0827,
+        "store_lng": 80.2707,
+        "image_url": "https://via.placeholder.com/150?text=Carrot"
+    },
+    {
+        "id": "2",
+        "name": "Aspirin",
+        "price": 50.0,
+        "store_name": "Pharmacy",
+        "store_lat": 13.0604,
+        "store_lng": 80.2496,
+        "image_url": "https://via.placeholder.com/150?text=Aspirin"
+    },
+    {
+        "id": "3",
+        "name": "Banana",
+        "price": 5.0,
+        "store_name": "Fruit Market",
+        "store_lat": 13.0878,
+        "store_lng": 80.2785,
+        "image_url": "https://via.placeholder.com/150?text=Banana"
+    },
+]
+
+
+class FakeSheets:
+    """In-memory copy of the spreadsheet tabs the Apps Script reads and writes."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.users: Dict[str, Dict] = {}         # {phone: {userId, phone, role, location}}
+        self.otps: Dict[str, str] = {}           # {phone: otp}
+        self.orders: Dict[str, Dict] = {}        # {orderId: order row}
+        self.transactions: List[Dict] = []
+        self.items: List[Dict] = [dict(item) for item in DEFAULT_ITEMS]
+
+    # ------------------ Actions ------------------
+
+    def send_otp(self, payload: dict) -> dict:
+        phone = payload.get("phone")
+        role = payload.get("role")
+        if role not in ("customer", "delivery", "admin"):
+            return {"success": False, "message": "Invalid role provided"}
+
+        user = self.users.get(phone)
+        if user is None:
+            user = {
+                "userId": str(uuid.uuid4()),
+                "phone": phone,
+                "role": role,
+                "location": payload.get("location")
+            }
+            self.users[phone] = user
+
+        otp = str(random.randint(1000, 9999))
+        self.otps[phone] = otp
+        return {"success": True, "userId": user["userId"], "otp": otp}
+
+    def verify_otp(self, payload: dict) -> dict:
+        phone = payload.get("phone")
+        stored = self.otps.get(phone)
+        if stored is None or str(payload.get("otp")) != stored:
+            return {"success": False, "message": "Invalid OTP or user not found"}
+
+        del self.otps[phone]
+        user = self.users[phone]
+        return {"success": True, "role": user["role"], "userId": user["userId"]}
+
+    def register_user(self, payload: dict) -> dict:
+        phone = payload.get("phone")
+        user = self.users.get(phone)
+        if user is not None:
+            user.update({"role": payload.get("role"), "location": payload.get("location")})
+            return {"success": True, "message": "User updated successfully", "user_id": user["userId"]}
+
+        user = {
+            "userId": str(uuid.uuid4()),
+            "phone": phone,
+            "role": payload.get("role"),
+            "location": payload.get("location")
+        }
+        self.users[phone] = user
+        return {
+            "success": True,
+            "message": f"User registered successfully with user_id {user['userId']}",
+            "user_id": user["userId"]
+        }
+
+    def create_order(self, payload: dict) -> dict:
+        order_id = str(uuid.uuid4())
+        self.orders[order_id] = {
+            "id": order_id,
+            "customerId": payload.get("customerId"),
+            "phone": payload.get("phone"),
+            "items": payload.get("items", []),
+            "totalAmount": payload.get("totalAmount", 0),
+            "status": "Pending",
+            "assignedPartnerId": None,
+            "otp": None
+        }
+        return {"success": True, "orderId": order_id}
+
+    def create_orders(self, payload: dict) -> dict:
+        """Batched create_order: one result per order, in request order."""
+        results = []
+        for order in payload.get("orders", []):
+            if not order.get("customerId") or not order.get("items"):
+                results.append({"success": False, "message": "Missing customerId or items"})
+            else:
+                results.append(self.create_order(order))
+        return {"success": True, "results": results}
+
+    def get_available_orders(self, payload: dict) -> dict:
+        return {
+            "orders": [order for order in self.orders.values() if order["status"] == "Pending"]
+        }
+
+    def assign_order(self, payload: dict) -> dict:
+        order = self.orders.get(payload.get("orderId"))
+        if order is None:
+            return {"success": False, "message": "Order not found"}
+        if order["status"] != "Pending":
+            return {"success": False, "message": "Order not available for acceptance"}
+
+        order["status"] = "Accepted"
+        order["assignedPartnerId"] = payload.get("partnerId")
+        order["otp"] = str(random.randint(1000, 9999))
+        return {
+            "success": True,
+            "customerId": order["customerId"],
+            "items": order["items"],
+            "totalAmount": order["totalAmount"],
+            "otp": order["otp"]
+        }
+
+    def close_order(self, payload: dict) -> dict:
+        order = self.orders.get(payload.get("orderId"))
+        if order is None:
+            return {"success": False, "message": "Order not found"}
+        if order["status"] != "Accepted":
+            return {"success": False, "message": "Order not in a verifiable state"}
+        if str(payload.get("otp")) != order["otp"]:
+            return {"success": False, "message": "Invalid OTP provided"}
+
+        order["status"] = "Delivered"
+        total = order["totalAmount"]
+        if total <= 100:
+            reward = total * 0.20
+        elif total <= 500:
+            reward = total * 0.15
+        else:
+            reward = total * 0.10
+        transaction = {
+            "order_id": order["id"],
+            "customer_id": order["customerId"],
+            "delivery_partner_id": order["assignedPartnerId"],
+            "order_total": total,
+            "reward_bonus": reward,
+            "partner_commission": total * 0.02,
+            "platform_commission": total * 0.08
+        }
+        self.transactions.append(transaction)
+        return {
+            "success": True,
+            "customerId": transaction["customer_id"],
+            "deliveryPartnerId": transaction["delivery_partner_id"],
+            "orderTotal": transaction["order_total"],
+            "rewardBonus": transaction["reward_bonus"],
+            "partnerCommission": transaction["partner_commission"],
+            "platformCommission": transaction["platform_commission"]
+        }
+
+    def get_order_details(self, payload: dict) -> dict:
+        order = self.orders.get(payload.get("orderId"))
+        if order is None:
+            return {"success": False, "message": "Order not found"}
+        return order
+
+    def get_orders_details(self, payload: dict) -> dict:
+        """Batched get_order_details; unknown ids are left out."""
+        orders = [self.orders[order_id] for order_id in payload.get("orderIds", []) if order_id in self.orders]
+        return {"success": True, "orders": orders}
+
+    def get_nearby_items(self, payload: dict) -> dict:
+        return {"items": self.items}
+
+    def check_partner_status(self, payload: dict) -> dict:
+        partner_id = payload.get("deliveryPartnerId")
+        for order in self.orders.values():
+            if order["assignedPartnerId"] == partner_id and order["status"] == "Accepted":
+                return {"status": "busy", "order_id": order["id"]}
+        return {"status": "free"}
+
+    def get_blockchain_transactions(self, payload: dict) -> dict:
+        return {"transactions": self.transactions}
+
+    def handle(self, path: Optional[str], payload: dict) -> dict:
+        action = ACTIONS.get(path or "")
+        if action is None:
+            return {"success": False, "message": f"Unknown path: {path}"}
+        return action(self, payload)
+
+
+ACTIONS = {
+    "send_otp": FakeSheets.send_otp,
+    "verify_otp": FakeSheets.verify_otp,
+    "register_user": FakeSheets.register_user,
+    "create_order": FakeSheets.create_order,
+    "create_orders": FakeSheets.create_orders,
+    "get_available_orders": FakeSheets.get_available_orders,
+    "assign_order": FakeSheets.assign_order,
+    "close_order": FakeSheets.close_order,
+    "get_order_details": FakeSheets.get_order_details,
+    "get_orders_details": FakeSheets.get_orders_details,
+    "get_nearby_items": FakeSheets.get_nearby_items,
+    "check_partner_status": FakeSheets.check_partner_status,
+    "get_blockchain_transactions": FakeSheets.get_blockchain_transactions,
+}
+
+# ------------------ Latency and faults ------------------
+
+
+class LatencyModel:
+    """
+    Samples upstream latency in milliseconds from a spec string:
+      fixed:MS | uniform:LOW,HIGH | normal:MEAN,STDDEV |
+      lognormal:MEDIAN,SIGMA | pareto:SCALE,ALPHA
+    """
+
+    def __init__(self, spec: str = "fixed:0", rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, args = spec.partition(":")
+        self.kind = kind.strip()
+        self.args = [float(a) for a in args.split(",") if a.strip()]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "pareto": 2}
+        if self.kind not in expected or len(self.args) != expected[self.kind]:
+            raise ValueError(f"Invalid latency spec '{spec}'")
+
+    def sample(self) -> float:
+        a = self.args
+        if self.kind == "fixed":
+            value = a[0]
+        elif self.kind == "uniform":
+            value = self.rng.uniform(a[0], a[1])
+        elif self.kind == "normal":
+            value = self.rng.gauss(a[0], a[1])
+        elif self.kind == "lognormal":
+            value = self.rng.lognormvariate(math.log(a[0]), a[1])
+        else:
+            value = a[0] * self.rng.paretovariate(a[1])
+        return max(value, 0.0)
+
+
+class FaultConfig:
+    """Latency, error and timeout injection, globally or per path."""
+
+    def __init__(self, latency: str = "fixed:0", error_rate: float = 0.0,
+                 error_status: int = 500, timeout_rate: float = 0.0,
+                 timeout_seconds: float = 35.0, path_latency: Optional[Dict[str, str]] = None,
+                 seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self.latency = LatencyModel(latency, self.rng)
+        self.path_latency = {
+            path: LatencyModel(spec, self.rng) for path, spec in (path_latency or {}).items()
+        }
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+
+    def describe(self) -> dict:
+        return {
+            "latency": self.latency.spec,
+            "path_latency": {path: model.spec for path, model in self.path_latency.items()},
+            "error_rate": self.error_rate,
+            "error_status": self.error_status,
+            "timeout_rate": self.timeout_rate,
+            "timeout_seconds": self.timeout_seconds,
+        }
+
+    async def apply(self, path: Optional[str]) -> Optional[JSONResponse]:
+        """Sleep for the sampled latency; return an error response if one is injected."""
+        model = self.path_latency.get(path or "", self.latency)
+        delay = model.sample() / 1000.0
+        if self.timeout_rate and self.rng.random() < self.timeout_rate:
+            # Hang past the client timeout, like a stuck Apps Script execution
+            delay = self.timeout_seconds
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return JSONResponse(
+                status_code=self.error_status,
+                content={"success": False, "message": "Injected upstream error"})
+        return None
+
+# ------------------ Record / replay ------------------
+
+
+def _payload_key(path: Optional[str], payload: dict) -> Tuple[str, str]:
+    return (path or "", json.dumps(payload, sort_keys=True))
+
+
+class Recorder:
+    """Forwards calls to the real deployment and appends each exchange to a JSONL file."""
+
+    def __init__(self, upstream_url: str, capture_file: str):
+        self.upstream_url = upstream_url
+        self.capture_file = capture_file
+        self.client = httpx.AsyncClient(timeout=30, follow_redirects=True)
+
+    async def forward(self, path: Optional[str], payload: dict) -> JSONResponse:
+        start = time.perf_counter()
+        response = await self.client.post(self.upstream_url, params={"path": path}, json=payload)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"success": False, "message": response.text}
+
+        with open(self.capture_file, "a") as f:
+            f.write(json.dumps({
+                "path": path,
+                "payload": payload,
+                "status": response.status_code,
+                "response": body,
+                "elapsed_ms": elapsed_ms
+            }) + "\n")
+        return JSONResponse(status_code=response.status_code, content=body)
+
+
+class Replayer:
+    """
+    Serves captured exchanges. Exact (path, payload) matches are replayed in
+    capture order; otherwise the next capture for the same path is used.
+    """
+
+    def __init__(self, capture_file: str, replay_latency: bool = False):
+        self.replay_latency = replay_latency
+        self.exact: Dict[Tuple[str, str], List[dict]] = {}
+        self.by_path: Dict[str, List[dict]] = {}
+        self.cursors: Dict[object, int] = {}
+        with open(capture_file) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                key = _payload_key(entry["path"], entry["payload"])
+                self.exact.setdefault(key, []).append(entry)
+                self.by_path.setdefault(entry["path"] or "", []).append(entry)
+
+    def _next(self, key, entries: List[dict]) -> dict:
+        index = self.cursors.get(key, 0)
+        self.cursors[key] = index + 1
+        return entries[index % len(entries)]
+
+    async def play(self, path: Optional[str], payload: dict) -> JSONResponse:
+        key = _payload_key(path, payload)
+        if key in self.exact:
+            entry = self._next(key, self.exact[key])
+        elif (path or "") in self.by_path:
+            entry = self._next(path or "", self.by_path[path or ""])
+        else:
+            return JSONResponse(
+                status_code=404,
+                content={"success": False, "message": f"No recording for path: {path}"})
+
+        if self.replay_latency and entry.get("elapsed_ms"):
+            await asyncio.sleep(entry["elapsed_ms"] / 1000.0)
+        return JSONResponse(status_code=entry["status"], content=entry["response"])
+
+
+sheets = FakeSheets()
+faults = FaultConfig()
+recorder: Optional[Recorder] = None
+replayer: Optional[Replayer] = None
+call_counts: Dict[str, int] = {}
+
+app = FastAPI()
+
+
+@app.post("/exec")
+async def execute(request: Request, path: Optional[str] = None):
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = {}
+    call_counts[path or ""] = call_counts.get(path or "", 0) + 1
+
+    injected = await faults.apply(path)
+    if injected is not None:
+        return injected
+    if replayer is not None:
+        return await replayer.play(path, payload)
+    if recorder is not None:
+        return await recorder.forward(path, payload)
+    return sheets.handle(path, payload)
+
+
+@app.get("/__fake/config")
+async def get_config():
+    return {
+        "faults": faults.describe(),
+        "mode": "replay" if replayer else ("record" if recorder else "stateful"),
+        "calls": call_counts
+    }
+
+
+@app.post("/__fake/config")
+async def update_config(config: dict):
+    """Change latency/fault injection at runtime, e.g. mid-benchmark."""
+    global faults
+    merged = dict(faults.describe(), **config)
+    faults = FaultConfig(**merged)
+    return faults.describe()
+
+
+@app.post("/__fake/reset")
+async def reset_state():
+    sheets.reset()
+    call_counts.clear()
+    return {"success": True}
+
+
+def configure(latency: str = "fixed:0", error_rate: float = 0.0, error_status: int = 500,
+              timeout_rate: float = 0.0, timeout_seconds: float = 35.0,
+              path_latency: Optional[Dict[str, str]] = None, seed: Optional[int] = None,
+              record: Optional[str] = None, upstream: Optional[str] = None,
+              replay: Optional[str] = None, replay_latency: bool = False):
+    """Set up faults and record/replay mode; usable in-process or from the CLI."""
+    global faults, recorder, replayer
+    faults = FaultConfig(latency, error_rate, error_status, timeout_rate,
+                         timeout_seconds, path_latency, seed)
+    recorder = Recorder(upstream, record) if record else None
+    replayer = Replayer(replay, replay_latency) if replay else None
+
+
+def _parse_path_latency(values: List[str]) -> Dict[str, str]:
+    result = {}
+    for value in values:
+        path, _, spec = value.partition("=")
+        result[path] = spec
+    return result
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Apps Script backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="fixed:0", help="e.g. lognormal:800,0.6")
+    parser.add_argument("--path-latency", action="append", default=[],
+                        help="per-path override, e.g. get_available_orders=uniform:500,3000")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=35.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--record", help="capture real exchanges to this JSONL file")
+    parser.add_argument("--upstream", default=os.getenv("UPSTREAM_APP_SCRIPT_URL"),
+                        help="real Apps Script URL used in record mode")
+    parser.add_argument("--replay", help="serve exchanges from this JSONL capture")
+    parser.add_argument("--replay-latency", action="store_true",
+                        help="reproduce the recorded upstream latency when replaying")
+    args = parser.parse_args()
+
+    if args.record and not args.upstream:
+        parser.error("--record needs --upstream (or UPSTREAM_APP_SCRIPT_URL)")
+
+    configure(args.latency, args.error_rate, args.error_status, args.timeout_rate,
+              args.timeout_seconds, _parse_path_latency(args.path_latency), args.seed,
+              args.record, args.upstream, args.replay, args.replay_latency)
+    print(f"🧪 Fake Apps Script on http://{args.host}:{args.port}/exec  {faults.describe()}")
+    uvicorn.run(app, host=args.host, port=args.port)
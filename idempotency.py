@@ -0,0 +1,260 @@
+"""
+Idempotency-Key support for retried writes.
+
+Mobile clients on flaky networks retry POSTs whose response they never
+saw. With an `Idempotency-Key` header, the first request for a key runs;
+duplicates that arrive while it is still running wait for its result, and
+later ones get the stored result replayed, so a retry never reaches Apps
+Script or the notification fan-out a second time.
+
+Results are kept for `ttl` seconds, at most `max_keys` of them. Failed
+requests are not stored: concurrent duplicates see the same error, a
+later retry runs again. Reusing a key for a different request is a 422.
+
+That much is per process. With several uvicorn workers a retry after a
+dropped connection usually lands on another worker, so completed results
+can also go to a `SharedResults` tier: one file per key in the host's
+shared cache directory (shared_cache.py), flocked by the worker running
+the request. Workers then run each key once per host; a duplicate in
+another worker waits for the lock and replays the stored result (if the
+original failed, it runs the request itself).
+"""
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from fastapi import HTTPException, status
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: results stay per worker
+    fcntl = None
+
+
+def fingerprint(*parts) -> str:
+    """Stable hash of the request fields that must match across retries."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Entry:
+    __slots__ = ("fingerprint", "future", "expires_at")
+
+    def __init__(self, fingerprint: str, future: asyncio.Future, expires_at: float):
+        self.fingerprint = fingerprint
+        self.future = future
+        self.expires_at = expires_at
+
+
+def key_conflict() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail="Idempotency-Key was already used for a different request"
+    )
+
+
+class SharedResults:
+    """
+    Completed results (bytes) by key, shared by the workers on a host.
+    Each key is a file `<prefix>-idem-<hash>` holding a JSON header line
+    (fingerprint, expiry) and the result; a worker holds an flock on it
+    while it checks for a result and, if there is none, runs the request.
+    """
+
+    def __init__(self, directory: str, prefix: str, ttl: float,
+                 wait_timeout: Optional[float] = None, sweep_interval: float = 60.0):
+        self.directory = directory
+        self.prefix = f"{prefix}-idem-"
+        self.ttl = ttl
+        # Longer than an upstream call, so a duplicate outwaits the original
+        self.wait_timeout = wait_timeout if wait_timeout is not None else float(
+            os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "60"))
+        self.sweep_interval = sweep_interval
+        self.swept_at = time.monotonic()
+        self.replayed = 0
+        self.waits = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, self.prefix + hashlib.sha256(key.encode()).hexdigest()[:32])
+
+    def _lock(self, path: str):
+        """The key's file, opened and flocked; None if another worker holds it."""
+        while True:
+            f = open(path, "a+b")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return None
+            # A sweep may have unlinked the file between open() and flock()
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    @staticmethod
+    def _read(f) -> Optional[Tuple[str, float, bytes]]:
+        f.seek(0)
+        header, _, body = f.read().partition(b"\n")
+        if not header:
+            return None
+        stored = json.loads(header)
+        return stored["fingerprint"], stored["expires_at"], body
+
+    async def run(self, key: str, request_fingerprint: str,
+                  produce: Callable[[], Awaitable[bytes]]) -> Tuple[bytes, bool]:
+        """(result, replayed): the stored result for key, else produce() once across workers."""
+        if fcntl is None:
+            return await produce(), False
+        self._sweep()
+        path = self._path(key)
+        deadline = time.monotonic() + self.wait_timeout
+        f = self._lock(path)
+        if f is None:
+            self.waits += 1
+        while f is None:
+            if time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still in progress"
+                )
+            await asyncio.sleep(0.05)
+            f = self._lock(path)
+        try:
+            stored = self._read(f)
+            if stored is not None and stored[1] > time.time():
+                if stored[0] != request_fingerprint:
+                    raise key_conflict()
+                self.replayed += 1
+                return stored[2], True
+            result = await produce()
+            header = json.dumps({"fingerprint": request_fingerprint, "expires_at": time.time() + self.ttl})
+            f.seek(0)
+            f.truncate()
+            f.write(header.encode() + b"\n" + result)
+            f.flush()
+            return result, False
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def _sweep(self):
+        """Every sweep_interval, unlink expired (and failed, empty) entries nobody holds."""
+        now = time.monotonic()
+        if now - self.swept_at < self.sweep_interval:
+            return
+        self.swept_at = now
+        try:
+            names = [entry.name for entry in os.scandir(self.directory) if entry.name.startswith(self.prefix)]
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                f = self._lock(path)
+            except OSError:
+                continue
+            if f is None:
+                continue
+            try:
+                stored = self._read(f)
+                if stored is None or stored[1] <= time.time():
+                    os.unlink(path)
+            except (OSError, ValueError):
+                pass
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+
+    def stats(self) -> dict:
+        return {"directory": self.directory, "replayed": self.replayed, "waits": self.waits}
+
+
+class IdempotencyCache:
+    def __init__(self, ttl: Optional[float] = None, max_keys: Optional[int] = None,
+                 shared: Optional[SharedResults] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+        self.max_keys = max_keys if max_keys is not None else int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+        # Host-wide tier; produce() must then return bytes
+        self.shared = shared
+        # Oldest first; every entry has the same TTL, so expiry order is insertion order
+        self.entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self.executed = 0
+        self.joined = 0
+        self.replayed = 0
+
+    def _evict(self, now: float):
+        entries = self.entries
+        while entries:
+            entry = next(iter(entries.values()))
+            if entry.expires_at > now or not entry.future.done():
+                break
+            entries.popitem(last=False)
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+
+    async def run(self, key: str, request_fingerprint: str,
+                  produce: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(result, replayed): runs produce() once per key, shares its result with duplicates."""
+        while True:
+            now = time.monotonic()
+            self._evict(now)
+            entry = self.entries.get(key)
+            if entry is None:
+                break
+            if entry.fingerprint != request_fingerprint:
+                raise key_conflict()
+            if entry.future.done():
+                self.replayed += 1
+                return entry.future.result(), True
+            self.joined += 1
+            try:
+                # shield: a duplicate giving up must not cancel the original
+                return await asyncio.shield(entry.future), True
+            except asyncio.CancelledError:
+                if not entry.future.cancelled():
+                    raise
+            # The original request was cancelled before finishing: run this one instead
+
+        future = asyncio.get_running_loop().create_future()
+        entry = self.entries[key] = Entry(request_fingerprint, future, now + self.ttl)
+        self.executed += 1
+        replayed = False
+        try:
+            if self.shared is not None:
+                result, replayed = await self.shared.run(key, request_fingerprint, produce)
+            else:
+                result = await produce()
+        except Exception as e:
+            self._forget(key, entry)
+            future.set_exception(e)
+            # Marks the exception retrieved when no duplicate is waiting
+            future.exception()
+            raise
+        except BaseException:
+            self._forget(key, entry)
+            future.cancel()
+            raise
+        future.set_result(result)
+        # Stored results expire ttl seconds after they are produced
+        entry.expires_at = time.monotonic() + self.ttl
+        self.entries.move_to_end(key)
+        return result, replayed
+
+    def _forget(self, key: str, entry: Entry):
+        if self.entries.get(key) is entry:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {"keys": len(self.entries), "executed": self.executed,
+                "joined": self.joined, "replayed": self.replayed, "ttl": self.ttl,
+                "shared": self.shared.stats() if self.shared is not None else None}
@@ -0,0 +1,213 @@
+"""
+Live order board for delivery partners, pushed as versioned diffs.
+
+The server keeps the set of pending orders. A partner subscribes to the
+"order_board" topic and gets a snapshot; after that, every change is a
+`board_diff` frame with `from_version` and `version`:
+
+    {"type": "board_snapshot", "version": "3f2a.17", "orders": [...]}
+    {"type": "board_diff", "from_version": "3f2a.17", "version": "3f2a.18",
+     "added": [{...order...}], "removed": ["<order_id>"]}
+
+A client applies a diff only when `from_version` equals the version it
+holds, ignores diffs it already has, and on any other gap subscribes
+again with its version. If the missed diffs are still in the bounded
+history it gets them merged into one `board_diff` (whose `removed` may
+name orders that came and went meanwhile; removing an order the client
+does not hold is a no-op), otherwise a fresh snapshot. Versions are "<epoch>.<counter>" with a random epoch per
+process, so a version from another worker or before a restart always
+gets a snapshot.
+
+Creates and accepts handled here update the board at once. While anyone
+is subscribed, the board is also reconciled against the backend every
+`reconcile_interval` seconds, which picks up changes made through other
+workers; ids changed locally while a reconcile fetch was in flight keep
+their local state. With nobody subscribed the loop idles, so the first
+subscriber after an idle period waits for a fresh reconcile instead of
+getting a snapshot that may be hours old.
+"""
+
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import json
+import os
+import secrets
+import time
+
+BOARD_FIELDS = ("id", "customer_id", "items", "total_amount", "status")
+
+
+def board_entry(order: dict) -> dict:
+    """The board's view of an order (the `new_order` summary shape)."""
+    return {field: order.get(field) for field in BOARD_FIELDS}
+
+
+class LiveOrderBoard:
+    def __init__(self, fetch: Callable[[], Awaitable[List[dict]]], publish: Callable[[str], Awaitable[None]],
+                 subscribers: Callable[[], int], reconcile_interval: Optional[float] = None,
+                 history_size: Optional[int] = None):
+        # fetch() -> pending orders in the Order response shape
+        self.fetch = fetch
+        # publish(frame) sends to every board subscriber
+        self.publish = publish
+        self.subscribers = subscribers
+        self.reconcile_interval = reconcile_interval if reconcile_interval is not None else float(
+            os.getenv("BOARD_RECONCILE_INTERVAL", "30"))
+        self.history_size = history_size if history_size is not None else int(
+            os.getenv("BOARD_HISTORY_SIZE", "1000"))
+        self.epoch = secrets.token_hex(4)
+        self.counter = 0
+        self.orders: Dict[str, dict] = {}
+        self.loaded = False
+        self.reconciled_at = 0.0   # time.monotonic() of the last reconcile
+        # deque[(counter, {id: entry} added, {ids} removed)]
+        self.history: deque = deque()
+        # Ids changed locally while a reconcile is fetching -> counter at the change,
+        # to protect them from the stale fetch; empty otherwise
+        self.changed_at: Dict[str, int] = {}
+        self._reconciling = 0
+        self._loading: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+        self.diffs_sent = 0
+        self.snapshots = 0
+        self.resumes = 0
+        self.reconciles = 0
+
+    @property
+    def version(self) -> str:
+        return f"{self.epoch}.{self.counter}"
+
+    async def ensure_loaded(self):
+        """Load the board, or reconcile it if it has not been for over `reconcile_interval` (idle)."""
+        if not self.loaded or time.monotonic() - self.reconciled_at > self.reconcile_interval:
+            loop = asyncio.get_running_loop()
+            loading = self._loading
+            if loading is None or loading.done() or loading.get_loop() is not loop:
+                loading = self._loading = loop.create_task(self.reconcile())
+            await loading
+        self._ensure_reconciler()
+
+    def subscribe_reply(self, client_version: Optional[str]) -> dict:
+        """Fields of the reply to a subscribe: merged missed diffs if possible, else a snapshot."""
+        merged = self._since(client_version)
+        if merged is None:
+            self.snapshots += 1
+            return {"type": "board_snapshot", "version": self.version, "orders": list(self.orders.values())}
+        self.resumes += 1
+        added, removed = merged
+        return {"type": "board_diff", "from_version": client_version, "version": self.version,
+                "added": list(added.values()), "removed": sorted(removed)}
+
+    def _since(self, client_version: Optional[str]):
+        epoch, _, counter = (client_version or "").partition(".")
+        if epoch != self.epoch or not counter.isdigit():
+            return None
+        since = int(counter)
+        if since > self.counter:
+            return None
+        oldest = self.history[0][0] if self.history else self.counter + 1
+        if since < self.counter and since < oldest - 1:
+            return None   # the diffs after `since` are no longer all kept
+        added: Dict[str, dict] = {}
+        removed: Set[str] = set()
+        for counter, step_added, step_removed in self.history:
+            if counter <= since:
+                continue
+            for order_id in step_removed:
+                added.pop(order_id, None)
+                removed.add(order_id)
+            for order_id, entry in step_added.items():
+                removed.discard(order_id)
+                added[order_id] = entry
+        return added, removed
+
+    async def add(self, order: dict):
+        if not self.loaded:
+            return   # the first load will include it
+        entry = board_entry(order)
+        await self._apply({entry["id"]: entry}, set(), local=True)
+
+    async def remove(self, order_id: str):
+        if not self.loaded:
+            return
+        await self._apply({}, {order_id}, local=True)
+
+    async def _apply(self, added: Dict[str, dict], removed: Set[str], local: bool = False):
+        removed = {order_id for order_id in removed if order_id in self.orders}
+        added = {order_id: entry for order_id, entry in added.items() if self.orders.get(order_id) != entry}
+        if not added and not removed:
+            return
+        previous = self.version
+        self.counter += 1
+        for order_id in removed:
+            del self.orders[order_id]
+        self.orders.update(added)
+        if local and self._reconciling:
+            for order_id in list(added) + list(removed):
+                self.changed_at[order_id] = self.counter
+        self.history.append((self.counter, added, removed))
+        while len(self.history) > self.history_size:
+            self.history.popleft()
+
+        if self.subscribers():
+            self.diffs_sent += 1
+            await self.publish(json.dumps({
+                "type": "board_diff", "from_version": previous, "version": self.version,
+                "added": list(added.values()), "removed": sorted(removed)
+            }))
+
+    async def reconcile(self):
+        """Bring the board in line with the backend, publishing the difference."""
+        started = self.counter
+        self._reconciling += 1
+        try:
+            orders = {entry["id"]: entry for entry in map(board_entry, await self.fetch())}
+        finally:
+            self._reconciling -= 1
+        # Local changes made while fetching are newer than the fetched list
+        recent = {order_id for order_id, counter in self.changed_at.items() if counter > started}
+        if not self._reconciling:
+            self.changed_at.clear()
+        added = {order_id: entry for order_id, entry in orders.items() if order_id not in recent}
+        removed = {order_id for order_id in self.orders if order_id not in orders and order_id not in recent}
+        self.loaded = True
+        self.reconciled_at = time.monotonic()
+        self.reconciles += 1
+        await self._apply(added, removed)
+
+    def _ensure_reconciler(self):
+        loop = asyncio.get_running_loop()
+        task = self._task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._task = loop.create_task(self._reconcile_loop())
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            if not self.subscribers():
+                continue
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"Order board reconcile failed: {e}")
+
+    def clear(self):
+        self.epoch = secrets.token_hex(4)
+        self.counter = 0
+        self.orders.clear()
+        self.history.clear()
+        self.changed_at.clear()
+        self.loaded = False
+        self.reconciled_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "orders": len(self.orders),
+            "subscribers": self.subscribers(),
+            "diffs_sent": self.diffs_sent,
+            "snapshots": self.snapshots,
+            "resumes": self.resumes,
+            "reconciles": self.reconciles
+        }
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Offline HTTP load test for the Vicino backend.
+
+Runs a weighted mix of login, order creation, polling, accept and verify
+flows at a fixed arrival rate and reports throughput, error rate and
+p50/p95/p99 latency per route. By default the app runs in-process and
+talks to the fake Apps Script backend, so results are reproducible and
+comparable between commits:
+
+    python loadtest.py --rate 200 --duration 20 --out before.json
+    python loadtest.py --rate 200 --duration 20 --out after.json --compare before.json
+
+Use --serve to put the app behind a real uvicorn socket on localhost, or
+--target to hit a server that is already running.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+SCENARIOS = {"login", "create", "poll", "accept", "verify"}
+DEFAULT_MIX = "login=2,create=3,poll=4,accept=2,verify=1"
+FAKE_APPSCRIPT_URL = "http://appscript.local/exec"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}', expected one of {sorted(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class RouteStats:
+    """Latency samples and error counts for one route."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.status_codes: Dict[str, int] = {}
+
+    def record(self, latency: float, status_code: int):
+        self.latencies.append(latency)
+        key = str(status_code)
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+        if status_code == 0 or status_code >= 400:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> dict:
+        values = sorted(self.latencies)
+        count = len(values)
+        return {
+            "count": count,
+            "errors": self.errors,
+            "error_rate": self.errors / count if count else 0.0,
+            "throughput_rps": count / elapsed if elapsed else 0.0,
+            "mean_ms": (sum(values) / count * 1000) if count else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": (values[-1] * 1000) if count else 0.0,
+            "status_codes": self.status_codes,
+        }
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, float], seed: int = 0):
+        self.client = client
+        self.rng = random.Random(seed)
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.stats: Dict[str, RouteStats] = {}
+        # Shared state so later flows act on orders created by earlier ones
+        self.pending_orders: List[str] = []
+        self.accepted_orders: List[tuple] = []   # (order_id, otp)
+        self.known_orders: List[str] = []
+        self.dropped = 0
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status_code = response.status_code
+        except Exception:
+            response = None
+            status_code = 0
+        latency = time.perf_counter() - start
+        self.stats.setdefault(route, RouteStats()).record(latency, status_code)
+        return response
+
+    def phone(self) -> str:
+        return "9" + "".join(str(self.rng.randint(0, 9)) for _ in range(9))
+
+    # ------------------ Scenarios ------------------
+
+    async def login(self):
+        phone = self.phone()
+        role = self.rng.choice(["customer", "delivery"])
+        response = await self.request("POST /login/send_otp", "POST", "/login/send_otp", json={
+            "phone": phone, "role": role, "location": "Chennai"
+        })
+        if response is None or response.status_code != 200:
+            return
+        await self.request("POST /login/verify_otp", "POST", "/login/verify_otp", json={
+            "phone": phone, "otp": str(response.json().get("otp"))
+        })
+
+    async def create(self):
+        items = [
+            {"name": name, "quantity": self.rng.randint(1, 5), "unit": "kg", "price": price}
+            for name, price in self.rng.sample(
+                [("Carrot", 10.0), ("Banana", 5.0), ("Aspirin", 50.0), ("Rice", 60.0), ("Milk", 28.0)],
+                k=self.rng.randint(1, 4))
+        ]
+        response = await self.request("POST /orders", "POST", "/orders", json={
+            "customer_id": f"load-customer-{self.rng.randint(1, 500)}",
+            "phone": self.phone(),
+            "items": items
+        })
+        if response is not None and response.status_code == 200:
+            order_id = response.json()["id"]
+            self.pending_orders.append(order_id)
+            self.known_orders.append(order_id)
+
+    async def poll(self):
+        await self.request("GET /orders/available", "GET", "/orders/available")
+        if self.known_orders:
+            order_id = self.rng.choice(self.known_orders)
+            await self.request("GET /orders/{order_id}", "GET", f"/orders/{order_id}")
+
+    async def accept(self):
+        if not self.pending_orders:
+            return await self.create()
+        order_id = self.pending_orders.pop(self.rng.randrange(len(self.pending_orders)))
+        response = await self.request(
+            "POST /orders/{order_id}/accept", "POST", f"/orders/{order_id}/accept",
+            json={"delivery_partner_id": f"load-partner-{self.rng.randint(1, 200)}"})
+        if response is not None and response.status_code == 200:
+            self.accepted_orders.append((order_id, response.json().get("otp")))
+
+    async def verify(self):
+        if not self.accepted_orders:
+            return await self.accept()
+        order_id, otp = self.accepted_orders.pop(0)
+        await self.request(
+            "POST /orders/{order_id}/verify_otp", "POST", f"/orders/{order_id}/verify_otp",
+            json={"otp": otp})
+
+    # ------------------ Driver ------------------
+
+    async def run(self, rate: float, duration: float, max_in_flight: int) -> float:
+        """Open-loop arrivals (Poisson) capped at max_in_flight concurrent flows."""
+        semaphore = asyncio.Semaphore(max_in_flight)
+        tasks = set()
+        dropped = 0
+
+        async def run_flow(name: str):
+            try:
+                await getattr(self, name)()
+            finally:
+                semaphore.release()
+
+        start = time.perf_counter()
+        next_arrival = start
+        while True:
+            now = time.perf_counter()
+            if now - start >= duration:
+                break
+            if next_arrival > now:
+                await asyncio.sleep(next_arrival - now)
+            next_arrival += self.rng.expovariate(rate)
+            if semaphore.locked():
+                dropped += 1
+                continue
+            await semaphore.acquire()
+            name = self.rng.choices(self.names, self.weights)[0]
+            task = asyncio.create_task(run_flow(name))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        self.dropped = dropped
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float, config: dict) -> dict:
+        routes = {route: stats.summary(elapsed) for route, stats in sorted(self.stats.items())}
+        total = sum(r["count"] for r in routes.values())
+        errors = sum(r["errors"] for r in routes.values())
+        return {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "elapsed_s": elapsed,
+                "dropped_arrivals": self.dropped,
+                **config
+            },
+            "total": {
+                "count": total,
+                "errors": errors,
+                "error_rate": errors / total if total else 0.0,
+                "throughput_rps": total / elapsed if elapsed else 0.0,
+            },
+            "routes": routes,
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_report(result: dict, baseline: Optional[dict] = None):
+    print(f"\n{'route':<36}{'count':>8}{'err%':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    print("-" * 87)
+    for route, r in result["routes"].items():
+        line = (f"{route:<36}{r['count']:>8}{r['error_rate'] * 100:>6.1f}%"
+                f"{r['throughput_rps']:>9.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+        old = (baseline or {}).get("routes", {}).get(route)
+        if old and old["p99_ms"]:
+            line += f"   p99 {(r['p99_ms'] - old['p99_ms']) / old['p99_ms'] * 100:+.1f}%"
+        print(line)
+    total = result["total"]
+    print("-" * 87)
+    print(f"total: {total['count']} requests, {total['throughput_rps']:.1f} req/s, "
+          f"{total['error_rate'] * 100:.2f}% errors, "
+          f"{result['meta']['dropped_arrivals']} arrivals dropped")
+    if baseline:
+        old_total = baseline["total"]
+        print(f"baseline ({baseline['meta'].get('commit')}): {old_total['count']} requests, "
+              f"{old_total['throughput_rps']:.1f} req/s, {old_total['error_rate'] * 100:.2f}% errors")
+
+
+async def run_load_test(args) -> dict:
+    mix = parse_mix(args.mix)
+    server = None
+    server_task = None
+
+    if args.target:
+        client = httpx.AsyncClient(base_url=args.target, timeout=args.timeout)
+    else:
+        import fake_appscript
+        import main
+
+        fake_appscript.sheets.reset()
+        fake_appscript.configure(
+            latency=args.upstream_latency, error_rate=args.upstream_error_rate,
+            seed=args.seed, replay=args.replay)
+        main.use_appscript_transport(
+            httpx.ASGITransport(app=fake_appscript.app), FAKE_APPSCRIPT_URL)
+        # Every simulated user shares one client address here
+        main.admission.enabled = args.admission
+
+        if args.serve:
+            import uvicorn
+
+            config = uvicorn.Config(main.app, host="127.0.0.1", port=args.port,
+                                    log_level="warning", lifespan="off")
+            server = uvicorn.Server(config)
+            server_task = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.01)
+            client = httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout,
+                limits=httpx.Limits(max_connections=args.concurrency))
+        else:
+            client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=main.app),
+                base_url="http://vicino.test", timeout=args.timeout)
+
+    try:
+        if args.warmup:
+            warmup = LoadTest(client, mix, seed=args.seed + 1)
+            await warmup.run(args.rate, args.warmup, args.concurrency)
+
+        test = LoadTest(client, mix, seed=args.seed)
+        elapsed = await test.run(args.rate, args.duration, args.concurrency)
+    finally:
+        await client.aclose()
+        if server is not None:
+            server.should_exit = True
+            await server_task
+
+    return test.report(elapsed, {
+        "mode": "target" if args.target else ("socket" if args.serve else "in-process"),
+        "target": args.target,
+        "rate": args.rate,
+        "duration_s": args.duration,
+        "concurrency": args.concurrency,
+        "mix": mix,
+        "seed": args.seed,
+        "upstream_latency": None if args.target else args.upstream_latency,
+        "upstream_error_rate": None if args.target else args.upstream_error_rate,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Vicino backend")
+    parser.add_argument("--rate", type=float, default=100, help="flow arrivals per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to generate load")
+    parser.add_argument("--warmup", type=float, default=0, help="seconds of unrecorded warmup")
+    parser.add_argument("--concurrency", type=int, default=64, help="max flows in flight")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted scenario mix")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--serve", action="store_true", help="serve the app on a local socket")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--target", help="base URL of an already running server")
+    parser.add_argument("--upstream-latency", default="fixed:0",
+                        help="fake Apps Script latency, e.g. lognormal:800,0.6")
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--admission", action="store_true",
+                        help="keep admission control (rate limits, shedding) on for in-process runs")
+    parser.add_argument("--replay", help="replay captured Apps Script traffic instead of the fake sheets")
+    parser.add_argument("--out", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load_test(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\n📝 Results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Throttled relay of a delivery partner's location to the customer whose
+order they accepted.
+
+Partners may stream a GPS fix every second or faster; customers only need
+a smooth marker. Each tracked order keeps just the latest fix and at most
+one flush task. A fix that arrives while the customer is still inside the
+rate window, or while a previous send is still in flight to a slow
+socket, overwrites the pending one instead of queueing behind it, so
+outbound traffic per order is capped at `max_rate` frames per second.
+"""
+
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+import asyncio
+import json
+import os
+import time
+
+SendFn = Callable[[str, str], Awaitable[bool]]
+
+
+class Tracking:
+    __slots__ = ("order_id", "partner_id", "customer_id", "pending", "last_sent", "task")
+
+    def __init__(self, order_id: str, partner_id: str, customer_id: str):
+        self.order_id = order_id
+        self.partner_id = partner_id
+        self.customer_id = customer_id
+        self.pending: Optional[dict] = None
+        self.last_sent = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+
+class LocationRelay:
+    def __init__(self, send: SendFn, max_rate: Optional[float] = None,
+                 eta: Optional[Callable[[str, Tuple[float, float]], Optional[float]]] = None):
+        # send(customer_id, frame) -> delivered
+        self.send = send
+        # eta(order_id, (lat, lng)) -> minutes, added to frames that are actually sent
+        self.eta = eta
+        self.max_rate = max_rate if max_rate is not None else float(
+            os.getenv("LOCATION_RELAY_MAX_RATE", "1"))
+        self.interval = 1.0 / self.max_rate if self.max_rate > 0 else 0.0
+        self.orders: Dict[str, Tracking] = {}
+        self.by_partner: Dict[str, Set[str]] = {}
+        self.received = 0
+        self.sent = 0
+        self.coalesced = 0
+
+    def track(self, order_id: str, partner_id: str, customer_id: str):
+        self.stop(order_id)
+        self.orders[order_id] = Tracking(order_id, partner_id, customer_id)
+        self.by_partner.setdefault(partner_id, set()).add(order_id)
+
+    def stop(self, order_id: str):
+        tracking = self.orders.pop(order_id, None)
+        if tracking is None:
+            return
+        if tracking.task is not None and not tracking.task.done():
+            tracking.task.cancel()
+        orders = self.by_partner.get(tracking.partner_id)
+        if orders is not None:
+            orders.discard(order_id)
+            if not orders:
+                del self.by_partner[tracking.partner_id]
+
+    def on_location(self, partner_id: str, fix: dict):
+        """Record the partner's latest fix for every order they are delivering."""
+        order_ids = self.by_partner.get(partner_id)
+        if not order_ids:
+            return
+        for order_id in order_ids:
+            tracking = self.orders[order_id]
+            self.received += 1
+            if tracking.pending is not None:
+                self.coalesced += 1
+            tracking.pending = fix
+            if tracking.task is None or tracking.task.done():
+                tracking.task = asyncio.get_running_loop().create_task(self._flush(tracking))
+
+    async def _flush(self, tracking: Tracking):
+        while tracking.pending is not None:
+            wait = tracking.last_sent + self.interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            fix, tracking.pending = tracking.pending, None
+            fields = dict(fix, type="partner_location", order_id=tracking.order_id)
+            if self.eta is not None:
+                minutes = self.eta(tracking.order_id, (fix["lat"], fix["lng"]))
+                if minutes is not None:
+                    fields["eta_minutes"] = round(minutes, 1)
+            frame = json.dumps(fields)
+            tracking.last_sent = time.monotonic()
+            if await self.send(tracking.customer_id, frame):
+                self.sent += 1
+
+    def stats(self) -> dict:
+        return {
+            "tracked_orders": len(self.orders),
+            "fixes_received": self.received,
+            "frames_sent": self.sent,
+            "fixes_coalesced": self.coalesced,
+            "max_rate": self.max_rate
+        }
@@ -1,7 +1,8 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi import FastAPI, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional, Dict, Set, Tuple
 from enum import Enum
 import uuid
 import random
@@ -9,43 +10,118 @@ import time
 import httpx
 import json
 import asyncio
+import hashlib
+import os
+from ws_heartbeat import HeartbeatConfig, HeartbeatMetrics, TimerWheel
+from ws_protocol import MessageDispatcher, PONG, encode_error, encode_reply
+from event_log import EventLog
+from sse import SSEBroker
+from dispatch import DispatchConfig, Dispatcher
+from spatial_index import GridIndex
+from location_relay import LocationRelay
+from eta import DeliveryTracker, EtaModel
+from catalog import SORTS, CatalogService, VersionedItems
+from serialization import JSONBytes, OrderEncoder, dumps, loads, order_payload
+from compression import CompressionMiddleware
+from admission import AdmissionController, AdmissionMiddleware, worker_count
+from idempotency import IdempotencyCache, SharedResults, fingerprint
+from order_cache import OrderCache
+from shared_cache import SharedSnapshot, default_directory
+from prefetch import PrefetchScheduler
+from live_board import LiveOrderBoard
+import coldstart
 
 app = FastAPI()
+# Middleware added last runs first: CORS, then compression, then admission
+# Rate limits and load shedding in front of the Apps Script quota
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+# brotli/gzip for responses over COMPRESSION_MIN_SIZE bytes, flushed per chunk when streaming
+app.add_middleware(CompressionMiddleware)
+# Outermost, so 429s from admission carry CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins (for development purposes)
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods (GET, POST, etc.)
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["Retry-After", "Idempotent-Replayed"],  # readable by browser clients
 )
 
 # WebSocket Connection Manager
 
+PING_MESSAGE = json.dumps({"type": "ping"})
+
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, heartbeat: Optional[HeartbeatConfig] = None, events: Optional[EventLog] = None):
         self.active_connections: Dict[str, List[Dict]] = {
             "delivery_partners": [],
             "customers": []
         }
-
-    async def connect(self, websocket: WebSocket, client_type: str, user_id: str = None):
+        self.heartbeat = heartbeat or HeartbeatConfig()
+        self.timer_wheel = TimerWheel(self.heartbeat.tick)
+        self.metrics = HeartbeatMetrics()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.topics: Dict[str, Dict[int, Dict]] = {}   # {topic: {id(connection): connection}}
+        # Sequenced customer notifications, replayed to clients that reconnect
+        self.customer_events = events or EventLog(
+            int(os.getenv("EVENT_LOG_PER_USER", "128")),
+            int(os.getenv("EVENT_LOG_MAX_EVENTS", "100000")))
+
+    async def connect(self, websocket: WebSocket, client_type: str, user_id: str = None) -> Dict:
         await websocket.accept()
         if client_type not in self.active_connections:
             self.active_connections[client_type] = []
 
         connection_info = {
             "websocket": websocket,
-            "user_id": user_id
+            "user_id": user_id,
+            "client_type": client_type,
+            "last_seen": time.monotonic(),
+            "closed": False,
+            "topics": set()
         }
         self.active_connections[client_type].append(connection_info)
+        self.timer_wheel.schedule(connection_info, self.heartbeat.ping_interval)
+        self._ensure_heartbeat()
         print(f"Client {user_id} connected to {client_type}")
+        return connection_info
 
     def disconnect(self, websocket: WebSocket, client_type: str):
         connections = self.active_connections.get(client_type, [])
-        self.active_connections[client_type] = [
-            conn for conn in connections if conn["websocket"] != websocket
-        ]
+        remaining = []
+        for conn in connections:
+            if conn["websocket"] is websocket:
+                conn["closed"] = True
+                for topic in list(conn["topics"]):
+                    self.unsubscribe(conn, topic)
+            else:
+                remaining.append(conn)
+        self.active_connections[client_type] = remaining
+
+    def touch(self, connection: Dict):
+        """Record inbound activity; any frame counts as a pong."""
+        connection["last_seen"] = time.monotonic()
+
+    async def reap(self, connection: Dict, reason: str):
+        if connection["closed"]:
+            return
+        self.disconnect(connection["websocket"], connection["client_type"])
+        self.metrics.record_reap(reason)
+        try:
+            await asyncio.wait_for(connection["websocket"].close(code=1001), self.heartbeat.send_timeout)
+        except Exception:
+            pass
+        print(f"Reaped {connection['client_type']} client {connection['user_id']} ({reason})")
+
+    async def _send(self, connection: Dict, message: str, failure_reason: str = "send_failed") -> bool:
+        try:
+            await asyncio.wait_for(connection["websocket"].send_text(message), self.heartbeat.send_timeout)
+            return True
+        except Exception:
+            await self.reap(connection, failure_reason)
+            return False
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
         try:
@@ -54,38 +130,200 @@ class ConnectionManager:
             pass
 
     async def broadcast_to_delivery_partners(self, message: str):
-        connections = self.active_connections.get("delivery_partners", [])
-        disconnected = []
-
+        connections = list(self.active_connections.get("delivery_partners", []))
+        if connections:
+            await asyncio.gather(*(self._send(conn, message) for conn in connections))
+
+    async def send_to_user(self, client_type: str, user_id: str, message: str) -> bool:
+        """Send to every connection of one user; True if any send succeeded."""
+        connections = [
+            conn for conn in self.active_connections.get(client_type, [])
+            if conn["user_id"] == user_id
+        ]
+        if not connections:
+            return False
+        results = await asyncio.gather(*(self._send(conn, message) for conn in connections))
+        return any(results)
+
+    async def notify_customer(self, customer_id: str, notification: dict):
+        """Record the notification in the customer's event log and push it live."""
+        message = self.customer_events.append(customer_id, notification)
+        connections = [
+            conn for conn in self.active_connections.get("customers", [])
+            if conn["user_id"] == customer_id and not conn.get("replaying")
+        ]
         for connection in connections:
+            await self._send(connection, message)
+
+    async def resume_customer(self, connection: Dict, last_seq: int):
+        """
+        Send the customer everything after last_seq. Live notifications are
+        held back while replaying and picked up by the catch-up loop, so
+        frames arrive in sequence order.
+        """
+        log = self.customer_events
+        user_id = connection["user_id"]
+        connection["replaying"] = True
+        try:
+            missed = log.since(user_id, last_seq)
+            if missed is None:
+                # Too far behind: the client refetches state over HTTP
+                last_seq = log.latest(user_id)
+                if not await self._send(connection, encode_reply("resync", last_seq=last_seq)):
+                    return
+                missed = log.since(user_id, last_seq)
+            while missed:
+                for _, frame in missed:
+                    if not await self._send(connection, frame):
+                        return
+                last_seq = missed[-1][0]
+                missed = log.since(user_id, last_seq)
+        finally:
+            connection["replaying"] = False
+
+    def subscribe(self, connection: Dict, topic: str):
+        self.topics.setdefault(topic, {})[id(connection)] = connection
+        connection["topics"].add(topic)
+
+    def unsubscribe(self, connection: Dict, topic: str):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.pop(id(connection), None)
+            if not subscribers:
+                del self.topics[topic]
+        connection["topics"].discard(topic)
+
+    async def publish(self, topic: str, message: str):
+        subscribers = list(self.topics.get(topic, {}).values())
+        if subscribers:
+            await asyncio.gather(*(self._send(conn, message) for conn in subscribers))
+
+    # ------------------ Heartbeat ------------------
+
+    def _ensure_heartbeat(self):
+        loop = asyncio.get_running_loop()
+        task = self._heartbeat_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._heartbeat_task = loop.create_task(self._heartbeat_loop())
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat.tick)
             try:
-                await connection["websocket"].send_text(message)
-            except:
-                disconnected.append(connection)
+                await self.heartbeat_tick()
+            except Exception as e:
+                print(f"Heartbeat tick failed: {e}")
+
+    async def heartbeat_tick(self):
+        """Advance the timer wheel one slot: reap idle clients and ping quiet ones."""
+        now = time.monotonic()
+        idle_timeout = self.heartbeat.idle_timeout
+        ping_interval = self.heartbeat.ping_interval
+        pending = []
+        for connection in self.timer_wheel.advance():
+            if connection["closed"]:
+                continue
+            quiet = now - connection["last_seen"]
+            if idle_timeout and quiet >= idle_timeout:
+                pending.append(self.reap(connection, "idle"))
+                continue
+            if quiet >= ping_interval:
+                self.metrics.pings_sent += 1
+                pending.append(self._send(connection, PING_MESSAGE, "unresponsive"))
+                delay = ping_interval
+            else:
+                delay = ping_interval - quiet
+            if idle_timeout:
+                delay = min(delay, idle_timeout - quiet)
+            self.timer_wheel.schedule(connection, delay)
+        if pending:
+            await asyncio.gather(*pending)
+
+    def stats(self) -> dict:
+        return {
+            "active": {
+                client_type: len(connections)
+                for client_type, connections in self.active_connections.items()
+            },
+            "scheduled_timers": self.timer_wheel.size,
+            "customer_events": self.customer_events.stats(),
+            "order_events": order_events.stats(),
+            "sse": sse_broker.stats(),
+            "location_relay": location_relay.stats(),
+            **self.metrics.snapshot()
+        }
 
-        # Remove disconnected websockets
-        for conn in disconnected:
-            self.disconnect(conn["websocket"], "delivery_partners")
 
-    async def notify_customer(self, customer_id: str, message: str):
-        connections = self.active_connections.get("customers", [])
-        for connection in connections:
-            if connection["user_id"] == customer_id:
-                try:
-                    await connection["websocket"].send_text(message)
-                except:
-                    self.disconnect(connection["websocket"], "customers")
+manager = ConnectionManager()
 
+# Per-order status events, shared by WebSocket order topics and SSE streams
+order_events = EventLog(
+    int(os.getenv("ORDER_EVENT_LOG_PER_ORDER", "32")),
+    int(os.getenv("ORDER_EVENT_LOG_MAX_EVENTS", "100000")))
+sse_broker = SSEBroker(order_events)
 
-manager = ConnectionManager()
 
-APP_SCRIPT_URL = "https://script.google.com/macros/s/AKfycbz8ccNA3R_9vfq6KvyuAHvsNb7FpoAV0nJi_pJuYHhZqNEBeedHfMTC5iLxvNdEQvm1/exec"
+async def send_order_offer(partner_id: str, order: dict, timeout: float) -> bool:
+    return await manager.send_to_user("delivery_partners", partner_id, json.dumps({
+        "type": "order_offer",
+        "order": order,
+        "expires_in": timeout
+    }))
+
+
+async def rebroadcast_order(order: dict):
+    await manager.broadcast_to_delivery_partners(json.dumps({"type": "new_order", "order": order}))
+
+
+# Live partner locations streamed over the delivery socket
+partner_index = GridIndex(
+    cell_km=float(os.getenv("PARTNER_INDEX_CELL_KM", "0.5")),
+    stale_after=float(os.getenv("PARTNER_LOCATION_STALE_AFTER", "120")))
+
+
+async def send_to_customer(customer_id: str, frame: str) -> bool:
+    return await manager.send_to_user("customers", customer_id, frame)
+
+
+# Travel-time estimates, refined from completed deliveries
+eta_model = EtaModel.from_env()
+deliveries = DeliveryTracker(eta_model)
+
+# Live partner location for customers of accepted orders, rate limited per order
+location_relay = LocationRelay(send_to_customer, eta=deliveries.eta_minutes)
+
+
+def connected_partner_positions() -> Dict[str, tuple]:
+    positions = {}
+    for conn in manager.active_connections.get("delivery_partners", []):
+        position = partner_index.position(conn["user_id"])
+        if position is not None:
+            positions[conn["user_id"]] = position
+    return positions
+
+
+# Optional batch dispatch (DISPATCH_MODE=batch): offer each order to one chosen partner
+dispatcher = Dispatcher(DispatchConfig(), send_order_offer, rebroadcast_order,
+                        connected_partner_positions, eta=eta_model)
+
+
+async def publish_order_event(order_id: str, event: dict):
+    frame = order_events.append(order_id, event)
+    sse_broker.publish(order_id, order_events.latest(order_id), event["type"], frame)
+    await manager.publish(f"order:{order_id}", frame)
+
+APP_SCRIPT_URL = os.getenv(
+    "APP_SCRIPT_URL",
+    "https://script.google.com/macros/s/AKfycbz8ccNA3R_9vfq6KvyuAHvsNb7FpoAV0nJi_pJuYHhZqNEBeedHfMTC5iLxvNdEQvm1/exec"
+)
 items_db = [
     {
         "id": "1",
         "name": "Carrot",
         "price": 10.0,
         "store_name": "Local Grocery",
+        "store_lat": 13.0827,
+        "store_lng": 80.2707,
         "image_url": "https://via.placeholder.com/150?text=Carrot"
     },
     {
@@ -93,6 +331,8 @@ items_db = [
         "name": "Aspirin",
         "price": 50.0,
         "store_name": "Pharmacy",
+        "store_lat": 13.0604,
+        "store_lng": 80.2496,
         "image_url": "https://via.placeholder.com/150?text=Aspirin"
     },
     {
@@ -100,6 +340,8 @@ items_db = [
         "name": "Banana",
         "price": 5.0,
         "store_name": "Fruit Market",
+        "store_lat": 13.0878,
+        "store_lng": 80.2785,
         "image_url": "https://via.placeholder.com/150?text=Banana"
     },
 ]
@@ -129,7 +371,10 @@ class StoreItem(BaseModel):
     name: str
     price: float
     store_name: str
+    store_lat: Optional[float] = None
+    store_lng: Optional[float] = None
     image_url: Optional[str] = None
+    distance_km: Optional[float] = None  # Set for location queries
 
 
 class OrderStatus(str, Enum):
@@ -153,6 +398,15 @@ class OrderCreate(BaseModel):
     customer_id: str
     phone: str  # Add phone number here
     items: List[Item]
+    pickup_lat: Optional[float] = None  # Store location, used by batch dispatch
+    pickup_lng: Optional[float] = None
+    delivery_lat: Optional[float] = None  # Drop-off point, used for ETAs
+    delivery_lng: Optional[float] = None
+
+
+class BulkOrderCreate(BaseModel):
+    # Validated one by one, so an invalid order fails on its own
+    orders: List[dict]
 
 # Order model stored in our orders_db
 
@@ -166,6 +420,12 @@ class Order(BaseModel):
     assigned_partner_id: Optional[str] = None
     otp: Optional[str] = None
 
+# Request model for looking up several orders at once
+
+
+class OrderLookup(BaseModel):
+    ids: List[str]
+
 # Request model when a delivery partner accepts an order
 
 
@@ -193,23 +453,52 @@ class TransactionRecord(BaseModel):
 # ------------------ Helper Functions ------------------
 
 
+_appscript_client: Optional[httpx.AsyncClient] = None
+
+
+def get_appscript_client() -> httpx.AsyncClient:
+    """Shared client so Apps Script calls reuse pooled connections."""
+    global _appscript_client
+    if _appscript_client is None:
+        _appscript_client = httpx.AsyncClient(timeout=30, follow_redirects=True)
+    return _appscript_client
+
+
+def use_appscript_transport(transport: httpx.AsyncBaseTransport, url: Optional[str] = None):
+    """
+    Route Apps Script calls through a custom transport, e.g. the in-process
+    fake backend used by the load test.
+    """
+    global _appscript_client, APP_SCRIPT_URL
+    _appscript_client = httpx.AsyncClient(
+        transport=transport, timeout=30, follow_redirects=True)
+    if url is not None:
+        APP_SCRIPT_URL = url
+
+
+async def prewarm_appscript():
+    """Open connections to the Apps Script hosts before the first upstream call."""
+    elapsed = await coldstart.prewarm(get_appscript_client(), coldstart.prewarm_urls(APP_SCRIPT_URL))
+    print(f"Prewarmed Apps Script connections in {elapsed * 1000:.0f} ms")
+
+
 async def make_appscript_request(endpoint: str, payload: dict):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                APP_SCRIPT_URL,
-                params={"path": endpoint},
-                json=payload,
-                timeout=30,
-                follow_redirects=True
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=f"AppScript API error: {e.response.text}"
-            )
+    client = get_appscript_client()
+    try:
+        response = await client.post(
+            APP_SCRIPT_URL,
+            params={"path": endpoint},
+            json=payload,
+            timeout=30,
+            follow_redirects=True
+        )
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=f"AppScript API error: {e.response.text}"
+        )
 
 
 def generate_unique_id(role: str) -> str:
@@ -263,6 +552,7 @@ def record_blockchain_transaction(record: TransactionRecord):
 
 @app.post("/login/send_otp")
 async def send_otp(login_request: LoginRequest):
+    admission.limit("phone", login_request.phone)
     # Standardize role name
     role = login_request.role.lower()
     if role == "deliverypartner":
@@ -283,6 +573,8 @@ async def send_otp(login_request: LoginRequest):
 
 @app.post("/login/verify_otp")
 async def verify_otp(otp_request: OtpVerificationRequest):
+    # Also caps OTP guessing per phone
+    admission.limit("user", f"verify:{otp_request.phone}")
     try:
         # Keep OTP as string - don't convert to int
         response = await make_appscript_request("verify_otp", {
@@ -313,8 +605,41 @@ async def verify_otp(otp_request: OtpVerificationRequest):
         )
 
 
+# Catalog, pending order board and idempotent results shared by all uvicorn
+# workers on the host (shared_cache.py); on by default when running several workers
+SHARED_CACHE_MODE = os.getenv("SHARED_CACHE", "auto").lower()
+SHARED_CACHE = worker_count() > 1 if SHARED_CACHE_MODE == "auto" \
+    else SHARED_CACHE_MODE in ("1", "true", "yes")
+SHARED_CACHE_PREFIX = "vicino-" + hashlib.sha1(APP_SCRIPT_URL.encode()).hexdigest()[:8]
+
+# Results of POST /orders and accepts (encoded bodies), replayed for retries with the
+# same Idempotency-Key in any worker
+idempotency = IdempotencyCache(shared=SharedResults(
+    default_directory(), SHARED_CACHE_PREFIX, float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+) if SHARED_CACHE else None)
+
+
+def replay_headers(replayed: bool) -> Optional[Dict[str, str]]:
+    return {"Idempotent-Replayed": "true"} if replayed else None
+
+
 @app.post("/orders", response_model=Order)
-async def create_order(order_data: OrderCreate):
+async def create_order(order_data: OrderCreate, idempotency_key: Optional[str] = Header(None)):
+    if not idempotency_key:
+        return await place_order(order_data)
+
+    async def create() -> bytes:
+        return dumps((await place_order(order_data)).model_dump(mode="json"))
+
+    body, replayed = await idempotency.run(
+        f"create_order:{order_data.customer_id}:{idempotency_key}",
+        fingerprint(order_data.model_dump(mode="json")), create)
+    return JSONBytes(body, headers=replay_headers(replayed))
+
+
+async def place_order(order_data: OrderCreate) -> Order:
+    """Create the order upstream and announce it to partners."""
+    admission.limit("user", order_data.customer_id)
     # Calculate total first
     total = calculate_order_total(order_data.items)
     # Prepare items for serialization
@@ -334,58 +659,292 @@ async def create_order(order_data: OrderCreate):
         total_amount=total,
         status=OrderStatus.PENDING
     )
+    order_cache.put(backend_record(order))
+    await announce_new_orders([(order, order_data)])
+    return order
 
-    # Broadcast new order to all delivery partners
-    order_notification = {
-        "type": "new_order",
-        "order": {
+
+async def announce_new_orders(placed: List[Tuple[Order, OrderCreate]]):
+    """Offer new orders to partners (one broadcast for all of them) and publish their status."""
+    broadcast = []
+    for order, order_data in placed:
+        summary = {
             "id": order.id,
             "customer_id": order.customer_id,
             "items": [item.dict() for item in order.items],
             "total_amount": order.total_amount,
             "status": order.status.value
         }
+        deliveries.created(order.id, order_data.delivery_lat, order_data.delivery_lng,
+                           order_data.pickup_lat, order_data.pickup_lng)
+        await live_board.add(summary)
+        if dispatcher.config.enabled:
+            dispatcher.submit(summary, order_data.pickup_lat, order_data.pickup_lng)
+        else:
+            broadcast.append(summary)
+
+    if placed:
+        order_board_changed()
+    # Broadcast new orders to all delivery partners
+    if len(broadcast) == 1:
+        await manager.broadcast_to_delivery_partners(json.dumps({"type": "new_order", "order": broadcast[0]}))
+    elif broadcast:
+        await manager.broadcast_to_delivery_partners(json.dumps({"type": "new_orders", "orders": broadcast}))
+
+    for order, _ in placed:
+        await publish_order_event(order.id, {
+            "type": "order_update",
+            "order_id": order.id,
+            "status": order.status.value,
+            "delivery_partner_id": None
+        })
+
+
+# Upper bound on orders in one POST /orders/bulk
+BULK_ORDER_MAX_ORDERS = int(os.getenv("BULK_ORDER_MAX_ORDERS", "100"))
+
+
+@app.post("/orders/bulk")
+async def create_orders_bulk(bulk: BulkOrderCreate, idempotency_key: Optional[str] = Header(None)):
+    """
+    Create many orders with one Apps Script write and one partner broadcast.
+    Each order succeeds or fails on its own; results follow request order.
+    """
+    if len(bulk.orders) > BULK_ORDER_MAX_ORDERS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {BULK_ORDER_MAX_ORDERS} orders per request"
+        )
+    if not idempotency_key:
+        return await place_orders(bulk.orders)
+
+    async def create() -> bytes:
+        return dumps(await place_orders(bulk.orders))
+
+    body, replayed = await idempotency.run(f"bulk_orders:{idempotency_key}", fingerprint(bulk.orders), create)
+    return JSONBytes(body, headers=replay_headers(replayed))
+
+
+def describe_validation_error(error: ValidationError) -> str:
+    return "; ".join(".".join(str(part) for part in detail["loc"]) + ": " + detail["msg"]
+                     for detail in error.errors())
+
+
+async def place_orders(raw_orders: List[dict]) -> dict:
+    results: List[Optional[dict]] = [None] * len(raw_orders)
+    valid: List[Tuple[int, OrderCreate, float]] = []
+    for index, raw in enumerate(raw_orders):
+        try:
+            order_data = OrderCreate(**raw)
+        except ValidationError as e:
+            results[index] = {"index": index, "success": False, "error": describe_validation_error(e)}
+            continue
+        if not order_data.items:
+            results[index] = {"index": index, "success": False, "error": "Order has no items"}
+            continue
+        try:
+            # Same per-customer rate as single creates, counted per order
+            admission.limit("user", order_data.customer_id)
+        except HTTPException as e:
+            results[index] = {"index": index, "success": False, "error": e.detail}
+            continue
+        valid.append((index, order_data, calculate_order_total(order_data.items)))
+
+    placed: List[Tuple[Order, OrderCreate]] = []
+    if valid:
+        upstream = await save_orders([
+            {
+                "customerId": order_data.customer_id,
+                "phone": order_data.phone,
+                "items": [item.dict() for item in order_data.items],
+                "totalAmount": total
+            }
+            for _, order_data, total in valid
+        ])
+        for result, (index, order_data, total) in zip(upstream, valid):
+            if not result.get("success") or not result.get("orderId"):
+                results[index] = {"index": index, "success": False,
+                                  "error": result.get("message", "Order was not saved")}
+                continue
+            order = Order(
+                id=result["orderId"],
+                customer_id=order_data.customer_id,
+                items=order_data.items,
+                total_amount=total,
+                status=OrderStatus.PENDING
+            )
+            placed.append((order, order_data))
+            order_cache.put(backend_record(order))
+            results[index] = {"index": index, "success": True, "order": order.model_dump(mode="json")}
+
+    await announce_new_orders(placed)
+    return {"created": len(placed), "failed": len(raw_orders) - len(placed), "results": results}
+
+
+async def save_orders(orders: List[dict]) -> List[dict]:
+    """
+    Save orders upstream with one create_orders call; one result per order.
+    If the deployed script does not support it, save them one by one.
+    """
+    response = await make_appscript_request("create_orders", {"orders": orders})
+    if isinstance(response, dict) and response.get("success"):
+        results = response.get("results")
+        if not isinstance(results, list) or len(results) != len(orders):
+            # Some may be saved: retrying them one by one could duplicate orders
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="Unexpected create_orders response from the backend"
+            )
+        return results
+
+    reason = response.get("message") if isinstance(response, dict) else "unexpected response"
+    print(f"create_orders failed ({reason}); creating {len(orders)} orders one by one")
+    results = []
+    for order in orders:
+        try:
+            result = await make_appscript_request("create_order", order)
+        except HTTPException as e:
+            results.append({"success": False, "message": str(e.detail)})
+            continue
+        except httpx.HTTPError as e:
+            results.append({"success": False, "message": f"Backend did not answer: {type(e).__name__}"})
+            continue
+        if isinstance(result, dict) and result.get("orderId"):
+            results.append({"success": True, "orderId": result["orderId"]})
+        else:
+            message = result.get("message") if isinstance(result, dict) else None
+            results.append({"success": False, "message": message or "Order was not saved"})
+    return results
+
+
+# With TRUST_BACKEND_DATA=1, Apps Script order data is not re-validated by Pydantic
+TRUST_BACKEND_DATA = os.getenv("TRUST_BACKEND_DATA", "0").lower() in ("1", "true", "yes")
+
+
+def validate_order_payload(payload: dict) -> dict:
+    return Order(**payload).model_dump(mode="json")
+
+
+# Encoded order bytes, cached per order version
+order_encoder = OrderEncoder(None if TRUST_BACKEND_DATA else validate_order_payload,
+                             int(os.getenv("ORDER_ENCODE_CACHE_SIZE", "10000")))
+
+
+# Backend order records by id, for /orders?ids=
+order_cache = OrderCache()
+
+
+def backend_record(order: Order) -> dict:
+    """Order -> the Apps Script record shape that order_cache and order_encoder take."""
+    return {
+        "id": order.id,
+        "customerId": order.customer_id,
+        "items": [item.model_dump() for item in order.items],
+        "totalAmount": order.total_amount,
+        "status": order.status.value,
+        "assignedPartnerId": order.assigned_partner_id,
+        "otp": order.otp
     }
 
-    await manager.broadcast_to_delivery_partners(json.dumps(order_notification))
 
-    return order
+def order_from_backend(data: dict) -> Order:
+    fields = order_payload(data)
+    if not TRUST_BACKEND_DATA:
+        return Order(**fields)
+    fields["items"] = [Item.model_construct(**item) for item in fields["items"]]
+    fields["status"] = OrderStatus(fields["status"])
+    return Order.model_construct(**fields)
 
 
-@app.get("/orders/available", response_model=List[Order])
-async def get_available_orders():
+# ------------------ Shared Cache ------------------
+order_board = SharedSnapshot(f"{SHARED_CACHE_PREFIX}-order-board",
+                             ttl=float(os.getenv("ORDER_BOARD_TTL", "2")))
+
+
+async def fetch_order_board() -> bytes:
     response = await make_appscript_request("get_available_orders", {})
+    return order_encoder.encode_list(response["orders"])
 
-    orders = []
-    for order_data in response["orders"]:
-        orders.append(Order(
-            id=order_data["id"],
-            customer_id=order_data["customerId"],
-            items=[Item(**item) for item in order_data["items"]],
-            total_amount=order_data["totalAmount"],
-            status=OrderStatus(order_data["status"]),
-            assigned_partner_id=order_data.get("assignedPartnerId"),
-            otp=order_data.get("otp")
-        ))
 
-    return orders
+def order_board_changed():
+    """Drop the shared order board after this worker creates or assigns orders."""
+    if SHARED_CACHE:
+        order_board.invalidate()
+
+
+# ------------------ Live Order Board ------------------
+# Pending orders pushed to subscribed partners as versioned diffs (live_board.py)
+async def fetch_live_board() -> List[dict]:
+    if SHARED_CACHE:
+        return loads((await order_board.get(fetch_order_board)).payload)
+    response = await make_appscript_request("get_available_orders", {})
+    return [order_payload(data) for data in response["orders"]]
+
+
+live_board = LiveOrderBoard(
+    fetch_live_board,
+    lambda frame: manager.publish("order_board", frame),
+    lambda: len(manager.topics.get("order_board", ()))
+)
+
+
+@app.get("/orders/available", response_model=List[Order])
+async def get_available_orders():
+    if SHARED_CACHE:
+        prefetch.touch("order_board")
+        board = await order_board.get(fetch_order_board)
+        return JSONBytes(board.payload.tobytes())
+    return JSONBytes(await fetch_order_board())
 
 
 @app.post("/orders/{order_id}/accept", response_model=Order)
-async def accept_order(order_id: str, accept_req: AcceptOrderRequest):
+async def accept_order(order_id: str, accept_req: AcceptOrderRequest,
+                       idempotency_key: Optional[str] = Header(None)):
+    async def accept() -> bytes:
+        admission.limit("user", accept_req.delivery_partner_id)
+        order = await assign_order(order_id, accept_req)
+        return dumps(order.model_dump(mode="json"))
+
+    if not idempotency_key:
+        return JSONBytes(await accept())
+    body, replayed = await idempotency.run(
+        f"accept_order:{accept_req.delivery_partner_id}:{idempotency_key}",
+        fingerprint(order_id), accept)
+    return JSONBytes(body, headers=replay_headers(replayed))
+
+
+async def assign_order(order_id: str, accept_req: AcceptOrderRequest) -> Order:
+    """Assign the order to the partner and notify everyone concerned."""
+    if dispatcher.config.enabled:
+        offered_to = dispatcher.offered_to(order_id)
+        if offered_to is not None and offered_to != accept_req.delivery_partner_id:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Order is currently offered to another delivery partner"
+            )
+
     response = await make_appscript_request("assign_order", {
         "orderId": order_id,
         "partnerId": accept_req.delivery_partner_id
     })
-    order = Order(
-        id=order_id,
-        customer_id=response["customerId"],
-        items=[Item(**item) for item in response["items"]],
-        total_amount=response["totalAmount"],
-        status=OrderStatus.ACCEPTED,  # Change to ACCEPTED when delivery partner accepts
-        assigned_partner_id=accept_req.delivery_partner_id,
-        otp=response["otp"]  # OTP sent to the delivery partner
-    )
+    order = order_from_backend({
+        "id": order_id,
+        "customerId": response["customerId"],
+        "items": response["items"],
+        "totalAmount": response["totalAmount"],
+        "status": OrderStatus.ACCEPTED.value,  # Change to ACCEPTED when delivery partner accepts
+        "assignedPartnerId": accept_req.delivery_partner_id,
+        "otp": response["otp"]  # OTP sent to the delivery partner
+    })
+
+    order_cache.put(backend_record(order))
+    order_board_changed()
+    await live_board.remove(order.id)
+    if dispatcher.config.enabled:
+        dispatcher.on_accepted(order.id, accept_req.delivery_partner_id)
+
+    last_fix = partner_index.position(order.assigned_partner_id)
+    deliveries.accepted(order.id, order.assigned_partner_id, last_fix)
 
     # Notify customer that order has been accepted
     customer_notification = {
@@ -394,8 +953,16 @@ async def accept_order(order_id: str, accept_req: AcceptOrderRequest):
         "delivery_partner_id": order.assigned_partner_id,
         "message": "Your order has been accepted by a delivery partner"
     }
+    eta_minutes = deliveries.eta_minutes(order.id, last_fix)
+    if eta_minutes is not None:
+        customer_notification["eta_minutes"] = round(eta_minutes, 1)
 
-    await manager.notify_customer(order.customer_id, json.dumps(customer_notification))
+    await manager.notify_customer(order.customer_id, customer_notification)
+
+    # Relay the partner's live location to the customer until delivery
+    location_relay.track(order.id, order.assigned_partner_id, order.customer_id)
+    if last_fix is not None:
+        location_relay.on_location(order.assigned_partner_id, {"lat": last_fix[0], "lng": last_fix[1]})
 
     # Notify other delivery partners that this order is no longer available
     order_taken_notification = {
@@ -405,6 +972,12 @@ async def accept_order(order_id: str, accept_req: AcceptOrderRequest):
     }
 
     await manager.broadcast_to_delivery_partners(json.dumps(order_taken_notification))
+    await publish_order_event(order.id, {
+        "type": "order_update",
+        "order_id": order.id,
+        "status": order.status.value,
+        "delivery_partner_id": order.assigned_partner_id
+    })
 
     return order
 
@@ -417,7 +990,7 @@ async def verify_order_otp(order_id: str, verify_req: VerifyOTPRequest):
     })
 
     # Ensure the response contains details for blockchain transaction
-    return TransactionRecord(
+    transaction = TransactionRecord(
         order_id=order_id,
         customer_id=response["customerId"],
         delivery_partner_id=response["deliveryPartnerId"],
@@ -427,6 +1000,21 @@ async def verify_order_otp(order_id: str, verify_req: VerifyOTPRequest):
         platform_commission=response["platformCommission"]
     )
 
+    if dispatcher.config.enabled:
+        dispatcher.partner_free(transaction.delivery_partner_id)
+    location_relay.stop(order_id)
+    order_cache.invalidate(order_id)
+    deliveries.completed(order_id)
+
+    await publish_order_event(order_id, {
+        "type": "order_update",
+        "order_id": order_id,
+        "status": OrderStatus.DELIVERED.value,
+        "delivery_partner_id": transaction.delivery_partner_id
+    })
+
+    return transaction
+
 
 @app.post("/users/register")
 async def register_user(register_data: LoginRequest):
@@ -442,38 +1030,298 @@ async def register_user(register_data: LoginRequest):
     return response
 
 
-@app.get("/items/nearby", response_model=List[StoreItem])
-async def get_nearby_items():
+async def fetch_catalog() -> List[dict]:
     response = await make_appscript_request("get_nearby_items", {})
     return response.get("items", [])
 
 
+shared_catalog = SharedSnapshot(f"{SHARED_CACHE_PREFIX}-catalog",
+                                ttl=float(os.getenv("CATALOG_REFRESH_INTERVAL", "60")))
+
+
+async def fetch_catalog_bytes() -> bytes:
+    return dumps(await fetch_catalog())
+
+
+async def load_catalog():
+    """Catalog for the index: from the shared tier (versioned across workers) or Apps Script."""
+    if not SHARED_CACHE:
+        return await fetch_catalog()
+    snapshot = await shared_catalog.get(fetch_catalog_bytes)
+    return VersionedItems(loads(snapshot.payload), snapshot.epoch, snapshot.generation)
+
+
+# ------------------ Prefetch ------------------
+# Refreshes the catalog and the shared order board ahead of reads (prefetch.py)
+PREFETCH = os.getenv("PREFETCH", "1").lower() in ("1", "true", "yes")
+prefetch = PrefetchScheduler()
+
+# Searchable copy of the catalog, refreshed in the background
+catalog = CatalogService(load_catalog, background_refresh=not PREFETCH)
+
+
+async def prefetch_catalog():
+    if SHARED_CACHE:
+        await shared_catalog.refresh(fetch_catalog_bytes, min_age=catalog.refresh_interval / 2)
+    await catalog.refresh()
+
+
+async def prefetch_order_board():
+    await order_board.refresh(fetch_order_board, min_age=order_board.ttl / 2)
+
+
+if PREFETCH:
+    prefetch.register("catalog", prefetch_catalog, min_interval=catalog.refresh_interval,
+                      max_interval=float(os.getenv("PREFETCH_CATALOG_MAX_INTERVAL", "300")),
+                      reads_per_refresh=20)
+    if SHARED_CACHE:
+        prefetch.register("order_board", prefetch_order_board, min_interval=order_board.ttl,
+                          max_interval=float(os.getenv("PREFETCH_BOARD_MAX_INTERVAL", "20")),
+                          reads_per_refresh=2)
+
+
+async def current_catalog():
+    prefetch.touch("catalog")
+    return await catalog.current()
+
+# ------------------ Cold Start ------------------
+# Serverless (Vercel): do at init what the first request would otherwise pay for
+COLD_START = coldstart.enabled()
+if COLD_START:
+    get_appscript_client()
+    catalog_snapshot = coldstart.load_catalog_snapshot()
+    if catalog_snapshot is not None:
+        catalog.load_snapshot(*catalog_snapshot)
+        if PREFETCH:
+            prefetch.expire("catalog")
+    app.router.on_startup.append(prewarm_appscript)
+
+DEFAULT_NEARBY_RADIUS_KM = float(os.getenv("NEARBY_RADIUS_KM", "5"))
+MAX_NEARBY_RADIUS_KM = float(os.getenv("NEARBY_MAX_RADIUS_KM", "50"))
+
+
+def catalog_etag(version: str, query: str) -> str:
+    """Strong ETag: the same catalog version and query give byte-identical bodies."""
+    if not query:
+        return f'"{version}"'
+    params = "&".join(sorted(query.split("&")))
+    return f'"{version}-{hashlib.sha1(params.encode()).hexdigest()[:12]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires (compressed responses carry W/ tags)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+@app.get("/items/nearby", response_model=List[StoreItem])
+async def get_nearby_items(request: Request, response: Response, q: Optional[str] = None, store: Optional[str] = None,
+                           min_price: Optional[float] = None, max_price: Optional[float] = None,
+                           sort: str = "relevance", limit: Optional[int] = None, offset: int = 0,
+                           lat: Optional[float] = None, lng: Optional[float] = None,
+                           radius: float = DEFAULT_NEARBY_RADIUS_KM):
+    """
+    Catalog items, optionally searched by name prefix (q), filtered by store
+    and price range, sorted (relevance, price_asc, price_desc, name) and paged.
+    With lat/lng only items from stores within radius km are returned,
+    nearest store first unless another sort is asked for.
+    """
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORTS)}")
+    if (lat is None) != (lng is None):
+        raise HTTPException(status_code=400, detail="lat and lng must be given together")
+    index = await current_catalog()
+    etag = catalog_etag(index.version, request.url.query)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return index.search(q, store, min_price, max_price, sort,
+                        None if limit is None else max(limit, 0), max(offset, 0),
+                        lat=lat, lng=lng, radius_km=min(max(radius, 0.0), MAX_NEARBY_RADIUS_KM))
+
+
+@app.get("/items/changes")
+async def get_item_changes(since: Optional[str] = None):
+    """
+    Catalog changes since a version from an earlier response. Falls back to
+    a full snapshot ("full": true) when the version is unknown or too old.
+    """
+    index = await current_catalog()
+    changes = catalog.changes_since(since)
+    if changes is None:
+        return {"version": index.version, "full": True, "items": index.items}
+    upserts, deletes = changes
+    return {"version": index.version, "full": False, "upserts": upserts, "deletes": deletes}
+
+
+@app.get("/items/stores")
+async def get_item_stores():
+    """Stores in the catalog with their item counts."""
+    index = await current_catalog()
+    return index.stores()
+
+
 @app.get("/orders/partner/status")
 async def check_partner_status(delivery_partner_id: str):
     """
     Check if a delivery partner is already assigned to an ongoing order.
     Returns true if the partner is free to accept new orders, false if they have an ongoing unverified order.
     """
+    admission.limit("user", f"status:{delivery_partner_id}")
     response = await make_appscript_request("check_partner_status", {
         "deliveryPartnerId": delivery_partner_id
     })
     return response
 
 
+@app.get("/partners/nearby")
+async def get_nearby_partners(lat: float, lng: float, radius_km: float = 5.0, limit: int = 20):
+    """Connected delivery partners with a recent location fix, nearest first."""
+    nearest = partner_index.nearest(lat, lng, max(min(limit, 500), 0),
+                                    min(max(radius_km, 0.0), MAX_NEARBY_RADIUS_KM))
+    return [
+        {"partner_id": partner_id, "distance_km": round(distance, 3),
+         "lat": partner_index.get(partner_id)[0], "lng": partner_index.get(partner_id)[1]}
+        for distance, partner_id in nearest
+    ]
+
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """In-flight requests, shed and rate-limited counts, and idempotent replays."""
+    return {**admission.stats(), "idempotency": idempotency.stats()}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Shared cache tier, order lookup cache and encoded order cache counters."""
+    return {
+        "shared": SHARED_CACHE,
+        "order_board": order_board.stats() if SHARED_CACHE else None,
+        "catalog": shared_catalog.stats() if SHARED_CACHE else None,
+        "orders": order_cache.stats(),
+        "encoder": order_encoder.stats(),
+        "prefetch": prefetch.stats()
+    }
+
+
+@app.get("/dispatch/stats")
+async def dispatch_stats():
+    """Batch dispatch counters (pending orders, live offers, solve time) and ETA cache."""
+    return {**dispatcher.snapshot(), "eta": eta_model.stats()}
+
+
+@app.get("/orders/{order_id}/eta")
+async def get_order_eta(order_id: str):
+    """Estimated minutes until the assigned partner reaches the drop-off point."""
+    partner_id = deliveries.partner_of(order_id)
+    eta_minutes = deliveries.eta_minutes(order_id, partner_index.position(partner_id)) if partner_id else None
+    if eta_minutes is None:
+        raise HTTPException(status_code=404, detail="No ETA available for this order")
+    return {"order_id": order_id, "delivery_partner_id": partner_id, "eta_minutes": round(eta_minutes, 1)}
+
+
 @app.get("/orders/{order_id}", response_model=Order)
 async def get_order_details(order_id: str):
     """
     Retrieve details of a specific order.
     """
     response = await make_appscript_request("get_order_details", {"orderId": order_id})
-    return Order(
-        id=response["id"],
-        customer_id=response["customerId"],
-        items=[Item(**item) for item in response["items"]],
-        total_amount=response["totalAmount"],
-        status=OrderStatus(response["status"]),
-        assigned_partner_id=response.get("assignedPartnerId"),
-        otp=response.get("otp")
+    if response.get("id"):
+        order_cache.put(response)
+    return JSONBytes(order_encoder.encode(response))
+
+
+# Upper bound on ids in one /orders?ids= lookup
+BULK_LOOKUP_MAX_IDS = int(os.getenv("BULK_LOOKUP_MAX_IDS", "100"))
+# Concurrent get_order_details calls when the script has no get_orders_details
+BULK_LOOKUP_FALLBACK_CONCURRENCY = int(os.getenv("BULK_LOOKUP_FALLBACK_CONCURRENCY", "10"))
+
+
+@app.get("/orders")
+async def get_orders(ids: str):
+    """
+    Several orders at once: /orders?ids=a,b,c. `orders` follows the order of
+    `ids`, with null for unknown ids, which are also listed in `missing`.
+    """
+    return await lookup_orders([order_id.strip() for order_id in ids.split(",") if order_id.strip()])
+
+
+@app.post("/orders/lookup")
+async def lookup_orders_by_body(lookup: OrderLookup):
+    """Same as GET /orders?ids= for id lists too long for a URL."""
+    return await lookup_orders(lookup.ids)
+
+
+async def lookup_orders(order_ids: List[str]) -> JSONBytes:
+    unique_ids = list(dict.fromkeys(order_ids))
+    if len(unique_ids) > BULK_LOOKUP_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {BULK_LOOKUP_MAX_IDS} ids per request"
+        )
+    found, misses = order_cache.get_many(unique_ids)
+    if misses:
+        # Only the misses go upstream
+        for record in await fetch_order_records(misses):
+            if record.get("id") in misses:
+                order_cache.put(record)
+                found[record["id"]] = record
+    unknown = [order_id for order_id in unique_ids if order_id not in found]
+    orders = b",".join(order_encoder.encode(found[order_id]) if order_id in found else b"null"
+                       for order_id in order_ids)
+    return JSONBytes(b'{"orders":[' + orders + b'],"missing":' + dumps(unknown) + b"}")
+
+
+async def fetch_order_records(order_ids: List[str]) -> List[dict]:
+    """
+    Backend records for order_ids, unknown ids left out: one get_orders_details
+    call, or one get_order_details per id if the deployed script lacks it.
+    """
+    try:
+        response = await make_appscript_request("get_orders_details", {"orderIds": order_ids})
+    except ValueError:   # not JSON
+        response = None
+    if isinstance(response, dict) and response.get("success") and isinstance(response.get("orders"), list):
+        return response["orders"]
+    reason = response.get("message") if isinstance(response, dict) else "unexpected response"
+    print(f"get_orders_details failed ({reason}); fetching {len(order_ids)} orders one by one")
+
+    slots = asyncio.Semaphore(BULK_LOOKUP_FALLBACK_CONCURRENCY)
+
+    async def fetch_one(order_id: str) -> Optional[dict]:
+        async with slots:
+            record = await make_appscript_request("get_order_details", {"orderId": order_id})
+        if isinstance(record, dict) and record.get("id"):
+            return record
+        if isinstance(record, dict) and record.get("success") is False:
+            return None   # the backend says there is no such order
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Unexpected get_order_details response for order {order_id}"
+        )
+
+    return [record for record in await asyncio.gather(*map(fetch_one, order_ids)) if record is not None]
+
+
+@app.get("/orders/{order_id}/events")
+async def order_events_stream(order_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events stream of status updates for one order.
+    Reconnecting clients send Last-Event-ID to receive only missed events.
+    """
+    try:
+        resume_from = int(last_event_id) if last_event_id else None
+    except ValueError:
+        resume_from = None
+    return StreamingResponse(
+        sse_broker.stream(order_id, resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
@@ -721,32 +1569,167 @@ async def get_blockchain_transactions():
 #     return blockchain_ledger
 
 # WebSocket endpoints
+@app.get("/ws/metrics")
+async def websocket_metrics():
+    """Connection counts, heartbeat/reaping counters and the live order board."""
+    return {**manager.stats(), "order_board": live_board.stats()}
+
+
 @app.websocket("/ws/delivery/{user_id}")
 async def websocket_delivery_partner(websocket: WebSocket, user_id: str):
-    await manager.connect(websocket, "delivery_partners", user_id)
+    connection = await manager.connect(websocket, "delivery_partners", user_id)
     try:
         while True:
             data = await websocket.receive_text()
-            # Handle ping/pong or other messages from delivery partners
-            await manager.send_personal_message(f"Echo: {data}", websocket)
+            manager.touch(connection)
+            reply = await messages.dispatch(connection, data)
+            if reply is not None:
+                await manager.send_personal_message(reply, websocket)
     except WebSocketDisconnect:
-        manager.disconnect(websocket, "delivery_partners")
         print(f"Delivery partner {user_id} disconnected")
+    finally:
+        manager.disconnect(websocket, "delivery_partners")
+        if not any(conn["user_id"] == user_id for conn in manager.active_connections["delivery_partners"]):
+            partner_index.remove(user_id)
 
 
 @app.websocket("/ws/customer/{user_id}")
-async def websocket_customer(websocket: WebSocket, user_id: str):
-    await manager.connect(websocket, "customers", user_id)
+async def websocket_customer(websocket: WebSocket, user_id: str, last_seq: Optional[int] = None):
+    connection = await manager.connect(websocket, "customers", user_id)
     try:
+        if last_seq is not None:
+            await manager.resume_customer(connection, last_seq)
         while True:
             data = await websocket.receive_text()
-            # Handle ping/pong or other messages from customers
-            await manager.send_personal_message(f"Echo: {data}", websocket)
+            manager.touch(connection)
+            reply = await messages.dispatch(connection, data)
+            if reply is not None:
+                await manager.send_personal_message(reply, websocket)
     except WebSocketDisconnect:
-        manager.disconnect(websocket, "customers")
         print(f"Customer {user_id} disconnected")
+    finally:
+        manager.disconnect(websocket, "customers")
+
+# ------------------ WebSocket message handlers ------------------
+
+
+messages = MessageDispatcher()
+
+
+@messages.on("ping")
+async def handle_ping(connection: Dict, message: dict):
+    if message.get("id") is None:
+        return PONG
+    return encode_reply("pong", message["id"])
+
+
+@messages.on("pong")
+async def handle_pong(connection: Dict, message: dict):
+    # Activity is already recorded by the receive loop
+    return None
+
+
+@messages.on("ack")
+async def handle_ack(connection: Dict, message: dict):
+    # Accepted for older clients; resuming relies on the last_seq the client sends
+    return None
+
+
+@messages.on("resume")
+async def handle_resume(connection: Dict, message: dict):
+    await manager.resume_customer(connection, message["last_seq"])
+    return None
+
+
+@messages.on("subscribe")
+async def handle_subscribe(connection: Dict, message: dict):
+    topic = message["topic"]
+    if topic == "order_board":
+        return await subscribe_order_board(connection, message)
+    if not topic.startswith("order:"):
+        return encode_error(f"Unknown topic: {topic}", message.get("id"))
+    manager.subscribe(connection, topic)
+    return encode_reply("subscribed", message.get("id"), topic=topic)
+
+
+async def subscribe_order_board(connection: Dict, message: dict):
+    """Reply with a board snapshot, or only the diff since the client's `version`."""
+    if connection["client_type"] != "delivery_partners":
+        return encode_error("Only delivery partners can subscribe to order_board", message.get("id"))
+    try:
+        await live_board.ensure_loaded()
+    except Exception as e:
+        print(f"Loading the order board failed: {e}")
+        return encode_error("Order board is unavailable, try again", message.get("id"))
+    manager.subscribe(connection, "order_board")
+    reply = live_board.subscribe_reply(message.get("version"))
+    return encode_reply(reply.pop("type"), message.get("id"), **reply)
+
+
+@messages.on("unsubscribe")
+async def handle_unsubscribe(connection: Dict, message: dict):
+    manager.unsubscribe(connection, message["topic"])
+    return encode_reply("unsubscribed", message.get("id"), topic=message["topic"])
+
+
+@messages.on("decline")
+async def handle_decline(connection: Dict, message: dict):
+    dispatcher.on_declined(message["order_id"], connection["user_id"])
+    return None
+
+
+@messages.on("location")
+async def handle_location(connection: Dict, message: dict):
+    partner_index.upsert(connection["user_id"], message["lat"], message["lng"])
+    # Every fix, timed on receipt, before the relay throttles what customers see
+    deliveries.located(connection["user_id"], (message["lat"], message["lng"]))
+    fix = {"lat": message["lat"], "lng": message["lng"]}
+    for field in ("heading", "speed", "ts"):
+        if message.get(field) is not None:
+            fix[field] = message[field]
+    location_relay.on_location(connection["user_id"], fix)
+    return None
+
+
+# Socket accepts in flight, referenced until they finish
+accept_tasks: Set[asyncio.Task] = set()
+
+
+@messages.on("accept")
+async def handle_accept(connection: Dict, message: dict):
+    """Same rate limit as HTTP accept; the upstream call runs outside the receive loop."""
+    try:
+        admission.limit("user", connection["user_id"])
+    except HTTPException as e:
+        return encode_error(str(e.detail), message.get("id"))
+    task = asyncio.get_running_loop().create_task(run_accept(connection, message))
+    accept_tasks.add(task)
+    task.add_done_callback(accept_tasks.discard)
+    return None
+
+
+async def run_accept(connection: Dict, message: dict):
+    order_id = message["order_id"]
+    try:
+        order = await assign_order(order_id, AcceptOrderRequest(
+            delivery_partner_id=connection["user_id"]))
+        reply = encode_reply("accept_result", message.get("id"), order_id=order.id,
+                             customer_id=order.customer_id, otp=order.otp)
+    except HTTPException as e:
+        reply = encode_error(str(e.detail), message.get("id"))
+    except Exception:
+        reply = encode_error(f"Order {order_id} could not be accepted", message.get("id"))
+    if not connection["closed"]:
+        await manager.send_personal_message(reply, connection["websocket"])
+
+if COLD_START:
+    # Everything is registered: build the ASGI middleware stack now, not on the first request
+    app.middleware_stack = app.build_middleware_stack()
 
 # Run the server using: uvicorn main:app --reload
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # Protocol-level ping/pong, handled by uvicorn underneath the app heartbeat
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True,
+                ws_ping_interval=float(os.getenv("WS_PROTOCOL_PING_INTERVAL", "20")),
+                ws_ping_timeout=float(os.getenv("WS_PROTOCOL_PING_TIMEOUT", "20")))
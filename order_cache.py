@@ -0,0 +1,57 @@
+"""
+Short-lived cache of Apps Script order records, keyed by order id.
+
+Screens that show several orders at once resolve them through
+`/orders?ids=`; cached records are served locally and only the misses go
+upstream, in one batched request. Records expire after `ttl` seconds so
+changes made through other workers show up; changes made through this
+one (create, accept, verify) update or drop the entry right away.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import os
+import time
+
+
+class OrderCache:
+    def __init__(self, ttl: Optional[float] = None, max_orders: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("ORDER_CACHE_TTL", "5"))
+        self.max_orders = max_orders if max_orders is not None else int(os.getenv("ORDER_CACHE_SIZE", "10000"))
+        # {order_id: (expires_at, backend record)}, least recently stored first
+        self.orders: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, order_ids: Iterable[str]) -> Tuple[Dict[str, dict], List[str]]:
+        """({id: record} for fresh entries, [ids to fetch])."""
+        now = time.monotonic()
+        found: Dict[str, dict] = {}
+        missing: List[str] = []
+        for order_id in order_ids:
+            entry = self.orders.get(order_id)
+            if entry is not None and entry[0] > now:
+                found[order_id] = entry[1]
+            else:
+                if entry is not None:
+                    del self.orders[order_id]
+                missing.append(order_id)
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def put(self, record: dict):
+        order_id = record["id"]
+        self.orders.pop(order_id, None)
+        self.orders[order_id] = (time.monotonic() + self.ttl, record)
+        if len(self.orders) > self.max_orders:
+            self.orders.popitem(last=False)
+
+    def invalidate(self, order_id: str):
+        self.orders.pop(order_id, None)
+
+    def clear(self):
+        self.orders.clear()
+
+    def stats(self) -> dict:
+        return {"cached_orders": len(self.orders), "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
@@ -0,0 +1,163 @@
+"""
+Background prefetch of hot read data.
+
+Keys such as the catalog and the pending order board are registered with
+a refresh coroutine. The scheduler refreshes each key ahead of time, so
+readers find warm data instead of waiting on Apps Script:
+
+- adaptive: a key is refreshed about once per `reads_per_refresh` reads
+  (read rate is a decaying average over `rate_window` seconds), clamped
+  between its `min_interval` and `max_interval`;
+- jittered: each delay is shortened by up to `jitter` (a fraction) at
+  random, so keys and workers do not refresh in lockstep;
+- idle-aware: a key nobody has read for `idle_after` seconds is skipped;
+  the next read schedules it again right away if it is overdue.
+
+Upstream load is therefore at most one call per key per `min_interval`,
+and none for keys that are not being read.
+"""
+
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import math
+import os
+import random
+import time
+
+RefreshFn = Callable[[], Awaitable[object]]
+
+
+class HotKey:
+    __slots__ = ("name", "refresh", "min_interval", "max_interval", "reads_per_refresh", "idle_after",
+                 "rate", "rate_at", "last_read", "last_refresh", "next_due", "expired", "task",
+                 "refreshes", "skipped", "errors")
+
+    def __init__(self, name: str, refresh: RefreshFn, min_interval: float, max_interval: float,
+                 reads_per_refresh: float, idle_after: float):
+        self.name = name
+        self.refresh = refresh
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.reads_per_refresh = reads_per_refresh
+        self.idle_after = idle_after
+        self.rate = 0.0          # decaying reads/s, as of rate_at
+        self.rate_at = 0.0
+        self.last_read = 0.0
+        self.last_refresh = 0.0
+        self.next_due = 0.0
+        self.expired = False
+        self.task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.skipped = 0
+        self.errors = 0
+
+
+class PrefetchScheduler:
+    def __init__(self, jitter: Optional[float] = None, rate_window: float = 60.0,
+                 rng: Optional[random.Random] = None):
+        self.jitter = jitter if jitter is not None else float(os.getenv("PREFETCH_JITTER", "0.2"))
+        self.rate_window = rate_window
+        self.rng = rng or random.Random()
+        self.keys: Dict[str, HotKey] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def register(self, name: str, refresh: RefreshFn, min_interval: float,
+                 max_interval: Optional[float] = None, reads_per_refresh: float = 1.0,
+                 idle_after: Optional[float] = None):
+        max_interval = max(max_interval or min_interval, min_interval)
+        self.keys[name] = HotKey(name, refresh, min_interval, max_interval, reads_per_refresh,
+                                 idle_after if idle_after is not None else 2 * max_interval)
+
+    def expire(self, name: str):
+        """Refresh `name` right after its next read, e.g. when it was loaded from a bundled snapshot."""
+        self.keys[name].expired = True
+
+    def read_rate(self, key: HotKey, now: float) -> float:
+        return key.rate * math.exp(-(now - key.rate_at) / self.rate_window)
+
+    def interval(self, key: HotKey, now: float) -> float:
+        rate = self.read_rate(key, now)
+        if rate <= 0:
+            return key.max_interval
+        return min(max(key.reads_per_refresh / rate, key.min_interval), key.max_interval)
+
+    def _delay(self, key: HotKey, now: float) -> float:
+        # Only ever earlier than the interval, so data is refreshed before it would expire
+        return self.interval(key, now) * (1 - self.jitter * self.rng.random())
+
+    def touch(self, name: str, now: Optional[float] = None):
+        """Record a read of `name`; starts the scheduler on the first one."""
+        key = self.keys.get(name)
+        if key is None:
+            return
+        now = time.monotonic() if now is None else now
+        first_read = key.last_read == 0.0
+        key.rate = self.read_rate(key, now) + 1.0 / self.rate_window
+        key.rate_at = now
+        key.last_read = now
+        if key.expired:
+            key.expired = False
+            key.next_due = now
+        elif first_read:
+            # This read loads the data itself; the first refresh is an interval away
+            key.last_refresh = now
+            key.next_due = now + self._delay(key, now)
+        elif key.next_due == 0.0:
+            # Parked while idle: refresh now if overdue, else when it would have been due
+            key.next_due = max(key.last_refresh + self._delay(key, now), now)
+        self._ensure_running()
+        if key.next_due <= now:
+            self._wake.set()
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        task = self._task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            due = [key for key in self.keys.values() if key.next_due and key.next_due <= now]
+            for key in due:
+                if now - key.last_read > key.idle_after:
+                    key.skipped += 1
+                    key.next_due = 0.0   # parked until the next read
+                    continue
+                key.next_due = now + self._delay(key, now)
+                if key.task is None or key.task.done():
+                    # A refresh still running past its interval is not started twice
+                    key.task = asyncio.get_running_loop().create_task(self._refresh(key))
+
+            pending = [key.next_due for key in self.keys.values() if key.next_due]
+            timeout = max(min(pending) - time.monotonic(), 0.0) if pending else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh(self, key: HotKey):
+        try:
+            await key.refresh()
+            key.refreshes += 1
+        except Exception as e:
+            key.errors += 1
+            print(f"Prefetch of {key.name} failed: {e}")
+        key.last_refresh = time.monotonic()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            name: {
+                "reads_per_s": round(self.read_rate(key, now), 3),
+                "interval": round(self.interval(key, now), 3),
+                "idle": now - key.last_read > key.idle_after,
+                "refreshes": key.refreshes,
+                "skipped": key.skipped,
+                "errors": key.errors
+            }
+            for name, key in self.keys.items()
+        }
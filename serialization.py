@@ -0,0 +1,105 @@
+"""
+Fast JSON responses for order data coming back from Apps Script.
+
+The default FastAPI path builds Pydantic models from the backend dicts,
+then validates them again against `response_model` and encodes with the
+standard json module. Here each backend order is mapped straight to its
+response shape, optionally validated once, encoded with orjson when it is
+installed, and the encoded bytes are cached per order version. A list
+response is then just the cached fragments joined together.
+"""
+
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+import json
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the json module
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data):
+    """Decode JSON from bytes or a memoryview (e.g. a shared cache mapping)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data))
+
+
+class JSONBytes(Response):
+    """A response whose body is already encoded JSON."""
+    media_type = "application/json"
+
+
+def order_payload(data: dict) -> dict:
+    """Apps Script order (camelCase) -> the `Order` response shape."""
+    return {
+        "id": data["id"],
+        "customer_id": data["customerId"],
+        "items": [
+            {
+                "name": item["name"],
+                "quantity": item["quantity"],
+                "unit": item.get("unit", "unit"),
+                "price": item["price"]
+            }
+            for item in data["items"]
+        ],
+        "total_amount": data["totalAmount"],
+        "status": data["status"],
+        "assigned_partner_id": data.get("assignedPartnerId"),
+        "otp": data.get("otp")
+    }
+
+
+def order_version(data: dict) -> Tuple:
+    # Items and total are fixed at creation; accept and verify change the rest
+    return (data["id"], data.get("status"), data.get("assignedPartnerId"),
+            data.get("otp"), data.get("totalAmount"))
+
+
+class OrderEncoder:
+    """
+    Encodes backend orders to JSON bytes with an LRU cache keyed by order
+    version. `validate`, if given, turns a payload into a checked one (e.g.
+    through the Pydantic model); it only runs on a cache miss.
+    """
+
+    def __init__(self, validate: Optional[Callable[[dict], dict]] = None, max_orders: int = 10_000):
+        self.validate = validate
+        self.max_orders = max_orders
+        self.cache: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, data: dict) -> bytes:
+        key = order_version(data)
+        encoded = self.cache.get(key)
+        if encoded is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return encoded
+
+        self.misses += 1
+        payload = order_payload(data)
+        if self.validate is not None:
+            payload = self.validate(payload)
+        encoded = self.cache[key] = dumps(payload)
+        if len(self.cache) > self.max_orders:
+            self.cache.popitem(last=False)
+        return encoded
+
+    def encode_list(self, orders: Iterable[dict]) -> bytes:
+        return b"[" + b",".join(self.encode(data) for data in orders) + b"]"
+
+    def stats(self) -> dict:
+        return {"cached_orders": len(self.cache), "hits": self.hits, "misses": self.misses,
+                "encoder": "orjson" if orjson is not None else "json"}
@@ -0,0 +1,203 @@
+"""
+Cache tier shared by all uvicorn workers on a host.
+
+Each named entry (the catalog, the pending order board) is one immutable
+snapshot file in a memory-backed directory (/dev/shm when available):
+a fixed header (epoch, generation, publish and expiry times) followed by
+the encoded payload. Workers map the current file read-only, so the
+bytes sit in memory once per host rather than once per worker, and a
+read is a stat() plus a slice of the mapping.
+
+Publishing writes a new file next to the old one and renames it into
+place; readers still holding the old mapping keep a consistent view
+until they pick up the new one. The generation only moves when the
+payload changes, and the epoch only when the entry is recreated, so
+"<epoch>.<generation>" is the same version in every worker.
+
+When an entry is stale, one worker (holding an flock on the entry's lock
+file) fetches from upstream and publishes; the others keep serving the
+stale snapshot, or wait briefly when there is none yet.
+"""
+
+from typing import Awaitable, Callable, NamedTuple, Optional
+import asyncio
+import mmap
+import os
+import secrets
+import struct
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: every worker fetches for itself
+    fcntl = None
+
+# epoch (8 ASCII hex chars), generation, published_at, expires_at
+HEADER = struct.Struct("<8sQdd")
+
+
+class Snapshot(NamedTuple):
+    epoch: str
+    generation: int
+    published_at: float
+    expires_at: float
+    payload: memoryview
+
+    @property
+    def version(self) -> str:
+        return f"{self.epoch}.{self.generation}"
+
+
+def default_directory() -> str:
+    directory = os.getenv("SHARED_CACHE_DIR")
+    if directory:
+        return directory
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class SharedSnapshot:
+    def __init__(self, name: str, ttl: float, directory: Optional[str] = None, wait_timeout: float = 10.0):
+        self.path = os.path.join(directory or default_directory(), f"{name}.snapshot")
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._inode: Optional[int] = None
+        self._snapshot: Optional[Snapshot] = None
+        self._lock_file = None
+        self._refreshing = False
+        self.hits = 0
+        self.stale_hits = 0
+        self.fetches = 0
+        self.waits = 0
+
+    def read(self) -> Optional[Snapshot]:
+        """The current snapshot, or None if nothing has been published."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            self._inode = self._snapshot = None
+            return None
+        if inode != self._inode:
+            try:
+                with open(self.path, "rb") as f:
+                    inode = os.fstat(f.fileno()).st_ino
+                    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                return None
+            epoch, generation, published_at, expires_at = HEADER.unpack_from(mapping)
+            # The old mapping is released once no caller holds its payload anymore
+            self._snapshot = Snapshot(epoch.decode(), generation, published_at, expires_at,
+                                      memoryview(mapping)[HEADER.size:])
+            self._inode = inode
+        return self._snapshot
+
+    def publish(self, payload: bytes) -> Snapshot:
+        current = self.read()
+        if current is None:
+            epoch, generation = secrets.token_hex(4), 1
+        elif current.payload == payload:
+            epoch, generation = current.epoch, current.generation
+        else:
+            epoch, generation = current.epoch, current.generation + 1
+        now = time.time()
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(HEADER.pack(epoch.encode(), generation, now, now + self.ttl))
+            f.write(payload)
+        os.replace(temp, self.path)
+        return self.read()
+
+    def invalidate(self):
+        """Drop the entry; the next read fetches again, under a new epoch."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _try_lock(self) -> bool:
+        if self._refreshing:
+            return False
+        if fcntl is not None:
+            if self._lock_file is None:
+                self._lock_file = open(self.path + ".lock", "a+")
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        self._refreshing = True
+        return True
+
+    def _unlock(self):
+        self._refreshing = False
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    async def get(self, fetch: Callable[[], Awaitable[bytes]]) -> Snapshot:
+        """A fresh snapshot if there is one, else refresh it here or in another worker."""
+        snapshot = self.read()
+        if snapshot is not None and snapshot.expires_at > time.time():
+            self.hits += 1
+            return snapshot
+
+        if self._try_lock():
+            try:
+                # Another worker may have published while we took the lock
+                latest = self.read()
+                if latest is not None and latest.expires_at > time.time():
+                    self.hits += 1
+                    return latest
+                self.fetches += 1
+                return self.publish(await fetch())
+            finally:
+                self._unlock()
+
+        if snapshot is not None:
+            # Someone else is refreshing: serve what we have meanwhile
+            self.stale_hits += 1
+            return snapshot
+
+        self.waits += 1
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            snapshot = self.read()
+            if snapshot is not None:
+                return snapshot
+        # The refreshing worker is stuck; fetch without it
+        self.fetches += 1
+        return self.publish(await fetch())
+
+    async def refresh(self, fetch: Callable[[], Awaitable[bytes]], min_age: float = 0.0) -> bool:
+        """
+        Refetch ahead of expiry (prefetching). Skipped when another worker
+        is refreshing or has published within the last min_age seconds.
+        """
+        snapshot = self.read()
+        if snapshot is not None and time.time() - snapshot.published_at < min_age:
+            return False
+        if not self._try_lock():
+            return False
+        try:
+            latest = self.read()
+            if latest is not None and time.time() - latest.published_at < min_age:
+                return False
+            self.fetches += 1
+            self.publish(await fetch())
+            return True
+        finally:
+            self._unlock()
+
+    def stats(self) -> dict:
+        snapshot = self.read()
+        return {
+            "path": self.path,
+            "version": snapshot.version if snapshot else None,
+            "bytes": len(snapshot.payload) if snapshot else 0,
+            "age": round(time.time() - snapshot.published_at, 3) if snapshot else None,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "fetches": self.fetches,
+            "waits": self.waits
+        }
@@ -0,0 +1,226 @@
+"""
+In-memory spatial index for moving points (delivery partner locations).
+
+A uniform lat/lng grid over flat arrays: each tracked key owns a slot in
+parallel `array('d')` columns for latitude, longitude and update time,
+and each grid cell holds a short list of slots. Updates overwrite the
+slot in place and only touch cell lists when a point crosses a cell
+boundary, so one GPS fix per second per partner is cheap and the memory
+per partner is a few dozen bytes plus the key.
+"""
+
+from array import array
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+import heapq
+import math
+import time
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def valid_coordinates(lat: float, lng: float) -> bool:
+    return math.isfinite(lat) and math.isfinite(lng) and -90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0
+
+
+class GridIndex:
+    # nearest() searches at most this many rings (64 km at the default 0.5 km cells);
+    # larger radii fall back to one pass over every point instead
+    MAX_RINGS = 128
+
+    def __init__(self, cell_km: float = 0.5, stale_after: Optional[float] = None):
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        # Fixes older than this many seconds are ignored by queries
+        self.stale_after = stale_after
+        self.lats = array("d")
+        self.lngs = array("d")
+        self.updated = array("d")
+        self.cell_of = array("q")
+        self.keys: List[Optional[Hashable]] = []
+        self.slot_of: Dict[Hashable, int] = {}
+        self.free: List[int] = []
+        self.cells: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.slot_of
+
+    def _cell_xy(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    @staticmethod
+    def _cell_key(x: int, y: int) -> int:
+        return (x << 32) ^ (y & 0xFFFFFFFF)
+
+    def upsert(self, key: Hashable, lat: float, lng: float, now: Optional[float] = None):
+        # Checked before any column is touched, so a bad fix cannot desync them
+        if not valid_coordinates(lat, lng):
+            raise ValueError(f"Invalid coordinates: {lat}, {lng}")
+        now = time.monotonic() if now is None else now
+        cell = self._cell_key(*self._cell_xy(lat, lng))
+        slot = self.slot_of.get(key)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.lats[slot], self.lngs[slot], self.updated[slot] = lat, lng, now
+                self.cell_of[slot] = cell
+                self.keys[slot] = key
+            else:
+                slot = len(self.keys)
+                self.lats.append(lat)
+                self.lngs.append(lng)
+                self.updated.append(now)
+                self.cell_of.append(cell)
+                self.keys.append(key)
+            self.slot_of[key] = slot
+            self.cells.setdefault(cell, []).append(slot)
+            return
+
+        self.lats[slot], self.lngs[slot], self.updated[slot] = lat, lng, now
+        old_cell = self.cell_of[slot]
+        if old_cell != cell:
+            self._unlink(old_cell, slot)
+            self.cell_of[slot] = cell
+            self.cells.setdefault(cell, []).append(slot)
+
+    def _unlink(self, cell: int, slot: int):
+        members = self.cells[cell]
+        members.remove(slot)
+        if not members:
+            del self.cells[cell]
+
+    def remove(self, key: Hashable) -> bool:
+        slot = self.slot_of.pop(key, None)
+        if slot is None:
+            return False
+        self._unlink(self.cell_of[slot], slot)
+        self.keys[slot] = None
+        self.free.append(slot)
+        return True
+
+    def get(self, key: Hashable) -> Optional[Tuple[float, float, float]]:
+        slot = self.slot_of.get(key)
+        if slot is None:
+            return None
+        return self.lats[slot], self.lngs[slot], self.updated[slot]
+
+    def position(self, key: Hashable) -> Optional[Tuple[float, float]]:
+        """Current (lat, lng) for key, or None if unknown or stale."""
+        slot = self.slot_of.get(key)
+        if slot is None or self.updated[slot] < self._cutoff():
+            return None
+        return self.lats[slot], self.lngs[slot]
+
+    def items(self) -> Iterator[Tuple[Hashable, float, float]]:
+        for key, slot in self.slot_of.items():
+            yield key, self.lats[slot], self.lngs[slot]
+
+    def evict_stale(self, now: Optional[float] = None) -> int:
+        if self.stale_after is None:
+            return 0
+        cutoff = (time.monotonic() if now is None else now) - self.stale_after
+        stale = [key for key, slot in self.slot_of.items() if self.updated[slot] < cutoff]
+        for key in stale:
+            self.remove(key)
+        return len(stale)
+
+    # ------------------ Queries ------------------
+
+    def _scan(self, lat: float, lng: float, x0: int, x1: int, y0: int, y1: int,
+              max_km: float, cutoff: float, found: list):
+        lats, lngs, updated, keys, cells = self.lats, self.lngs, self.updated, self.keys, self.cells
+        cos_lat = math.cos(math.radians(lat))
+        cell_key = self._cell_key
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                members = cells.get(cell_key(x, y))
+                if not members:
+                    continue
+                for slot in members:
+                    if updated[slot] < cutoff:
+                        continue
+                    dx = (lngs[slot] - lng) * cos_lat
+                    dy = lats[slot] - lat
+                    d = KM_PER_DEGREE * math.sqrt(dx * dx + dy * dy)
+                    if d <= max_km:
+                        found.append((d, keys[slot]))
+
+    def _scan_all(self, lat: float, lng: float, max_km: float, cutoff: float, found: list):
+        lats, lngs, updated, keys = self.lats, self.lngs, self.updated, self.keys
+        cos_lat = math.cos(math.radians(lat))
+        for slot in self.slot_of.values():
+            if updated[slot] < cutoff:
+                continue
+            dx = (lngs[slot] - lng) * cos_lat
+            dy = lats[slot] - lat
+            d = KM_PER_DEGREE * math.sqrt(dx * dx + dy * dy)
+            if d <= max_km:
+                found.append((d, keys[slot]))
+
+    def _cutoff(self) -> float:
+        return -math.inf if self.stale_after is None else time.monotonic() - self.stale_after
+
+    def within(self, lat: float, lng: float, radius_km: float) -> List[Tuple[float, Hashable]]:
+        """(distance_km, key) for every point within radius_km, nearest first."""
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        dlat = radius_km / KM_PER_DEGREE
+        dlng = dlat / cos_lat
+        x0, _ = self._cell_xy(lat - dlat, lng)
+        x1, _ = self._cell_xy(lat + dlat, lng)
+        _, y0 = self._cell_xy(lat, lng - dlng)
+        _, y1 = self._cell_xy(lat, lng + dlng)
+        found: List[Tuple[float, Hashable]] = []
+        self._scan(lat, lng, x0, x1, y0, y1, radius_km, self._cutoff(), found)
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearest(self, lat: float, lng: float, k: int,
+                max_km: float = 25.0) -> List[Tuple[float, Hashable]]:
+        """Up to k (distance_km, key) pairs, nearest first, searching ring by ring."""
+        if k <= 0 or not self.slot_of:
+            return []
+        cx, cy = self._cell_xy(lat, lng)
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        # Anything outside ring r is at least r cells away along one axis
+        ring_km = self.cell_deg * KM_PER_DEGREE * cos_lat
+        needed = int(math.ceil(max_km / ring_km)) + 1
+        max_ring = min(needed, self.MAX_RINGS)
+        cutoff = self._cutoff()
+        found: List[Tuple[float, Hashable]] = []
+        if needed > max_ring and len(self.slot_of) < (2 * max_ring + 1) ** 2:
+            # Fewer points than cells in MAX_RINGS rings: one pass over the points is cheaper
+            self._scan_all(lat, lng, max_km, cutoff, found)
+            return heapq.nsmallest(k, found, key=lambda item: item[0])
+        for ring in range(max_ring + 1):
+            if ring == 0:
+                self._scan(lat, lng, cx, cx, cy, cy, max_km, cutoff, found)
+            else:
+                # Top and bottom rows, then the left and right columns
+                self._scan(lat, lng, cx - ring, cx - ring, cy - ring, cy + ring, max_km, cutoff, found)
+                self._scan(lat, lng, cx + ring, cx + ring, cy - ring, cy + ring, max_km, cutoff, found)
+                self._scan(lat, lng, cx - ring + 1, cx + ring - 1, cy - ring, cy - ring, max_km, cutoff, found)
+                self._scan(lat, lng, cx - ring + 1, cx + ring - 1, cy + ring, cy + ring, max_km, cutoff, found)
+            if len(found) >= k:
+                best = heapq.nsmallest(k, found, key=lambda item: item[0])
+                if best[-1][0] <= ring * ring_km:
+                    return best
+        if needed > max_ring:
+            # Not settled within MAX_RINGS: one pass over every point beats more rings
+            found = []
+            self._scan_all(lat, lng, max_km, cutoff, found)
+        return heapq.nsmallest(k, found, key=lambda item: item[0])
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the array columns and cell lists (excluding keys)."""
+        columns = sum(a.itemsize * len(a) for a in (self.lats, self.lngs, self.updated, self.cell_of))
+        return columns + 8 * (len(self.keys) + sum(len(m) for m in self.cells.values()))
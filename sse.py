@@ -0,0 +1,135 @@
+"""
+Server-Sent Events fan-out for per-order status streams.
+
+Each open stream is just a bounded queue registered under its order id;
+one shared task writes keep-alive comments to all of them, so thousands
+of idle streams cost a coroutine and a queue each and no timers.
+"""
+
+from typing import AsyncIterator, Dict, Optional, Set
+import asyncio
+import json
+import os
+
+from event_log import EventLog
+
+KEEPALIVE = b": keep-alive\n\n"
+_CLOSE = object()
+
+
+def format_event(seq: int, event_type: str, data: str) -> bytes:
+    return f"id: {seq}\nevent: {event_type}\ndata: {data}\n\n".encode()
+
+
+class SSEStream:
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.wrote_since_tick = False
+
+    def offer(self, chunk) -> bool:
+        try:
+            self.queue.put_nowait(chunk)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+
+class SSEBroker:
+    def __init__(self, events: EventLog, keepalive_interval: Optional[float] = None,
+                 queue_size: int = 64):
+        self.events = events
+        self.keepalive_interval = keepalive_interval if keepalive_interval is not None else float(
+            os.getenv("SSE_KEEPALIVE_INTERVAL", "15"))
+        self.queue_size = queue_size
+        self.streams: Dict[str, Set[SSEStream]] = {}
+        self.dropped = 0
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    def publish(self, key: str, seq: int, event_type: str, frame: str):
+        """Push an already sequenced EventLog frame to every stream for key."""
+        streams = self.streams.get(key)
+        if not streams:
+            return
+        chunk = format_event(seq, event_type, frame)
+        for stream in list(streams):
+            stream.wrote_since_tick = True
+            if not stream.offer(chunk):
+                # Slow consumer: end the stream, the client resumes with Last-Event-ID
+                self.dropped += 1
+                self._close(key, stream)
+
+    def _close(self, key: str, stream: SSEStream):
+        self._discard(key, stream)
+        while not stream.queue.empty():
+            stream.queue.get_nowait()
+        stream.queue.put_nowait(_CLOSE)
+
+    def _discard(self, key: str, stream: SSEStream):
+        streams = self.streams.get(key)
+        if streams is not None:
+            streams.discard(stream)
+            if not streams:
+                del self.streams[key]
+
+    async def stream(self, key: str, last_event_id: Optional[int] = None) -> AsyncIterator[bytes]:
+        stream = SSEStream(self.queue_size)
+        self.streams.setdefault(key, set()).add(stream)
+        self._ensure_keepalive()
+        try:
+            yield b"retry: 3000\n\n"
+            if last_event_id is not None:
+                missed = self.events.since(key, last_event_id)
+                if missed is None:
+                    latest = self.events.latest(key)
+                    yield format_event(latest, "resync", json.dumps({"last_seq": latest}))
+                    self._skip_replayed(stream, latest)
+                else:
+                    # Live events published meanwhile are already queued after these
+                    for seq, frame in missed:
+                        yield format_event(seq, json.loads(frame).get("type", "message"), frame)
+                    replayed = missed[-1][0] if missed else last_event_id
+                    self._skip_replayed(stream, replayed)
+            while True:
+                chunk = await stream.queue.get()
+                if chunk is _CLOSE:
+                    break
+                yield chunk
+        finally:
+            self._discard(key, stream)
+
+    @staticmethod
+    def _skip_replayed(stream: SSEStream, replayed: int):
+        kept = []
+        while not stream.queue.empty():
+            chunk = stream.queue.get_nowait()
+            if chunk is KEEPALIVE or chunk is _CLOSE or int(chunk.split(b"\n", 1)[0][4:]) > replayed:
+                kept.append(chunk)
+        for chunk in kept:
+            stream.queue.put_nowait(chunk)
+
+    def _ensure_keepalive(self):
+        loop = asyncio.get_running_loop()
+        task = self._keepalive_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._keepalive_task = loop.create_task(self._keepalive_loop())
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            self.keepalive_tick()
+
+    def keepalive_tick(self):
+        """Comment only the streams that had no event since the last tick."""
+        for streams in list(self.streams.values()):
+            for stream in list(streams):
+                if stream.wrote_since_tick:
+                    stream.wrote_since_tick = False
+                else:
+                    stream.offer(KEEPALIVE)
+
+    def stats(self) -> dict:
+        return {
+            "orders": len(self.streams),
+            "streams": sum(len(streams) for streams in self.streams.values()),
+            "dropped_slow_streams": self.dropped
+        }
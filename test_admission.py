@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Admission control: token buckets, priority shedding and 429 responses.
+Run with: python -m pytest test_admission.py
+"""
+
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import fake_appscript
+import main
+from admission import CRITICAL, LOW, NORMAL, AdmissionController, AdmissionMiddleware, TokenBuckets, worker_count
+
+
+def test_token_bucket_burst_and_refill():
+    buckets = TokenBuckets(rate=2, burst=3, max_keys=2)
+    assert [buckets.acquire("a", now=0) for _ in range(3)] == [0, 0, 0]
+    assert buckets.acquire("a", now=0) == 0.5
+    assert buckets.acquire("a", now=0.5) == 0
+    assert buckets.acquire("b", now=0) == 0
+    buckets.acquire("c", now=0)
+    assert list(buckets.buckets) == ["b", "c"] and buckets.rejected == 1
+
+
+def test_low_priority_is_shed_first():
+    controller = AdmissionController(max_inflight=10)
+    assert sum(controller.try_enter("available_orders", LOW) for _ in range(8)) == 5
+    assert sum(controller.try_enter("create_order", NORMAL) for _ in range(5)) == 3
+    assert sum(controller.try_enter("accept_order", CRITICAL) for _ in range(5)) == 2
+    assert controller.shed == {CRITICAL: 3, NORMAL: 2, LOW: 3}
+    controller.leave("available_orders")
+    assert not controller.try_enter("available_orders", LOW)
+    assert controller.try_enter("accept_order", CRITICAL)
+
+
+def test_middleware_sheds_polling_but_admits_accepts():
+    app = FastAPI()
+    controller = AdmissionController(max_inflight=4)
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    @app.get("/orders/available")
+    async def available():
+        await asyncio.sleep(0.05)
+        return []
+
+    @app.post("/orders/{order_id}/accept")
+    async def accept(order_id: str):
+        await asyncio.sleep(0.05)
+        return {"id": order_id}
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            polls = [client.get("/orders/available") for _ in range(4)]
+            accepts = [client.post(f"/orders/o{i}/accept") for i in range(2)]
+            return await asyncio.gather(*polls, *accepts)
+
+    responses = asyncio.run(run())
+    assert [r.status_code for r in responses] == [200, 200, 429, 429, 200, 200]
+    assert responses[2].headers["retry-after"] == "1"
+    assert controller.total_inflight == 0
+
+
+def test_shed_requests_carry_cors_headers(monkeypatch):
+    monkeypatch.setattr(main.admission, "enabled", True)
+    monkeypatch.setattr(main.admission, "try_enter", lambda name, priority: False)
+    response = TestClient(main.app).get("/orders/available", headers={"Origin": "https://app.example"})
+    assert response.status_code == 429
+    assert response.headers["access-control-allow-origin"] in ("*", "https://app.example")
+    assert "retry-after" in response.headers["access-control-expose-headers"].lower()
+
+
+def test_otp_sends_limited_per_phone():
+    main.use_appscript_transport(
+        httpx.ASGITransport(app=fake_appscript.app), "http://appscript.local/exec")
+    fake_appscript.configure()
+    client = TestClient(main.app)
+    login = {"phone": "9000000041", "role": "customer"}
+    codes = [client.post("/login/send_otp", json=login).status_code for _ in range(4)]
+    assert codes == [200, 200, 200, 429]
+    response = client.post("/login/send_otp", json=login)
+    assert int(response.headers["retry-after"]) > 0
+    assert client.post("/login/send_otp", json=dict(login, phone="9000000042")).status_code == 200
+    assert main.admission.stats()["rate_limited"]["phone"] >= 2
+
+
+def test_worker_count_follows_uvicorn(monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.delenv("ADMISSION_WORKERS", raising=False)
+    assert worker_count(["uvicorn", "main:app", "--workers", "4"]) == 4
+    assert worker_count(["uvicorn", "main:app", "--workers=3"]) == 3
+    assert worker_count(["uvicorn", "main:app"]) == 1
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert worker_count(["uvicorn", "main:app"]) == 4
+    # Each of 4 workers enforces a quarter of the per-phone OTP rate
+    assert AdmissionController().limits["phone"].rate == AdmissionController(workers=1).limits["phone"].rate / 4
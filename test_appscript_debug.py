@@ -6,8 +6,12 @@ Debug script to test Apps Script OTP storage directly
 import asyncio
 import httpx
 import json
+import os
 
-APP_SCRIPT_URL = "https://script.google.com/macros/s/AKfycbz8ccNA3R_9vfq6KvyuAHvsNb7FpoAV0nJi_pJuYHhZqNEBeedHfMTC5iLxvNdEQvm1/exec"
+APP_SCRIPT_URL = os.getenv(
+    "APP_SCRIPT_URL",
+    "https://script.google.com/macros/s/AKfycbz8ccNA3R_9vfq6KvyuAHvsNb7FpoAV0nJi_pJuYHhZqNEBeedHfMTC5iLxvNdEQvm1/exec"
+)
 
 
 async def test_appscript_otp():
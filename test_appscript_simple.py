@@ -5,8 +5,12 @@ Simple test to check if the Apps Script is accessible
 
 import requests
 import json
+import os
 
-APP_SCRIPT_URL = "https://script.google.com/macros/s/AKfycbz8ccNA3R_9vfq6KvyuAHvsNb7FpoAV0nJi_pJuYHhZqNEBeedHfMTC5iLxvNdEQvm1/exec"
+APP_SCRIPT_URL = os.getenv(
+    "APP_SCRIPT_URL",
+    "https://script.google.com/macros/s/AKfycbz8ccNA3R_9vfq6KvyuAHvsNb7FpoAV0nJi_pJuYHhZqNEBeedHfMTC5iLxvNdEQvm1/exec"
+)
 
 
 def test_basic_access():
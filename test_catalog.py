@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Catalog index search and the /items/nearby parameters.
+Run with: python -m pytest test_catalog.py
+"""
+
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+
+import coldstart
+import fake_appscript
+import main
+from catalog import CatalogIndex, CatalogService
+
+GROCERY = {"store_name": "Local Grocery", "store_lat": 13.0827, "store_lng": 80.2707}
+PHARMACY = {"store_name": "Pharmacy", "store_lat": 13.0604, "store_lng": 80.2496}
+BAKERY = {"store_name": "Bakery", "store_lat": 12.9000, "store_lng": 80.2000}
+
+ITEMS = [
+    {"id": "1", "name": "Carrot", "price": 10.0, **GROCERY},
+    {"id": "2", "name": "Aspirin 500mg", "price": 50.0, **PHARMACY},
+    {"id": "3", "name": "Baby Carrots", "price": 30.0, **GROCERY},
+    {"id": "4", "name": "Carrot Cake", "price": 120.0, **BAKERY},
+    {"id": "5", "name": "Cough Syrup", "price": 80.0, **PHARMACY},
+    {"id": "6", "name": "Carrot Juice", "price": 40.0, "store_name": "Somewhere"},
+]
+
+
+def ids(items):
+    return [item["id"] for item in items]
+
+
+def test_prefix_search_and_relevance():
+    index = CatalogIndex(ITEMS)
+    assert ids(index.search("carrot")) == ["1", "4", "6", "3"]
+    assert ids(index.search("carrot cak")) == ["4"]
+    assert ids(index.search("CARR", store="local grocery")) == ["1", "3"]
+    assert index.search("zucchini") == []
+
+
+def test_price_range_sort_and_paging():
+    index = CatalogIndex(ITEMS)
+    assert ids(index.search(min_price=30, max_price=80, sort="price_asc")) == ["3", "6", "2", "5"]
+    assert ids(index.search(sort="price_desc", limit=2)) == ["4", "5"]
+    assert ids(index.search(store="pharmacy", sort="name")) == ["2", "5"]
+    assert ids(index.search("carrot", max_price=50, sort="price_desc")) == ["6", "3", "1"]
+    assert ids(index.search(limit=2, offset=3)) == ["4", "5"]
+    assert index.stores() == {"Local Grocery": 2, "Pharmacy": 2, "Bakery": 1, "Somewhere": 1}
+
+
+def test_location_query_ranks_by_store_distance():
+    index = CatalogIndex(ITEMS)
+    # Next to the pharmacy; grocery is ~3.3 km away, bakery ~18 km, "Somewhere" has no coordinates
+    found = index.search(lat=13.0600, lng=80.2500, radius_km=5)
+    assert ids(found) == ["2", "5", "1", "3"]
+    assert found[0]["distance_km"] < 0.1 < 3 < found[2]["distance_km"] < 4
+    assert "distance_km" not in ITEMS[1]
+    assert ids(index.search("carrot", lat=13.0600, lng=80.2500, radius_km=30)) == ["1", "3", "4"]
+    assert ids(index.search(lat=13.0600, lng=80.2500, radius_km=5, sort="price_desc")) == ["5", "2", "3", "1"]
+    assert index.search(lat=0.0, lng=0.0) == []
+
+
+def test_concurrent_first_requests_share_one_fetch():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ITEMS
+
+    async def run():
+        service = CatalogService(fetch, refresh_interval=3600)
+        indexes = await asyncio.gather(*(service.current() for _ in range(5)))
+        assert len(calls) == 1 and all(index is indexes[0] for index in indexes)
+        service._task.cancel()
+
+    asyncio.run(run())
+
+
+def test_items_endpoint_parameters():
+    main.use_appscript_transport(
+        httpx.ASGITransport(app=fake_appscript.app), "http://appscript.local/exec")
+    fake_appscript.configure()
+    fake_appscript.sheets.reset()
+    fake_appscript.sheets.items = [dict(item) for item in ITEMS]
+    main.catalog.clear()
+    client = TestClient(main.app)
+
+    assert len(client.get("/items/nearby").json()) == len(ITEMS)
+    response = client.get("/items/nearby", params={"q": "carrot", "sort": "price_asc", "limit": 2})
+    assert ids(response.json()) == ["1", "3"]
+    assert client.get("/items/nearby", params={"sort": "random"}).status_code == 400
+    assert client.get("/items/stores").json()["Pharmacy"] == 2
+    nearby = client.get("/items/nearby", params={"lat": 13.06, "lng": 80.25, "radius": 1}).json()
+    assert ids(nearby) == ["2", "5"] and nearby[0]["store_lat"] == 13.0604
+    assert client.get("/items/nearby", params={"lat": 13.06}).status_code == 400
+
+    full = client.get("/items/nearby")
+    etag = full.headers["etag"]
+    assert client.get("/items/nearby", headers={"If-None-Match": etag}).status_code == 304
+    # Compressed responses carry the weak form of the same tag
+    assert client.get("/items/nearby", headers={"If-None-Match": "W/" + etag}).status_code == 304
+    filtered = client.get("/items/nearby", params={"q": "carrot"})
+    assert filtered.headers["etag"] != etag
+
+    changes = client.get("/items/changes").json()
+    assert changes["full"] and len(changes["items"]) == len(ITEMS)
+    changes = client.get("/items/changes", params={"since": changes["version"]}).json()
+    assert changes == {"version": etag.strip('"'), "full": False, "upserts": [], "deletes": []}
+
+
+def test_bundled_snapshot_serves_until_refresh(tmp_path):
+    path = str(tmp_path / "catalog_snapshot.json")
+    coldstart.write_catalog_snapshot(ITEMS[:2], path)
+    items, taken_at = coldstart.load_catalog_snapshot(path)
+    assert coldstart.load_catalog_snapshot(str(tmp_path / "missing.json")) is None
+
+    fetched = asyncio.Event()
+
+    async def fetch():
+        fetched.set()
+        return ITEMS
+
+    async def run():
+        service = CatalogService(fetch, refresh_interval=60)
+        service.load_snapshot(items, taken_at - 120)
+        # Served without waiting for the backend; the stale snapshot is refreshed at once
+        assert len(await service.current()) == 2
+        await asyncio.wait_for(fetched.wait(), 1)
+        await asyncio.sleep(0)
+        assert len(await service.current()) == len(ITEMS)
+        assert ids(service.changes_since(f"{service.epoch}.1")[0]) == ids(ITEMS[2:])
+        service._task.cancel()
+
+    asyncio.run(run())
+
+
+def test_changes_since_versions():
+    catalog_items = [dict(item) for item in ITEMS]
+
+    async def fetch():
+        return [dict(item) for item in catalog_items]
+
+    async def run():
+        service = CatalogService(fetch, refresh_interval=3600, max_logged_changes=4)
+        first = (await service.current()).version
+        assert service.changes_since(first) == ([], [])
+        assert service.changes_since(None) is None
+        assert service.changes_since("other-epoch.1") is None
+
+        await service.refresh()
+        assert service.version == first   # unchanged catalog keeps its version
+
+        catalog_items[0]["price"] = 12.0
+        del catalog_items[1]
+        await service.refresh()
+        second = service.version
+        upserts, deletes = service.changes_since(first)
+        assert ids(upserts) == ["1"] and deletes == ["2"]
+
+        catalog_items.append({"id": "7", "name": "Ginger", "price": 5.0, "store_name": "Local Grocery"})
+        catalog_items[0]["price"] = 11.0
+        await service.refresh()
+        upserts, deletes = service.changes_since(first)
+        assert ids(upserts) == ["1", "7"] and upserts[0]["price"] == 11.0 and deletes == ["2"]
+        assert ids(service.changes_since(second)[0]) == ["1", "7"]
+
+        # Log holds 4 changes: the first refresh's entries fall out
+        catalog_items[2]["name"] = "Carrot Cupcake"
+        await service.refresh()
+        assert service.changes_since(first) is None
+        assert ids(service.changes_since(second)[0]) == ["1", "7", "4"]
+        assert service.changes_since(service.version.split(".")[0] + ".99") is None
+        service._task.cancel()
+
+    asyncio.run(run())
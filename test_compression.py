@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Compression middleware: thresholds, codings and streamed (SSE) bodies.
+Run with: python -m pytest test_compression.py
+"""
+
+import asyncio
+import zlib
+
+import brotli
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from compression import CompressionMiddleware
+
+LARGE = [{"customerId": f"c{i}", "items": [{"unit": "kg", "price": 10.0}]} for i in range(200)]
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=500, gzip_level=6, brotli_quality=4)
+
+
+@app.get("/large")
+async def large():
+    return JSONResponse(LARGE, headers={"ETag": '"v1"'})
+
+
+@app.get("/small")
+async def small():
+    return {"ok": True}
+
+
+@app.get("/text")
+async def text():
+    return PlainTextResponse("x" * 2000, headers={"Content-Encoding": "identity"})
+
+
+@app.get("/events")
+async def events():
+    async def stream():
+        for i in range(3):
+            yield f"id: {i}\nevent: order_update\ndata: {{}}\n\n".encode()
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def call(path: str, accept_encoding: str):
+    """Raw ASGI call, so nothing decodes the body for us."""
+    messages = []
+    requested = []
+
+    async def receive():
+        if not requested:
+            requested.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Client stays connected until the response is done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "raw_path": path.encode(),
+             "query_string": b"", "root_path": "", "scheme": "http", "http_version": "1.1",
+             "server": ("test", 80), "client": ("test", 1),
+             "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(app(scope, receive, send))
+    headers = {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+    return headers, [m.get("body", b"") for m in messages[1:]]
+
+
+def test_accept_encoding_preference():
+    middleware = CompressionMiddleware(None, minimum_size=0)
+    assert middleware.choose("gzip, deflate, br") == "br"
+    assert middleware.choose("gzip, br;q=0.5") == "gzip"
+    assert middleware.choose("*") == "br"
+    assert middleware.choose("gzip;q=0, br;q=0") is None
+    assert middleware.choose("") is None
+
+
+def test_large_json_gzip_and_brotli():
+    headers, chunks = call("/large", "gzip")
+    body = b"".join(chunks)
+    assert headers["content-encoding"] == "gzip" and headers["vary"] == "Accept-Encoding"
+    assert headers["etag"] == 'W/"v1"' and int(headers["content-length"]) == len(body)
+    raw = zlib.decompress(body, 31)
+    assert len(body) < len(raw) / 5
+
+    headers, chunks = call("/large", "gzip, br")
+    assert headers["content-encoding"] == "br"
+    assert brotli.decompress(b"".join(chunks)) == raw
+
+
+def test_small_and_already_encoded_bodies_pass_through():
+    headers, chunks = call("/small", "gzip")
+    assert "content-encoding" not in headers and chunks == [b'{"ok":true}']
+    headers, chunks = call("/text", "gzip")
+    assert headers["content-encoding"] == "identity" and chunks == [b"x" * 2000]
+    headers, _ = call("/large", "identity")
+    assert "content-encoding" not in headers
+    # Uncompressed, but a cache must still key it on Accept-Encoding
+    assert headers["vary"] == "Accept-Encoding"
+    assert call("/small", "gzip")[0]["vary"] == "Accept-Encoding"
+    assert "vary" not in call("/text", "gzip")[0]
+
+
+def test_streamed_events_are_flushed_per_chunk():
+    headers, chunks = call("/events", "gzip")
+    assert headers["content-encoding"] == "gzip" and "content-length" not in headers
+    decoder = zlib.decompressobj(31)
+    # Each event decodes as soon as its chunk arrives
+    for i, chunk in enumerate(chunks[:3]):
+        assert decoder.decompress(chunk) == f"id: {i}\nevent: order_update\ndata: {{}}\n\n".encode()
+    assert decoder.decompress(b"".join(chunks[3:])) == b"" and decoder.eof
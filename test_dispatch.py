@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Batch dispatch solvers and offer lifecycle.
+Run with: python -m pytest test_dispatch.py
+"""
+
+import asyncio
+import itertools
+import random
+
+from dispatch import DispatchConfig, Dispatcher, auction, build_candidates, hungarian, plan_window, solve
+from eta import EtaModel
+from spatial_index import haversine_km
+
+
+def brute_force(cost):
+    n, m = len(cost), len(cost[0])
+    return min(sum(cost[i][j] for i, j in enumerate(perm))
+               for perm in itertools.permutations(range(m), n))
+
+
+def test_hungarian_matches_brute_force():
+    rng = random.Random(1)
+    for n, m in [(3, 3), (4, 6), (5, 5)]:
+        cost = [[rng.uniform(0, 10) for _ in range(m)] for _ in range(n)]
+        result = hungarian(cost)
+        assert len(set(result)) == n
+        assert abs(sum(cost[i][j] for i, j in enumerate(result)) - brute_force(cost)) < 1e-9
+
+
+def test_hungarian_more_rows_than_columns():
+    result = hungarian([[1, 9], [9, 1], [5, 5]])
+    assert result[0] == 0 and result[1] == 1 and result[2] == -1
+
+
+def test_auction_leaves_orders_unassigned_when_partners_scarce():
+    candidates = [[(0, 1.0)], [(0, 2.0)], [(0, 3.0), (1, 4.0)]]
+    assert auction(candidates, 2, unassigned_cost=10.0) == [0, -1, 1]
+
+
+def test_solve_respects_candidate_lists():
+    config = DispatchConfig(dense_limit=0)
+    assert solve([[(1, 0.5)], []], 2, config) == [1, -1]
+    config = DispatchConfig(dense_limit=100)
+    assert solve([[(1, 0.5)], []], 2, config) == [1, -1]
+
+
+def test_eta_costs_keep_partners_inside_the_radius():
+    config = DispatchConfig()
+    order, partner = (13.0, 80.0), (13.08, 80.0)
+    distance = haversine_km(*order, *partner)
+    assert 8.5 < distance < config.max_radius_km
+    eta = EtaModel()
+    [[(_, cost)]] = build_candidates([order], [partner], [0.0], config, eta)
+    # Cell-centre distances: within a cell of the straight line, not 1.3x it
+    assert abs(cost - distance) < eta.cell_km and cost < config.unassigned_cost
+    assert plan_window([order], [set()], ["p1"], [partner], [0.0], config, eta) == [0]
+
+
+def make_dispatcher(positions, **overrides):
+    offers, rebroadcasts = [], []
+
+    async def send_offer(partner_id, order, timeout):
+        offers.append((partner_id, order["id"]))
+        return True
+
+    async def rebroadcast(order):
+        rebroadcasts.append(order["id"])
+
+    config = DispatchConfig(enabled=True, **overrides)
+    dispatcher = Dispatcher(config, send_offer, rebroadcast, lambda: positions)
+    return dispatcher, offers, rebroadcasts
+
+
+def test_window_offers_nearest_partner_then_expires_and_rebroadcasts():
+    async def run():
+        positions = {"near": (13.0830, 80.2710), "far": (13.1200, 80.2400)}
+        dispatcher, offers, rebroadcasts = make_dispatcher(
+            positions, offer_timeout=0, max_offers=2)
+        dispatcher.submit({"id": "o1"}, 13.0827, 80.2707)
+        dispatcher._task.cancel()
+
+        await dispatcher.run_window()
+        assert offers == [("near", "o1")]
+        assert dispatcher.offered_to("o1") == "near"
+
+        # Offer expired: requeued without the partner who let it lapse
+        await dispatcher.run_window()
+        assert offers[-1] == ("far", "o1")
+
+        await dispatcher.run_window()
+        assert rebroadcasts == ["o1"]
+        assert dispatcher.snapshot()["expired"] == 2
+
+    asyncio.run(run())
+
+
+def test_accept_and_decline():
+    async def run():
+        positions = {"p1": (13.0830, 80.2710), "p2": (13.0900, 80.2800)}
+        dispatcher, offers, _ = make_dispatcher(positions)
+        dispatcher.submit({"id": "o1"}, 13.0827, 80.2707)
+        dispatcher.submit({"id": "o2"}, 13.0901, 80.2801)
+        dispatcher._task.cancel()
+        await dispatcher.run_window()
+        assert sorted(offers) == [("p1", "o1"), ("p2", "o2")]
+
+        dispatcher.on_declined("o2", "p2")
+        assert "o2" in dispatcher.pending
+        dispatcher.on_accepted("o1", "p1")
+        assert "p1" in dispatcher.busy and dispatcher.offered_to("o1") is None
+
+        # p1 is busy and p2 declined o2, so nobody can take it this window
+        await dispatcher.run_window()
+        assert dispatcher.offered_to("o2") is None
+        dispatcher.partner_free("p1")
+        await dispatcher.run_window()
+        assert dispatcher.offered_to("o2") == "p1"
+
+    asyncio.run(run())
+
+
+def test_window_is_solved_off_the_event_loop(monkeypatch):
+    import dispatch
+    import time
+
+    def slow_plan(*args):
+        time.sleep(0.2)
+        return plan_window(*args)
+    plan_window = dispatch.plan_window
+    monkeypatch.setattr(dispatch, "plan_window", slow_plan)
+
+    async def run():
+        positions = {"p1": (13.0830, 80.2710), "p2": (13.0900, 80.2800)}
+        dispatcher, offers, _ = make_dispatcher(positions)
+        dispatcher.submit({"id": "o1"}, 13.0827, 80.2707)
+        dispatcher.submit({"id": "o2"}, 13.0901, 80.2801)
+        dispatcher._task.cancel()
+
+        window = asyncio.ensure_future(dispatcher.run_window())
+        await asyncio.sleep(0.05)
+        # The loop keeps serving while solving; an accept meanwhile wins over the plan
+        assert not window.done()
+        dispatcher.on_accepted("o1", "p1")
+        await window
+        assert offers == [("p2", "o2")]
+
+    asyncio.run(run())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Cached grid ETA model and delivery tracker.
+Run with: python -m pytest test_eta.py
+"""
+
+import math
+
+from eta import DeliveryTracker, EtaModel
+from spatial_index import haversine_km
+
+
+def test_minutes_cached_per_cell_pair():
+    model = EtaModel(cell_km=0.5, default_kmh=20, detour=1.0, fixed_minutes=0)
+    far = model.minutes(13.00, 80.20, 13.09, 80.20)
+    assert math.isclose(far, 60 * haversine_km(13.00, 80.20, 13.09, 80.20) / 20, rel_tol=0.05)
+    # Another point in the same two cells is served from the cache
+    assert model.minutes(13.0001, 80.2001, 13.0901, 80.2001) == far
+    assert model.stats()["cache_hits"] == 1
+
+    # Short hops are measured directly, not from cell centres
+    near = model.minutes(13.0, 80.2, 13.001, 80.2)
+    assert math.isclose(near, 60 * haversine_km(13.0, 80.2, 13.001, 80.2) / 20, rel_tol=1e-9)
+    assert model.batch([(13.00, 80.20, 13.09, 80.20), (13.0, 80.2, 13.001, 80.2)]) == [far, near]
+
+
+def test_completed_trips_update_speeds_and_table_round_trips(tmp_path):
+    model = EtaModel(default_kmh=20, detour=1.0, fixed_minutes=0, learn_rate=0.5)
+    tracker = DeliveryTracker(model)
+    before = model.minutes(13.00, 80.20, 13.09, 80.20)
+
+    # 10 km in 15 minutes is 40 km/h, twice the default
+    tracker.created("o1", 13.09, 80.20)
+    tracker.accepted("o1", "p1", (13.00, 80.20), now=1000)
+    assert tracker.partner_of("o1") == "p1"
+    assert tracker.completed("o1", now=1000 + 60 * 60 * haversine_km(13.00, 80.20, 13.09, 80.20) / 40)
+    after = model.minutes(13.00, 80.20, 13.09, 80.20)
+    assert math.isclose(after, before * 20 / 30, rel_tol=0.01)
+    assert tracker.eta_minutes("o1", (13.0, 80.2)) is None
+
+    # Implausible trips are ignored
+    tracker.created("o2", 13.09, 80.20)
+    tracker.accepted("o2", "p1", (13.00, 80.20), now=0)
+    assert not tracker.completed("o2", now=5)
+
+    path = tmp_path / "speeds.json"
+    model.save_table(str(path))
+    loaded = EtaModel(detour=1.0, fixed_minutes=0)
+    loaded.load_table(str(path))
+    assert math.isclose(loaded.minutes(13.00, 80.20, 13.09, 80.20), after, rel_tol=1e-3)
+
+
+def test_dispatch_candidates_scored_by_eta():
+    from dispatch import DispatchConfig, build_candidates
+
+    config = DispatchConfig(idle_weight=0.0)
+    model = EtaModel(default_kmh=20, detour=1.0, fixed_minutes=2)
+    partners = [(13.02, 80.20), (13.00, 80.23)]
+    # The first partner's area is congested: 5 km/h instead of 20
+    model.cell_speeds[model.cell(*partners[0])] = 5.0
+    plain = dict(build_candidates([(13.0, 80.2)], partners, [0, 0], config)[0])
+    scored = dict(build_candidates([(13.0, 80.2)], partners, [0, 0], config, eta=model)[0])
+    assert plain[0] < plain[1]
+    assert scored[0] > scored[1]
+    # Cell-centre distance, within a cell diagonal of the exact one
+    assert abs(scored[1] - haversine_km(13.00, 80.23, 13.0, 80.2)) < 0.5
+
+
+def test_eta_goes_via_the_store_and_learns_each_leg():
+    model = EtaModel(default_kmh=20, detour=1.0, fixed_minutes=0, learn_rate=1.0)
+    tracker = DeliveryTracker(model)
+    start, store, home = (13.00, 80.20), (13.02, 80.20), (13.05, 80.20)
+    tracker.created("o1", *home, *store)
+    tracker.accepted("o1", "p1", start, now=0)
+
+    via_store = model.minutes(*start, *store) + model.minutes(*store, *home)
+    assert math.isclose(tracker.eta_minutes("o1", start), via_store)
+    # At the store, then on the way with the order
+    tracker.located("p1", store, now=400)
+    assert math.isclose(tracker.eta_minutes("o1", store), model.minutes(*store, *home))
+    tracker.located("p1", (13.0201, 80.20), now=700)   # still there after a 5 min wait
+    tracker.located("p1", (13.03, 80.20), now=800)
+    assert math.isclose(tracker.eta_minutes("o1", (13.03, 80.20)), model.minutes(13.03, 80.20, *home))
+    # Polling the ETA from the store later records nothing
+    tracker.eta_minutes("o1", store)
+    assert tracker.at_store["o1"] == [400, 700]
+
+    # 2.2 km to the store in 400 s and 3.3 km to the door in 600 s after leaving: about 20 km/h each
+    assert tracker.completed("o1", now=1300)
+    for leg in (start, store):
+        assert math.isclose(model.cell_speeds[model.cell(*leg)], 20, rel_tol=0.05)
+
+    # Without a handover fix the trip cannot be split, so nothing is learned
+    tracker.created("o2", *home, *store)
+    tracker.accepted("o2", "p1", start, now=0)
+    assert not tracker.completed("o2", now=1300)
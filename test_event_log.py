@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Sequenced customer notifications and resume-on-reconnect.
+Run with: python -m pytest test_event_log.py
+"""
+
+import asyncio
+import json
+
+from event_log import EventLog
+from main import ConnectionManager
+from ws_heartbeat import HeartbeatConfig
+from test_ws_heartbeat import StubWebSocket
+
+
+def test_sequence_and_since():
+    log = EventLog(capacity_per_user=3)
+    for i in range(5):
+        log.append("c1", {"type": "n", "i": i})
+    assert log.latest("c1") == 5
+    assert [seq for seq, _ in log.since("c1", 3)] == [4, 5]
+    assert json.loads(log.since("c1", 2)[0][1]) == {"type": "n", "i": 2, "seq": 3}
+    assert log.since("c1", 5) == []
+    assert log.since("c1", 1) is None      # evicted
+    assert log.since("c1", 9) is None      # from before a restart
+
+
+def test_global_cap_evicts_least_recent_user():
+    log = EventLog(capacity_per_user=10, max_events=4)
+    log.append("a", {})
+    log.append("a", {})
+    log.append("b", {})
+    log.append("b", {})
+    log.append("b", {})
+    assert log.total == 4
+    assert log.since("a", 0) is None
+    assert [seq for seq, _ in log.since("a", 1)] == [2]
+    assert [seq for seq, _ in log.since("b", 0)] == [1, 2, 3]
+
+
+def test_reconnect_receives_only_missed_notifications():
+    async def run():
+        manager = ConnectionManager(HeartbeatConfig(), EventLog())
+        first = StubWebSocket()
+        connection = await manager.connect(first, "customers", "c1")
+        await manager.notify_customer("c1", {"type": "order_accepted", "order_id": "o1"})
+        manager.disconnect(first, "customers")
+
+        await manager.notify_customer("c1", {"type": "order_update", "order_id": "o1"})
+        await manager.notify_customer("c1", {"type": "order_update", "order_id": "o2"})
+
+        second = StubWebSocket()
+        connection = await manager.connect(second, "customers", "c1")
+        manager._heartbeat_task.cancel()
+        await manager.resume_customer(connection, last_seq=1)
+        assert [json.loads(m)["seq"] for m in second.sent] == [2, 3]
+
+        third = StubWebSocket()
+        connection = await manager.connect(third, "customers", "c1")
+        await manager.resume_customer(connection, last_seq=50)
+        assert json.loads(third.sent[0]) == {"type": "resync", "last_seq": 3}
+
+    asyncio.run(run())
+
+
+def test_evicted_keys_are_forgotten():
+    log = EventLog(capacity_per_user=10, max_events=2)
+    for key in ("order:1", "order:2", "order:3", "order:4"):
+        log.append(key, {})
+    # Only the buffered keys keep a sequence number
+    assert set(log.last_seq) == set(log.buffers) == {"order:3", "order:4"}
+    assert log.since("order:1", 0) is None   # missed seq 1: resync
+    assert log.since("order:1", 1) == []       # caught up: nothing was missed
+
+
+def test_reused_key_never_reuses_sequence_numbers():
+    log = EventLog(capacity_per_user=10, max_events=3)
+    for _ in range(3):
+        log.append("order:1", {})   # a client sees seq 1 and 2, then disconnects
+    for _ in range(3):
+        log.append("order:2", {})   # order:1 is evicted and forgotten
+    assert "order:1" not in log.last_seq
+
+    for _ in range(2):
+        log.append("order:1", {})
+    assert [seq for seq, _ in log.buffers["order:1"]] == [4, 5]
+    # Seq 3 was missed for good: resync, not a replay of the new events as if contiguous
+    assert log.since("order:1", 2) is None
+    assert log.since("order:1", log.latest("order:1")) == []
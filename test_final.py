@@ -6,10 +6,14 @@ Final comprehensive test for the Vicino delivery system
 import asyncio
 import httpx
 import json
+import os
 
 # Configuration
 FASTAPI_BASE_URL = "http://127.0.0.1:8000"
-APP_SCRIPT_URL = "https://script.google.com/macros/s/AKfycbz8ccNA3R_9vfq6KvyuAHvsNb7FpoAV0nJi_pJuYHhZqNEBeedHfMTC5iLxvNdEQvm1/exec"
+APP_SCRIPT_URL = os.getenv(
+    "APP_SCRIPT_URL",
+    "https://script.google.com/macros/s/AKfycbz8ccNA3R_9vfq6KvyuAHvsNb7FpoAV0nJi_pJuYHhZqNEBeedHfMTC5iLxvNdEQvm1/exec"
+)
 
 
 async def test_fastapi_server():
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Idempotency-Key handling for order creation and accepts.
+Run with: python -m pytest test_idempotency.py
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import fake_appscript
+import main
+from idempotency import IdempotencyCache, SharedResults, fingerprint
+
+main.use_appscript_transport(
+    httpx.ASGITransport(app=fake_appscript.app), "http://appscript.local/exec")
+client = TestClient(main.app)
+
+ORDER = {
+    "customer_id": "cust-idem",
+    "phone": "9000000001",
+    "items": [{"name": "Tomato", "quantity": 2, "unit": "kg", "price": 30.0}]
+}
+
+
+def setup_function():
+    fake_appscript.configure()
+    fake_appscript.sheets.reset()
+    fake_appscript.call_counts.clear()
+    main.idempotency.clear()
+
+
+def test_concurrent_duplicates_share_one_run():
+    async def run():
+        cache = IdempotencyCache(ttl=60, max_keys=10)
+        calls = []
+
+        async def produce():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "order-1"
+
+        results = await asyncio.gather(*(cache.run("k", "fp", produce) for _ in range(5)))
+        assert len(calls) == 1
+        assert sorted(results) == [("order-1", False)] + [("order-1", True)] * 4
+        assert await cache.run("k", "fp", produce) == ("order-1", True)
+        assert cache.stats()["joined"] == 4 and cache.stats()["replayed"] == 1
+
+        with pytest.raises(HTTPException) as excinfo:
+            await cache.run("k", "other", produce)
+        assert excinfo.value.status_code == 422
+    asyncio.run(run())
+
+
+def test_failures_are_not_stored_and_entries_expire():
+    async def run():
+        cache = IdempotencyCache(ttl=0, max_keys=2)
+
+        async def fail():
+            raise RuntimeError("upstream down")
+
+        async def produce():
+            return 1
+
+        with pytest.raises(RuntimeError):
+            await cache.run("k", "fp", fail)
+        assert await cache.run("k", "fp", produce) == (1, False)
+        # ttl=0: the stored result is gone by the next call
+        assert await cache.run("k", "fp", produce) == (1, False)
+        for key in ("a", "b", "c"):
+            await cache.run(key, fingerprint(key), produce)
+        assert len(cache.entries) <= 2
+    asyncio.run(run())
+
+
+def test_workers_share_completed_results(tmp_path):
+    # Two caches on one directory stand in for two uvicorn workers
+    workers = [IdempotencyCache(ttl=60, shared=SharedResults(str(tmp_path), "test", ttl=60))
+               for _ in range(2)]
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return b'{"id": "order-1"}'
+
+    async def run():
+        # The retry reaches the second worker while the first is still running
+        first, retry = await asyncio.gather(
+            workers[0].run("k", "fp", produce), workers[1].run("k", "fp", produce))
+        assert first == (b'{"id": "order-1"}', False) and retry == (b'{"id": "order-1"}', True)
+        assert workers[1].shared.stats()["waits"] == 1
+        # Later retries replay from whichever worker gets them
+        assert await workers[1].run("k", "fp", produce) == (b'{"id": "order-1"}', True)
+        workers[0].clear()
+        assert await workers[0].run("k", "fp", produce) == (b'{"id": "order-1"}', True)
+        with pytest.raises(HTTPException) as excinfo:
+            await IdempotencyCache(shared=workers[0].shared).run("k", "other", produce)
+        assert excinfo.value.status_code == 422
+
+        expired = SharedResults(str(tmp_path), "test", ttl=0, sweep_interval=0)
+        await expired.run("gone", "fp", produce)
+        await expired.run("other", "fp", produce)   # sweeps "gone" first, "other" stays for the next sweep
+        assert len(list(tmp_path.iterdir())) == 2
+    asyncio.run(run())
+    assert len(calls) == 3
+
+
+def test_retried_create_order_writes_once():
+    headers = {"Idempotency-Key": "retry-1"}
+    first = client.post("/orders", json=ORDER, headers=headers)
+    second = client.post("/orders", json=ORDER, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["id"] == second.json()["id"]
+    assert "Idempotent-Replayed" not in first.headers
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert fake_appscript.call_counts["create_order"] == 1
+    assert len(fake_appscript.sheets.orders) == 1
+
+    # Without a key every request is a new order
+    client.post("/orders", json=ORDER)
+    assert len(fake_appscript.sheets.orders) == 2
+
+    changed = dict(ORDER, phone="9000000002")
+    assert client.post("/orders", json=changed, headers=headers).status_code == 422
+
+
+def test_concurrent_accept_retries_assign_once():
+    fake_appscript.configure(path_latency={"assign_order": "fixed:50"})
+    order_id = client.post("/orders", json=ORDER).json()["id"]
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                     base_url="http://vicino.test") as http:
+            return await asyncio.gather(*(
+                http.post(f"/orders/{order_id}/accept", json={"delivery_partner_id": "partner-idem"},
+                          headers={"Idempotency-Key": "accept-1"})
+                for _ in range(3)))
+    responses = asyncio.run(run())
+
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    assert len({r.json()["otp"] for r in responses}) == 1
+    assert sum(r.headers.get("Idempotent-Replayed") == "true" for r in responses) == 2
+    assert fake_appscript.call_counts["assign_order"] == 1
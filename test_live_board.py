@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Live order board: versioned diffs, resume after a gap, and the WebSocket topic.
+Run with: python -m pytest test_live_board.py
+"""
+
+import asyncio
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+import fake_appscript
+import main
+from live_board import LiveOrderBoard
+
+main.use_appscript_transport(
+    httpx.ASGITransport(app=fake_appscript.app), "http://appscript.local/exec")
+client = TestClient(main.app)
+
+
+def order(order_id: str) -> dict:
+    return {"id": order_id, "customer_id": "c", "items": [], "total_amount": 10.0, "status": "Pending"}
+
+
+def make_board(upstream, history_size=100):
+    frames = []
+
+    async def fetch():
+        return list(upstream)
+
+    async def publish(frame):
+        frames.append(json.loads(frame))
+
+    board = LiveOrderBoard(fetch, publish, lambda: 1, reconcile_interval=3600, history_size=history_size)
+    return board, frames
+
+
+def test_diffs_chain_and_merge_on_resume():
+    async def run():
+        board, frames = make_board([order("a")])
+        await board.ensure_loaded()
+        start = board.version
+        assert board.subscribe_reply(None)["orders"] == [order("a")]
+
+        await board.add(order("b"))
+        await board.add(order("c"))
+        await board.remove("b")
+        await board.remove("missing")   # not on the board: no diff
+        assert [(f["from_version"], f["version"]) for f in frames[1:]] == [
+            (frames[0]["version"], f"{board.epoch}.2"), (f"{board.epoch}.2", f"{board.epoch}.3"),
+            (f"{board.epoch}.3", f"{board.epoch}.4")]
+
+        # A client at `start` gets one merged diff; b came and went, so it is only removed
+        reply = board.subscribe_reply(start)
+        assert reply["type"] == "board_diff" and reply["from_version"] == start
+        assert reply["added"] == [order("c")] and reply["removed"] == ["b"]
+        assert board.subscribe_reply(board.version)["added"] == []
+        # Unknown epochs and future versions fall back to a snapshot
+        assert board.subscribe_reply("deadbeef.1")["type"] == "board_snapshot"
+        assert board.subscribe_reply(f"{board.epoch}.99")["type"] == "board_snapshot"
+        board._task.cancel()
+
+    asyncio.run(run())
+
+
+def test_truncated_history_gets_a_snapshot():
+    async def run():
+        board, _ = make_board([], history_size=2)
+        await board.ensure_loaded()
+        for order_id in "abc":
+            await board.add(order(order_id))
+        assert board.subscribe_reply(f"{board.epoch}.0")["type"] == "board_snapshot"
+        assert board.subscribe_reply(f"{board.epoch}.1")["added"] == [order("b"), order("c")]
+        board._task.cancel()
+
+    asyncio.run(run())
+
+
+def test_reconcile_keeps_changes_made_during_the_fetch():
+    upstream = [order("a"), order("b")]
+
+    async def run():
+        board, frames = make_board(upstream)
+        await board.ensure_loaded()
+        gate = asyncio.Event()
+        slow_fetch = board.fetch
+
+        async def fetch():
+            result = await slow_fetch()
+            await gate.wait()
+            return result
+        board.fetch = fetch
+
+        # Upstream lost "a" (taken via another worker); meanwhile "b" is taken here
+        upstream.remove(order("a"))
+        reconcile = asyncio.ensure_future(board.reconcile())
+        await asyncio.sleep(0)
+        await board.remove("b")
+        gate.set()
+        await reconcile
+        assert board.orders == {}
+        assert frames[-1]["removed"] == ["a"]
+        board._task.cancel()
+
+    asyncio.run(run())
+
+
+def test_first_subscriber_after_idle_gets_a_fresh_board():
+    upstream = [order("a")]
+
+    async def run():
+        board, _ = make_board(upstream)
+        board.reconcile_interval = 0.05
+        board.subscribers = lambda: 0
+        await board.ensure_loaded()
+        # Nobody is subscribed: local changes are not tracked and the board is not reconciled
+        for order_id in "xyz":
+            await board.add(order(order_id))
+        assert board.changed_at == {}
+        upstream.append(order("b"))   # created via another worker
+        await board.ensure_loaded()
+        assert "b" not in board.orders
+
+        await asyncio.sleep(0.1)
+        assert board.reconciles == 1
+        await board.ensure_loaded()
+        assert board.reconciles == 2 and sorted(board.orders) == ["a", "b"]
+        board._task.cancel()
+
+    asyncio.run(run())
+
+
+def test_partners_follow_the_board_over_the_socket():
+    fake_appscript.configure()
+    fake_appscript.sheets.reset()
+    main.live_board.clear()
+    order_body = {
+        "customer_id": "board-customer", "phone": "9000000005",
+        "items": [{"name": "Milk", "quantity": 1, "unit": "l", "price": 30.0}]
+    }
+    first = client.post("/orders", json=order_body).json()["id"]
+
+    with client.websocket_connect("/ws/delivery/board-partner") as partner:
+        partner.send_text(json.dumps({"type": "subscribe", "topic": "order_board", "id": "s1"}))
+        snapshot = json.loads(partner.receive_text())
+        assert snapshot["type"] == "board_snapshot" and snapshot["id"] == "s1"
+        assert [entry["id"] for entry in snapshot["orders"]] == [first]
+
+        second = client.post("/orders", json=order_body).json()["id"]
+        frames = [json.loads(partner.receive_text()) for _ in range(2)]
+        added = next(frame for frame in frames if frame["type"] == "board_diff")
+        assert added["from_version"] == snapshot["version"] and added["added"][0]["id"] == second
+
+        client.post(f"/orders/{first}/accept", json={"delivery_partner_id": "other-partner"})
+        frames = [json.loads(partner.receive_text()) for _ in range(2)]
+        taken = next(frame for frame in frames if frame["type"] == "board_diff")
+        assert taken["from_version"] == added["version"] and taken["removed"] == [first]
+
+    # Resuming from the snapshot version returns both changes as one diff
+    with client.websocket_connect("/ws/delivery/board-partner") as partner:
+        partner.send_text(json.dumps({"type": "subscribe", "topic": "order_board",
+                                      "version": snapshot["version"]}))
+        resumed = json.loads(partner.receive_text())
+        assert resumed["type"] == "board_diff" and resumed["version"] == taken["version"]
+        assert [entry["id"] for entry in resumed["added"]] == [second] and resumed["removed"] == [first]
+
+    with client.websocket_connect("/ws/customer/board-customer") as customer:
+        customer.send_text(json.dumps({"type": "subscribe", "topic": "order_board"}))
+        assert json.loads(customer.receive_text())["type"] == "error"
+    assert client.get("/ws/metrics").json()["order_board"]["resumes"] == 1
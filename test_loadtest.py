@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+Load test harness helpers.
+Run with: python -m pytest test_loadtest.py
+"""
+
+from loadtest import percentile
+
+
+def test_nearest_rank_percentiles():
+    values = [float(v) for v in range(1, 101)]
+    assert [percentile(values, pct) for pct in (50, 95, 99, 100)] == [50.0, 95.0, 99.0, 100.0]
+    ten = [float(v) for v in range(1, 11)]
+    assert [percentile(ten, pct) for pct in (1, 50, 95)] == [1.0, 5.0, 10.0]
+    assert percentile([], 50) == 0.0
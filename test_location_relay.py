@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Throttled partner -> customer location relay.
+Run with: python -m pytest test_location_relay.py
+"""
+
+import asyncio
+import json
+
+from location_relay import LocationRelay
+
+
+def test_fixes_are_rate_limited_and_coalesced():
+    async def run():
+        sent = []
+
+        async def send(customer_id, frame):
+            sent.append((customer_id, json.loads(frame)))
+            return True
+
+        relay = LocationRelay(send, max_rate=10)
+        relay.track("o1", "p1", "c1")
+        relay.on_location("p2", {"lat": 1.0, "lng": 1.0})  # not tracked
+        for i in range(20):
+            relay.on_location("p1", {"lat": 13.0 + i / 1000, "lng": 80.0})
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.15)
+
+        # ~0.2s of fixes at 10/s: the first goes out at once, the rest are thinned
+        assert 2 <= len(sent) <= 4
+        assert sent[0] == ("c1", {"lat": 13.0, "lng": 80.0, "type": "partner_location", "order_id": "o1"})
+        assert sent[-1][1]["lat"] == 13.019
+        assert relay.coalesced > 10
+
+        relay.stop("o1")
+        relay.on_location("p1", {"lat": 14.0, "lng": 80.0})
+        await asyncio.sleep(0.15)
+        assert sent[-1][1]["lat"] == 13.019
+        assert relay.stats()["tracked_orders"] == 0 and relay.by_partner == {}
+
+    asyncio.run(run())
+
+
+def test_slow_customer_gets_latest_fix_only():
+    async def run():
+        sent = []
+
+        async def slow_send(customer_id, frame):
+            await asyncio.sleep(0.1)
+            sent.append(json.loads(frame)["lat"])
+            return True
+
+        relay = LocationRelay(slow_send, max_rate=1000)
+        relay.track("o1", "p1", "c1")
+        for i in range(10):
+            relay.on_location("p1", {"lat": float(i), "lng": 0.0})
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.35)
+        # One send was in flight while fixes 1..9 arrived; only the newest follows it
+        assert sent == [0.0, 9.0]
+
+    asyncio.run(run())
@@ -7,9 +7,13 @@ This will help us understand where the "Invalid role provided" error is coming f
 import asyncio
 import httpx
 import json
+import os
 
 # Test the Apps Script directly
-APP_SCRIPT_URL = "https://script.google.com/macros/s/AKfycbz8ccNA3R_9vfq6KvyuAHvsNb7FpoAV0nJi_pJuYHhZqNEBeedHfMTC5iLxvNdEQvm1/exec"
+APP_SCRIPT_URL = os.getenv(
+    "APP_SCRIPT_URL",
+    "https://script.google.com/macros/s/AKfycbz8ccNA3R_9vfq6KvyuAHvsNb7FpoAV0nJi_pJuYHhZqNEBeedHfMTC5iLxvNdEQvm1/exec"
+)
 
 
 async def test_appscript_directly():
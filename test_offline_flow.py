@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Order flow against the local Apps Script stand-in (no network needed).
+Run with: python -m pytest test_offline_flow.py
+"""
+
+import httpx
+from fastapi.testclient import TestClient
+
+import fake_appscript
+import main
+
+main.use_appscript_transport(
+    httpx.ASGITransport(app=fake_appscript.app), "http://appscript.local/exec")
+client = TestClient(main.app)
+
+
+def setup_function():
+    fake_appscript.configure()
+    fake_appscript.sheets.reset()
+    main.catalog.clear()
+    main.order_cache.clear()
+
+
+def test_login_flow():
+    response = client.post("/login/send_otp", json={
+        "phone": "9442033333", "role": "delivery", "location": "Chennai"
+    })
+    assert response.status_code == 200
+    otp = response.json()["otp"]
+
+    response = client.post("/login/verify_otp", json={"phone": "9442033333", "otp": otp})
+    assert response.status_code == 200
+    assert response.json()["role"] == "delivery"
+
+
+def test_order_lifecycle():
+    response = client.post("/orders", json={
+        "customer_id": "test-customer-123",
+        "phone": "9876543210",
+        "items": [{"name": "Carrot", "quantity": 2, "unit": "kg", "price": 10.0}]
+    })
+    assert response.status_code == 200
+    order_id = response.json()["id"]
+    assert response.json()["total_amount"] == 20.0
+
+    available = client.get("/orders/available").json()
+    assert [order["id"] for order in available] == [order_id]
+
+    response = client.post(f"/orders/{order_id}/accept",
+                           json={"delivery_partner_id": "test-partner-123"})
+    assert response.status_code == 200
+    otp = response.json()["otp"]
+    assert client.get("/orders/partner/status",
+                      params={"delivery_partner_id": "test-partner-123"}).json()["status"] == "busy"
+    assert main.location_relay.orders[order_id].customer_id == "test-customer-123"
+
+    response = client.post(f"/orders/{order_id}/verify_otp", json={"otp": otp})
+    assert response.status_code == 200
+    assert response.json()["reward_bonus"] == 4.0
+    assert order_id not in main.location_relay.orders
+
+    transactions = client.get("/blockchain/transactions").json()
+    assert transactions[0]["order_id"] == order_id
+    assert client.get(f"/orders/{order_id}").json()["status"] == "Delivered"
+
+
+def test_bulk_orders_single_write_and_broadcast():
+    fake_appscript.call_counts.clear()
+    carrot = {"name": "Carrot", "quantity": 1, "unit": "kg", "price": 10.0}
+    with client.websocket_connect("/ws/delivery/bulk-partner") as partner:
+        response = client.post("/orders/bulk", json={"orders": [
+            {"customer_id": "store-1", "phone": "9000000001", "items": [carrot]},
+            {"customer_id": "store-1", "phone": "9000000001"},
+            {"customer_id": "store-1", "phone": "9000000001", "items": []},
+            {"customer_id": "store-2", "phone": "9000000002", "items": [dict(carrot, quantity=3)]}
+        ]})
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["created"], body["failed"]) == (2, 2)
+        assert [result["success"] for result in body["results"]] == [True, False, False, True]
+        assert body["results"][1]["error"].startswith("items:")
+        assert body["results"][3]["order"]["total_amount"] == 30.0
+
+        broadcast = partner.receive_json()
+        assert broadcast["type"] == "new_orders"
+        assert [order["id"] for order in broadcast["orders"]] == \
+            [body["results"][0]["order"]["id"], body["results"][3]["order"]["id"]]
+
+    assert fake_appscript.call_counts.get("create_orders") == 1
+    assert "create_order" not in fake_appscript.call_counts
+    assert len(client.get("/orders/available").json()) == 2
+
+
+def test_bulk_orders_without_the_batched_action(monkeypatch):
+    monkeypatch.delitem(fake_appscript.ACTIONS, "create_orders")
+    fake_appscript.call_counts.clear()
+    carrot = {"name": "Carrot", "quantity": 1, "unit": "kg", "price": 10.0}
+    body = client.post("/orders/bulk", json={"orders": [
+        {"customer_id": "store-3", "phone": "9000000001", "items": [carrot]},
+        {"customer_id": "store-4", "phone": "9000000002", "items": [carrot]}
+    ]}).json()
+    assert (body["created"], body["failed"]) == (2, 0)
+    assert fake_appscript.call_counts == {"create_orders": 1, "create_order": 2}
+    for result in body["results"]:
+        assert client.get(f"/orders/{result['order']['id']}").json()["customer_id"] == result["order"]["customer_id"]
+
+
+def test_bulk_orders_count_against_the_customer_rate(monkeypatch):
+    monkeypatch.setattr(main.admission, "enabled", True)
+    limiter = main.admission.limits["user"]
+    monkeypatch.setattr(limiter, "acquire", lambda key: 2.0 if key == "store-busy" else 0.0)
+    carrot = {"name": "Carrot", "quantity": 1, "unit": "kg", "price": 10.0}
+    body = client.post("/orders/bulk", json={"orders": [
+        {"customer_id": "store-busy", "phone": "9000000001", "items": [carrot]},
+        {"customer_id": "store-5", "phone": "9000000002", "items": [carrot]}
+    ]}).json()
+    assert [result["success"] for result in body["results"]] == [False, True]
+    assert body["results"][0]["error"].startswith("Too many requests")
+
+
+def test_bulk_lookup_fetches_only_misses():
+    carrot = {"name": "Carrot", "quantity": 1, "unit": "kg", "price": 10.0}
+    first, second = [client.post("/orders", json={
+        "customer_id": "lookup-customer", "phone": "9000000003", "items": [carrot]
+    }).json()["id"] for _ in range(2)]
+    main.order_cache.invalidate(first)
+    fake_appscript.call_counts.clear()
+
+    body = client.get("/orders", params={"ids": f"{second},unknown,{first},{second}"}).json()
+    assert [order and order["id"] for order in body["orders"]] == [second, None, first, second]
+    assert body["missing"] == ["unknown"]
+    assert fake_appscript.call_counts == {"get_orders_details": 1}
+
+    client.post(f"/orders/{first}/accept", json={"delivery_partner_id": "lookup-partner"})
+    fake_appscript.call_counts.clear()
+    body = client.post("/orders/lookup", json={"ids": [first, second]}).json()
+    assert [order["status"] for order in body["orders"]] == ["Accepted", "Pending"]
+    assert fake_appscript.call_counts == {}
+
+
+def test_bulk_lookup_without_the_batched_action(monkeypatch):
+    # A deployed script without get_orders_details answers "Unknown path"
+    monkeypatch.delitem(fake_appscript.ACTIONS, "get_orders_details")
+    carrot = {"name": "Carrot", "quantity": 1, "unit": "kg", "price": 10.0}
+    order_id = client.post("/orders", json={
+        "customer_id": "lookup-customer", "phone": "9000000003", "items": [carrot]
+    }).json()["id"]
+    main.order_cache.invalidate(order_id)
+    fake_appscript.call_counts.clear()
+
+    body = client.get("/orders", params={"ids": f"{order_id},unknown"}).json()
+    assert [order and order["id"] for order in body["orders"]] == [order_id, None]
+    assert body["missing"] == ["unknown"]
+    assert fake_appscript.call_counts == {"get_orders_details": 1, "get_order_details": 2}
+
+
+def test_injected_upstream_error():
+    fake_appscript.configure(error_rate=1.0, error_status=503)
+    response = client.get("/items/nearby")
+    assert response.status_code == 503
+
+
+def test_latency_spec_validation():
+    model = fake_appscript.LatencyModel("uniform:10,20")
+    assert 10 <= model.sample() <= 20
+    try:
+        fake_appscript.LatencyModel("gamma:1")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("invalid spec accepted")
+
+
+def test_replay(tmp_path):
+    capture = tmp_path / "capture.jsonl"
+    capture.write_text(
+        '{"path": "get_nearby_items", "payload": {}, "status": 200, '
+        '"response": {"items": [{"id": "9", "name": "Tea", "price": 3.0, "store_name": "Cafe"}]}, '
+        '"elapsed_ms": 1.0}\n')
+    fake_appscript.configure(replay=str(capture))
+    items = client.get("/items/nearby").json()
+    assert items[0]["name"] == "Tea"
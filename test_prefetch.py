@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Prefetch scheduler: adaptive intervals, jitter and idle skipping.
+Run with: python -m pytest test_prefetch.py
+"""
+
+import asyncio
+import random
+
+from prefetch import PrefetchScheduler
+
+
+def test_interval_follows_read_rate():
+    scheduler = PrefetchScheduler(jitter=0.0, rate_window=10)
+    scheduler.register("catalog", None, min_interval=5, max_interval=100, reads_per_refresh=10)
+    key = scheduler.keys["catalog"]
+    assert scheduler.interval(key, now=1000) == 100
+
+    # 1 read/s -> about one refresh per 10 reads
+    key.last_read, key.rate, key.rate_at = 1000, 1.0, 1000
+    assert scheduler.interval(key, now=1000) == 10
+    # 10 reads/s is clamped to min_interval; the rate decays once reads stop
+    key.rate = 10.0
+    assert scheduler.interval(key, now=1000) == 5
+    assert scheduler.interval(key, now=1050) == 100
+
+
+def test_jitter_only_shortens_delays():
+    scheduler = PrefetchScheduler(jitter=0.2, rng=random.Random(7))
+    scheduler.register("board", None, min_interval=2)
+    key = scheduler.keys["board"]
+    delays = [scheduler._delay(key, now=0) for _ in range(200)]
+    assert all(1.6 <= delay <= 2.0 for delay in delays)
+    assert len(set(delays)) > 100
+
+
+def test_refreshes_while_read_and_parks_when_idle():
+    refreshed = []
+
+    async def refresh():
+        refreshed.append(asyncio.get_running_loop().time())
+
+    async def run():
+        scheduler = PrefetchScheduler(jitter=0.1, rng=random.Random(1))
+        scheduler.register("board", refresh, min_interval=0.05, max_interval=0.05, idle_after=0.2)
+        scheduler.touch("board")
+        for _ in range(6):
+            await asyncio.sleep(0.05)
+            scheduler.touch("board")
+        busy = len(refreshed)
+        assert busy >= 4
+
+        # No reads: refreshes stop after idle_after and the key is parked
+        await asyncio.sleep(0.5)
+        key = scheduler.keys["board"]
+        assert key.next_due == 0.0 and key.skipped == 1
+        assert len(refreshed) <= busy + 5
+        parked = len(refreshed)
+        await asyncio.sleep(0.2)
+        assert len(refreshed) == parked
+
+        # The next read finds it overdue and refreshes straight away
+        scheduler.touch("board")
+        await asyncio.sleep(0.01)
+        assert len(refreshed) == parked + 1
+        scheduler._task.cancel()
+
+    asyncio.run(run())
+
+
+def test_expired_key_refreshes_on_first_read():
+    calls = []
+
+    async def refresh():
+        calls.append(1)
+
+    async def run():
+        scheduler = PrefetchScheduler()
+        scheduler.register("catalog", refresh, min_interval=60)
+        scheduler.touch("catalog")
+        await asyncio.sleep(0.01)
+        assert calls == []   # the first read loads the data itself
+
+        scheduler.register("snapshot", refresh, min_interval=60)
+        scheduler.expire("snapshot")
+        scheduler.touch("snapshot")
+        await asyncio.sleep(0.01)
+        assert calls == [1]
+        scheduler._task.cancel()
+
+    asyncio.run(run())
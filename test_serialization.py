@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Order encoder: response shape, per-version cache and the order endpoints.
+Run with: python -m pytest test_serialization.py
+"""
+
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+import fake_appscript
+import main
+from serialization import OrderEncoder
+
+BACKEND_ORDER = {
+    "id": "o1",
+    "customerId": "c1",
+    "items": [{"name": "Carrot", "quantity": 2, "price": 10.0}],
+    "totalAmount": 20.0,
+    "status": "Pending",
+    "assignedPartnerId": None
+}
+
+
+def test_encoded_order_matches_model_dump():
+    expected = main.Order(
+        id="o1", customer_id="c1", items=[main.Item(name="Carrot", quantity=2, price=10.0)],
+        total_amount=20.0, status=main.OrderStatus.PENDING).model_dump(mode="json")
+    for validate in (None, main.validate_order_payload):
+        assert json.loads(OrderEncoder(validate).encode(BACKEND_ORDER)) == expected
+
+
+def test_cache_is_per_order_version():
+    encoder = OrderEncoder(max_orders=2)
+    first = encoder.encode(BACKEND_ORDER)
+    assert encoder.encode(dict(BACKEND_ORDER)) is first
+    accepted = dict(BACKEND_ORDER, status="Accepted", assignedPartnerId="p1", otp="1234")
+    assert json.loads(encoder.encode(accepted))["otp"] == "1234"
+    assert json.loads(encoder.encode_list([BACKEND_ORDER, accepted]))[1]["status"] == "Accepted"
+    assert encoder.stats()["hits"] == 3 and encoder.stats()["misses"] == 2
+
+    encoder.encode(dict(BACKEND_ORDER, id="o2"))
+    assert len(encoder.cache) == 2
+
+
+def test_order_endpoints_use_encoder():
+    main.use_appscript_transport(
+        httpx.ASGITransport(app=fake_appscript.app), "http://appscript.local/exec")
+    fake_appscript.configure()
+    fake_appscript.sheets.reset()
+    client = TestClient(main.app)
+
+    order_id = client.post("/orders", json={
+        "customer_id": "c1", "phone": "9442033333",
+        "items": [{"name": "Carrot", "quantity": 2, "unit": "kg", "price": 10.0}]
+    }).json()["id"]
+    available = client.get("/orders/available")
+    assert available.headers["content-type"] == "application/json"
+    assert available.json()[0]["items"][0]["unit"] == "kg"
+
+    accepted = client.post(f"/orders/{order_id}/accept", json={"delivery_partner_id": "p1"}).json()
+    assert accepted["status"] == "Accepted" and accepted["assigned_partner_id"] == "p1"
+    details = client.get(f"/orders/{order_id}").json()
+    assert details["status"] == "Accepted" and details["otp"] == accepted["otp"]
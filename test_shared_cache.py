@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Shared cache tier: snapshots, cross-worker refresh and the order board.
+Run with: python -m pytest test_shared_cache.py
+"""
+
+import asyncio
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+import fake_appscript
+import main
+from catalog import CatalogService, VersionedItems
+from shared_cache import SharedSnapshot
+
+main.use_appscript_transport(
+    httpx.ASGITransport(app=fake_appscript.app), "http://appscript.local/exec")
+client = TestClient(main.app)
+
+
+def test_versions_follow_payload_changes(tmp_path):
+    writer = SharedSnapshot("entry", ttl=60, directory=str(tmp_path))
+    reader = SharedSnapshot("entry", ttl=60, directory=str(tmp_path))
+    assert reader.read() is None
+
+    first = writer.publish(b'{"a":1}')
+    assert first.generation == 1 and reader.read().payload == b'{"a":1}'
+    assert writer.publish(b'{"a":1}').version == first.version
+    second = writer.publish(b'{"a":2}')
+    assert (second.epoch, second.generation) == (first.epoch, 2)
+
+    held = reader.read().payload
+    writer.publish(b'{"a":3}')
+    # A reader's old mapping stays intact after the entry is replaced
+    assert held == b'{"a":2}' and reader.read().payload == b'{"a":3}'
+
+    writer.invalidate()
+    assert reader.read() is None
+    assert writer.publish(b'{"a":3}').epoch != first.epoch
+
+
+def test_one_worker_fetches_for_all(tmp_path):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return b"[1,2,3]"
+
+    async def run():
+        workers = [SharedSnapshot("board", ttl=60, directory=str(tmp_path)) for _ in range(4)]
+        snapshots = await asyncio.gather(*(worker.get(fetch) for worker in workers))
+        assert len(calls) == 1
+        assert {snapshot.version for snapshot in snapshots} == {snapshots[0].version}
+        assert sum(worker.waits for worker in workers) == 3
+
+        # Expired: one worker refreshes while the others keep serving the old bytes
+        for worker in workers:
+            worker.ttl = 0
+        workers[0].publish(b"[1]")
+        await asyncio.gather(*(worker.get(fetch) for worker in workers))
+        assert len(calls) == 2
+        assert sum(worker.stale_hits for worker in workers) >= 1
+    asyncio.run(run())
+
+
+def test_catalog_versions_agree_across_workers(tmp_path):
+    items = [{"id": "1", "name": "Carrot", "price": 10.0}]
+    shared = SharedSnapshot("catalog", ttl=0, directory=str(tmp_path))
+
+    async def fetch():
+        snapshot = shared.read()
+        return VersionedItems(json.loads(bytes(snapshot.payload)), snapshot.epoch, snapshot.generation)
+
+    async def run():
+        first, second = CatalogService(fetch, refresh_interval=3600), CatalogService(fetch, refresh_interval=3600)
+        shared.publish(json.dumps(items).encode())
+        await first.refresh()
+        v1 = first.version
+        shared.publish(json.dumps(items + [{"id": "2", "name": "Milk", "price": 30.0}]).encode())
+        shared.publish(json.dumps(items + [{"id": "3", "name": "Bread", "price": 40.0}]).encode())
+        await first.refresh()
+        await second.refresh()
+        assert first.version == second.version and first.version.endswith(".3")
+        # `first` skipped generation 2, so it cannot diff from it
+        assert first.changes_since(f"{first.epoch}.2") is None
+        upserts, deletes = first.changes_since(v1)
+        assert [item["id"] for item in upserts] == ["3"] and deletes == []
+    asyncio.run(run())
+
+
+def test_order_board_is_shared_and_invalidated(tmp_path, monkeypatch):
+    fake_appscript.configure()
+    fake_appscript.sheets.reset()
+    fake_appscript.call_counts.clear()
+    monkeypatch.setattr(main, "SHARED_CACHE", True)
+    monkeypatch.setattr(main, "order_board", SharedSnapshot("board", ttl=60, directory=str(tmp_path)))
+
+    assert client.get("/orders/available").json() == []
+    order_id = client.post("/orders", json={
+        "customer_id": "board-customer", "phone": "9000000004",
+        "items": [{"name": "Milk", "quantity": 1, "unit": "l", "price": 30.0}]
+    }).json()["id"]
+    assert [order["id"] for order in client.get("/orders/available").json()] == [order_id]
+    assert [order["id"] for order in client.get("/orders/available").json()] == [order_id]
+    assert fake_appscript.call_counts["get_available_orders"] == 2
+
+    client.post(f"/orders/{order_id}/accept", json={"delivery_partner_id": "board-partner"})
+    assert client.get("/orders/available").json() == []
+    assert client.get("/cache/stats").json()["order_board"]["fetches"] == 3
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Grid spatial index for partner locations.
+Run with: python -m pytest test_spatial_index.py
+"""
+
+import math
+import random
+
+from spatial_index import GridIndex, haversine_km
+
+
+def brute_nearest(points, lat, lng, k, max_km):
+    found = sorted((haversine_km(lat, lng, plat, plng), key) for key, (plat, plng) in points.items())
+    return [key for d, key in found if d <= max_km][:k]
+
+
+def test_nearest_and_within_match_brute_force():
+    rng = random.Random(3)
+    index = GridIndex(cell_km=0.5)
+    points = {}
+    for i in range(2000):
+        points[f"p{i}"] = (13.0 + rng.uniform(0, 0.2), 80.2 + rng.uniform(0, 0.2))
+        index.upsert(f"p{i}", *points[f"p{i}"])
+    # Move half of them, some across cells
+    for i in range(0, 2000, 2):
+        lat, lng = points[f"p{i}"]
+        points[f"p{i}"] = (lat + rng.uniform(-0.01, 0.01), lng + rng.uniform(-0.01, 0.01))
+        index.upsert(f"p{i}", *points[f"p{i}"])
+
+    for _ in range(50):
+        lat, lng = 13.0 + rng.uniform(0, 0.2), 80.2 + rng.uniform(0, 0.2)
+        got = [key for _, key in index.nearest(lat, lng, 10, max_km=5)]
+        assert got == brute_nearest(points, lat, lng, 10, 5)
+        within = {key for _, key in index.within(lat, lng, 1.0)}
+        assert within == set(brute_nearest(points, lat, lng, 10 ** 6, 1.0))
+
+
+def test_remove_reuses_slots_and_stale_fixes_are_ignored():
+    index = GridIndex(cell_km=0.5, stale_after=60)
+    index.upsert("a", 13.0, 80.0, now=0)
+    index.upsert("b", 13.001, 80.001)
+    assert index.position("a") is None
+    assert [key for _, key in index.nearest(13.0, 80.0, 5)] == ["b"]
+    assert index.evict_stale() == 1
+    index.upsert("c", 13.002, 80.002)
+    assert len(index.keys) == 2 and len(index) == 2
+    assert index.remove("b") and not index.remove("b")
+    assert math.isclose(index.within(13.0, 80.0, 1)[0][0], haversine_km(13.0, 80.0, 13.002, 80.002), rel_tol=0.01)
+
+
+def test_invalid_fixes_are_rejected_without_side_effects():
+    index = GridIndex(cell_km=0.5)
+    index.upsert("a", 13.0, 80.0)
+    for lat, lng in [(1e300, 80.0), (math.nan, 80.0), (13.0, math.inf), (91.0, 80.0), (13.0, -181.0)]:
+        try:
+            index.upsert("b", lat, lng)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {lat}, {lng}")
+    index.upsert("c", 13.001, 80.001)
+    assert len(index.lats) == len(index.keys) == 2 and "b" not in index
+    assert index.get("c")[:2] == (13.001, 80.001)
+    assert [key for _, key in index.nearest(13.0, 80.0, 2)] == ["a", "c"]
+
+
+def test_nearest_beyond_max_rings_falls_back_to_a_full_scan():
+    index = GridIndex(cell_km=0.5)
+    index.upsert("near", 13.01, 80.0)
+    index.upsert("far", 20.0, 80.0)
+    index.upsert("farther", 25.0, 80.0)
+    # Far beyond MAX_RINGS: one pass over the points, not one ring per 0.5 km of radius
+    got = index.nearest(13.0, 80.0, 2, max_km=1000)
+    assert [key for _, key in got] == ["near", "far"]
+    assert math.isclose(got[1][0], haversine_km(13.0, 80.0, 20.0, 80.0), rel_tol=0.01)
+    assert [key for _, key in index.nearest(13.0, 80.0, 1, max_km=1000)] == ["near"]
+
+    # Denser than the ring budget: rings first, then the full pass
+    index.MAX_RINGS = 2
+    for i in range(30):
+        index.upsert(f"crowd{i}", 13.0 + i * 0.001, 80.0)
+    assert [key for _, key in index.nearest(13.0, 80.0, 33, max_km=2000)][-2:] == ["far", "farther"]
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Per-order Server-Sent Events streams.
+Run with: python -m pytest test_sse.py
+"""
+
+import asyncio
+import json
+
+from event_log import EventLog
+from sse import KEEPALIVE, SSEBroker
+
+
+def publish(broker: SSEBroker, order_id: str, status: str):
+    frame = broker.events.append(order_id, {"type": "order_update", "status": status})
+    broker.publish(order_id, broker.events.latest(order_id), "order_update", frame)
+
+
+def test_live_events_and_keepalive():
+    async def run():
+        broker = SSEBroker(EventLog(), keepalive_interval=3600)
+        stream = broker.stream("o1")
+        assert await stream.__anext__() == b"retry: 3000\n\n"
+
+        reader = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        publish(broker, "o1", "Accepted")
+        chunk = await reader
+        assert chunk.startswith(b"id: 1\nevent: order_update\ndata: ")
+        assert json.loads(chunk.split(b"data: ")[1])["status"] == "Accepted"
+
+        broker.keepalive_tick()   # had an event this tick: no comment
+        broker.keepalive_tick()
+        assert await stream.__anext__() == KEEPALIVE
+        assert broker.stats()["streams"] == 1
+        await stream.aclose()
+        assert broker.stats()["streams"] == 0
+
+    asyncio.run(run())
+
+
+def test_resume_with_last_event_id():
+    async def run():
+        broker = SSEBroker(EventLog(), keepalive_interval=3600)
+        for status in ["Pending", "Accepted", "Delivered"]:
+            publish(broker, "o1", status)
+
+        stream = broker.stream("o1", last_event_id=1)
+        await stream.__anext__()
+        replayed = [await stream.__anext__(), await stream.__anext__()]
+        assert [c.split(b"\n")[0] for c in replayed] == [b"id: 2", b"id: 3"]
+        await stream.aclose()
+
+        stream = broker.stream("o1", last_event_id=99)
+        await stream.__anext__()
+        assert b"event: resync" in await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(run())
+
+
+def test_slow_consumer_is_closed():
+    async def run():
+        broker = SSEBroker(EventLog(), keepalive_interval=3600, queue_size=2)
+        stream = broker.stream("o1")
+        await stream.__anext__()
+        for i in range(4):
+            publish(broker, "o1", str(i))
+        chunks = [chunk async for chunk in stream]
+        assert chunks == []
+        assert broker.dropped == 1
+        assert broker.stats()["streams"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Booking fan-out in webhook.py: compact state, single-winner pickup, per-partner
+listings, and webhook delivery against the local receiver.
+Run with: python -m pytest test_webhook.py
+"""
+
+import asyncio
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+import webhook
+import webhook_receiver
+from webhook import BookingStore, PartnerRegistry
+from webhook_delivery import WebhookDelivery
+
+client = TestClient(webhook.app)
+BOOKING = {"user_id": "user1", "service_name": "Pet Grooming", "service_details": "Full grooming session"}
+
+
+def test_pickup_cancels_everyone_else():
+    booking_id = client.post("/book_service/", json=BOOKING).json()["booking_id"]
+    booking = client.get(f"/get_booking/{booking_id}", params={"partner": "Partner3"}).json()
+    assert booking["status"] == "pending" and booking["partner_status"] == "pending"
+    assert booking_id in client.get("/partner_bookings/Partner3").json()["bookings"]
+
+    assert client.post(f"/partner_pickup/{booking_id}/Partner1").status_code == 200
+    assert client.post(f"/partner_pickup/{booking_id}/Partner1").status_code == 200   # retry
+    assert client.post(f"/partner_pickup/{booking_id}/Partner2").status_code == 409
+    assert client.post(f"/partner_pickup/{booking_id}/Nobody").status_code == 400
+    booking = client.get(f"/get_booking/{booking_id}", params={"partner": "Partner3"}).json()
+    assert booking["picked_by"] == "Partner1" and booking["partner_status"] == "removed"
+    assert booking_id not in client.get("/partner_bookings/Partner3").json()["bookings"]
+
+
+def test_concurrent_pickups_have_one_winner():
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=webhook.app),
+                                     base_url="http://webhook.local") as http:
+            booking_id = (await http.post("/book_service/", json=BOOKING)).json()["booking_id"]
+            responses = await asyncio.gather(*(
+                http.post(f"/partner_pickup/{booking_id}/Partner{i}") for i in range(1, 11)))
+        assert sorted(response.status_code for response in responses) == [200] + [409] * 9
+
+    asyncio.run(run())
+
+
+def test_late_partners_only_see_newer_bookings():
+    partners = PartnerRegistry(["a", "b"])
+    store = BookingStore(partners)
+    store.create("old", None)
+    late = partners.add("c")
+    store.create("new-1", None)
+    store.create("new-2", None)
+    assert store.pending_for(late) == ["new-2", "new-1"]
+    assert store.pending_for(0) == ["new-2", "new-1", "old"]
+    assert store.pending_for(0, limit=1) == ["new-2"]
+    assert store.bookings["old"].status_for(late) is None
+
+    assert store.claim("new-2", late) == late
+    assert store.claim("new-2", 0) == late
+    assert store.pending_for(late) == ["new-1"]
+
+
+def make_delivery(**options) -> WebhookDelivery:
+    options.setdefault("batch_window", 0.02)
+    options.setdefault("backoff_base", 0.01)
+    return WebhookDelivery(transport=httpx.ASGITransport(app=webhook_receiver.app), **options)
+
+
+def test_deliveries_are_batched_per_endpoint():
+    webhook_receiver.configure()
+
+    async def run():
+        delivery = make_delivery()
+        # Two partners share an endpoint; the third has its own and joined later
+        delivery.register(0, "a", "http://receiver.local/hooks/shared")
+        delivery.register(1, "b", "http://receiver.local/hooks/shared")
+        delivery.register(2, "c", "http://receiver.local/hooks/own")
+        for i in range(5):
+            delivery.enqueue(f"booking-{i}", {"service_name": "Pet Grooming"}, audience=2 if i < 3 else 3)
+        await delivery.drain()
+        await delivery.close()
+        return delivery
+
+    delivery = asyncio.run(run())
+    shared = webhook_receiver.received["shared"]
+    assert [event["booking_id"] for event in shared] == [f"booking-{i}" for i in range(5)]
+    assert all(event["partners"] == ["a", "b"] for event in shared)
+    assert [event["booking_id"] for event in webhook_receiver.received["own"]] == ["booking-3", "booking-4"]
+    assert webhook_receiver.attempts == {"shared": 1, "own": 1}
+    assert delivery.stats()["delivered_events"] == 7
+
+
+def test_failed_batches_are_retried_then_dead_lettered():
+    async def run():
+        delivery = make_delivery(max_attempts=3)
+        delivery.register(0, "a", "http://receiver.local/hooks/flaky")
+
+        webhook_receiver.configure(fail_first=2)
+        delivery.enqueue("retried", {}, audience=1)
+        await delivery.drain()
+        assert [event["booking_id"] for event in webhook_receiver.received["flaky"]] == ["retried"]
+        assert delivery.stats()["retries"] == 2
+
+        webhook_receiver.configure(error_rate=1.0)
+        delivery.enqueue("lost", {}, audience=1)
+        await delivery.drain()
+        assert webhook_receiver.attempts["flaky"] == 3
+        assert delivery.dead_letters.entries[0]["reason"] == "HTTP 500"
+
+        # Client errors are not retried
+        webhook_receiver.configure(error_rate=1.0, error_status=400)
+        delivery.enqueue("rejected", {}, audience=1)
+        await delivery.drain()
+        assert webhook_receiver.attempts["flaky"] == 1 and len(delivery.dead_letters) == 2
+
+        webhook_receiver.configure()
+        assert delivery.retry_dead_letters() == 2
+        await delivery.drain()
+        assert sorted(event["booking_id"] for event in webhook_receiver.received["flaky"]) == ["lost", "rejected"]
+        assert len(delivery.dead_letters) == 0
+        await delivery.close()
+
+    asyncio.run(run())
+
+
+def test_booking_returns_before_partners_are_notified(monkeypatch):
+    webhook_receiver.configure(latency=0.3)
+    monkeypatch.setattr(webhook, "delivery", make_delivery())
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=webhook.app),
+                                     base_url="http://webhook.local") as http:
+            await http.post("/partners/HookedPartner", json={"url": "http://receiver.local/hooks/hooked"})
+            start = time.monotonic()
+            booking_id = (await http.post("/book_service/", json=BOOKING)).json()["booking_id"]
+            assert time.monotonic() - start < 0.2
+            await webhook.delivery.drain()
+            assert (await http.get("/webhooks/stats")).json()["delivered_events"] == 1
+        await webhook.delivery.close()
+        return booking_id
+
+    booking_id = asyncio.run(run())
+    event = webhook_receiver.received["hooked"][0]
+    assert event["booking_id"] == booking_id and event["partners"] == ["HookedPartner"]
+    assert event["booking"]["service_name"] == "Pet Grooming"
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Heartbeat and reaping of WebSocket clients, using stub sockets.
+Run with: python -m pytest test_ws_heartbeat.py
+"""
+
+import asyncio
+import time
+
+from ws_heartbeat import HeartbeatConfig, TimerWheel
+from main import ConnectionManager
+
+
+class StubWebSocket:
+    def __init__(self, hang: bool = False):
+        self.sent = []
+        self.closed_with = None
+        self.hang = hang
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.hang:
+            await asyncio.sleep(3600)
+        self.sent.append(message)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+def test_timer_wheel_rounds():
+    wheel = TimerWheel(tick=1, slots=4)
+    wheel.schedule("a", 2)
+    wheel.schedule("b", 6)
+    expired = [wheel.advance() for _ in range(6)]
+    assert expired == [[], ["a"], [], [], [], ["b"]]
+    assert wheel.size == 0
+
+
+def test_ping_then_idle_reap():
+    async def run():
+        manager = ConnectionManager(HeartbeatConfig(ping_interval=1, idle_timeout=3, tick=1))
+        ws = StubWebSocket()
+        connection = await manager.connect(ws, "customers", "c1")
+        manager._heartbeat_task.cancel()
+
+        connection["last_seen"] = time.monotonic() - 1.5
+        await manager.heartbeat_tick()
+        assert ws.sent == ['{"type": "ping"}']
+        assert manager.metrics.pings_sent == 1
+
+        connection["last_seen"] = time.monotonic() - 5
+        for _ in range(3):
+            await manager.heartbeat_tick()
+        assert manager.active_connections["customers"] == []
+        assert manager.metrics.reaped == {"idle": 1}
+        assert ws.closed_with == 1001
+
+    asyncio.run(run())
+
+
+def test_unresponsive_socket_reaped_on_ping():
+    async def run():
+        manager = ConnectionManager(HeartbeatConfig(
+            ping_interval=1, idle_timeout=0, send_timeout=0.01, tick=1))
+        ws = StubWebSocket(hang=True)
+        connection = await manager.connect(ws, "delivery_partners", "p1")
+        manager._heartbeat_task.cancel()
+
+        connection["last_seen"] = time.monotonic() - 2
+        await manager.heartbeat_tick()
+        assert manager.active_connections["delivery_partners"] == []
+        assert manager.stats()["reaped"] == {"unresponsive": 1}
+
+    asyncio.run(run())
+
+
+def test_broadcast_drops_dead_sockets():
+    async def run():
+        manager = ConnectionManager(HeartbeatConfig(send_timeout=0.01))
+        alive, dead = StubWebSocket(), StubWebSocket(hang=True)
+        await manager.connect(alive, "delivery_partners", "p1")
+        await manager.connect(dead, "delivery_partners", "p2")
+        manager._heartbeat_task.cancel()
+
+        await manager.broadcast_to_delivery_partners("hello")
+        assert alive.sent == ["hello"]
+        assert [c["user_id"] for c in manager.active_connections["delivery_partners"]] == ["p1"]
+        assert manager.metrics.reaped == {"send_failed": 1}
+
+    asyncio.run(run())
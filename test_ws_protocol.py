@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Typed WebSocket protocol against the local Apps Script stand-in.
+Run with: python -m pytest test_ws_protocol.py
+"""
+
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+import fake_appscript
+import main
+from ws_protocol import ProtocolError, parse_message
+
+main.use_appscript_transport(
+    httpx.ASGITransport(app=fake_appscript.app), "http://appscript.local/exec")
+client = TestClient(main.app)
+
+
+def setup_function():
+    fake_appscript.configure()
+    fake_appscript.sheets.reset()
+
+
+def create_order() -> str:
+    response = client.post("/orders", json={
+        "customer_id": "customer-1",
+        "phone": "9876543210",
+        "items": [{"name": "Carrot", "quantity": 2, "unit": "kg", "price": 10.0}]
+    })
+    return response.json()["id"]
+
+
+def test_schema_validation():
+    assert parse_message('{"type": "location", "lat": 1, "lng": 2.5}', "delivery_partners")["lat"] == 1
+    for frame, client_type in [
+        ("Hello from customer!", "customers"),
+        ('{"type": "teleport"}', "customers"),
+        ('{"type": "location", "lat": "1", "lng": 2}', "delivery_partners"),
+        ('{"type": "ack", "seq": true}', "customers"),
+        ('{"type": "accept", "order_id": "x"}', "customers"),
+        ('{"type": "location", "lat": NaN, "lng": 2}', "delivery_partners"),
+        ('{"type": "location", "lat": 1, "lng": Infinity}', "delivery_partners"),
+        ('{"type": "location", "lat": 1e300, "lng": 80}', "delivery_partners"),
+        ('{"type": "location", "lat": 13, "lng": 181}', "delivery_partners"),
+    ]:
+        try:
+            parse_message(frame, client_type)
+        except ProtocolError:
+            continue
+        raise AssertionError(f"accepted invalid frame {frame}")
+
+
+def test_ping_and_errors_do_not_echo():
+    with client.websocket_connect("/ws/customer/customer-1") as ws:
+        ws.send_text('{"type": "ping"}')
+        assert json.loads(ws.receive_text()) == {"type": "pong"}
+        ws.send_text('{"type": "ping", "id": 7}')
+        assert json.loads(ws.receive_text()) == {"type": "pong", "id": 7}
+        ws.send_text("Hello from customer!")
+        assert json.loads(ws.receive_text())["type"] == "error"
+
+
+def test_accept_over_socket_notifies_topic_subscribers():
+    order_id = create_order()
+    with client.websocket_connect("/ws/customer/customer-1") as customer:
+        customer.send_text(json.dumps({"type": "subscribe", "topic": f"order:{order_id}"}))
+        assert json.loads(customer.receive_text())["type"] == "subscribed"
+
+        with client.websocket_connect("/ws/delivery/partner-1") as partner:
+            partner.send_text(json.dumps({"type": "accept", "order_id": order_id, "id": "a1"}))
+            assert json.loads(partner.receive_text())["type"] == "order_taken"
+            result = json.loads(partner.receive_text())
+            assert result["type"] == "accept_result" and result["id"] == "a1"
+            assert result["otp"] == fake_appscript.sheets.orders[order_id]["otp"]
+
+        # Direct customer notification, then the order topic publication
+        assert json.loads(customer.receive_text())["type"] == "order_accepted"
+        update = json.loads(customer.receive_text())
+        assert update["type"] == "order_update" and update["status"] == "Accepted"
+
+
+def test_slow_accept_does_not_block_the_socket():
+    order_id = create_order()
+    fake_appscript.configure(path_latency={"assign_order": "fixed:300"})
+    with client.websocket_connect("/ws/delivery/partner-3") as partner:
+        partner.send_text(json.dumps({"type": "accept", "order_id": order_id, "id": "a2"}))
+        partner.send_text(json.dumps({"type": "ping", "id": 9}))
+        # The pong comes back while the accept is still waiting on the backend
+        assert json.loads(partner.receive_text()) == {"type": "pong", "id": 9}
+        frames = [json.loads(partner.receive_text()) for _ in range(2)]
+        assert {frame["type"] for frame in frames} == {"order_taken", "accept_result"}
+
+
+def test_location_updates_are_recorded():
+    with client.websocket_connect("/ws/delivery/partner-2") as ws:
+        ws.send_text('{"type": "location", "lat": 13.08, "lng": 80.27}')
+        ws.send_text('{"type": "ping"}')
+        ws.receive_text()
+        assert main.partner_index.position("partner-2") == (13.08, 80.27)
+        nearby = client.get("/partners/nearby", params={"lat": 13.081, "lng": 80.271}).json()
+        assert nearby[0]["partner_id"] == "partner-2"
+    assert "partner-2" not in main.partner_index
@@ -1,84 +1,218 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+from typing import Dict, Iterable, List, Optional
+import os
 import uuid
 
+from webhook_delivery import WebhookDelivery
+
 app = FastAPI()
 
-# Simulating a simple in-memory store to keep track of bookings
-bookings = {}
-partners = ["Partner1", "Partner2", "Partner3", "Partner4", "Partner5",
-            "Partner6", "Partner7", "Partner8", "Partner9", "Partner10"]
 
 class Booking(BaseModel):
     user_id: str
     service_name: str
     service_details: str
 
+
+class PartnerRegistration(BaseModel):
+    url: Optional[str] = None   # webhook endpoint for this partner's bookings
+
+
+class PartnerRegistry:
+    """Partner names <-> dense indexes, in registration order."""
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str) -> int:
+        if name not in self.index:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+        return self.index[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class BookingState:
+    """
+    A booking's state in O(1) space whatever the fleet size: every partner
+    registered when it was made (index < audience) was offered it; until it
+    is picked they are all pending, afterwards all but the picker are removed.
+    """
+    __slots__ = ("service", "audience", "picked_by")
+
+    def __init__(self, service: Booking, audience: int):
+        self.service = service
+        self.audience = audience
+        self.picked_by: Optional[int] = None
+
+    def status_for(self, partner: int) -> Optional[str]:
+        if partner >= self.audience:
+            return None   # joined after the booking was made
+        if self.picked_by is None:
+            return "pending"
+        return "picked" if self.picked_by == partner else "removed"
+
+
+class BookingStore:
+    def __init__(self, partners: PartnerRegistry):
+        self.partners = partners
+        self.bookings: Dict[str, BookingState] = {}
+        # Bookings nobody has picked yet, oldest first. The registry only grows,
+        # so audiences never decrease along this order.
+        self.open: Dict[str, BookingState] = {}
+
+    def create(self, booking_id: str, service: Booking) -> BookingState:
+        state = BookingState(service, len(self.partners))
+        self.bookings[booking_id] = state
+        self.open[booking_id] = state
+        return state
+
+    def claim(self, booking_id: str, partner: int) -> int:
+        """
+        Pick the booking for `partner` unless someone already has; returns the
+        picker. There is no await between the check and the write, so exactly
+        one of any number of concurrent pickups wins.
+        """
+        state = self.bookings[booking_id]
+        if state.picked_by is None:
+            state.picked_by = partner
+            del self.open[booking_id]
+        return state.picked_by
+
+    def pending_for(self, partner: int, limit: Optional[int] = None) -> List[str]:
+        """Bookings `partner` can still pick, newest first, in O(result)."""
+        pending = []
+        for booking_id, state in reversed(self.open.items()):
+            if state.audience <= partner or len(pending) == limit:
+                break   # older bookings were made before this partner joined
+            pending.append(booking_id)
+        return pending
+
+
+# Partners are configured with WEBHOOK_PARTNERS (comma separated) or registered via POST /partners/{name}
+partners = PartnerRegistry(
+    name.strip() for name in os.getenv(
+        "WEBHOOK_PARTNERS",
+        "Partner1,Partner2,Partner3,Partner4,Partner5,Partner6,Partner7,Partner8,Partner9,Partner10"
+    ).split(",") if name.strip()
+)
+bookings = BookingStore(partners)
+delivery = WebhookDelivery()
+app.router.on_shutdown.append(delivery.close)
+
+
+def partner_index(partner_name: str) -> int:
+    if partner_name not in partners:
+        raise HTTPException(status_code=400, detail="Invalid partner")
+    return partners.index[partner_name]
+
+
+@app.post("/partners/{partner_name}")
+async def register_partner(partner_name: str, registration: Optional[PartnerRegistration] = None):
+    """Add a partner, or update its webhook URL; it is offered bookings made from now on."""
+    index = partners.add(partner_name)
+    if registration is not None:
+        delivery.register(index, partner_name, registration.url)
+    return {"partner": partner_name, "index": index, "partners": len(partners),
+            "url": delivery.partner_urls.get(index)}
+
+
 @app.post("/book_service/")
 async def book_service(booking: Booking):
     # Generate a unique booking ID
     booking_id = str(uuid.uuid4())
-    
-    # Save the booking and notify all partners
-    bookings[booking_id] = {
-        "service": booking,
-        "partners": {partner: "pending" for partner in partners}
-    }
-    
+
+    # Save the booking; it is pending for every partner registered right now
+    bookings.create(booking_id, booking)
+
     # Print the booking ID
     print(f"Booking ID: {booking_id} created for service '{booking.service_name}' by user '{booking.user_id}'")
-    
+
     # Notify all partners
     notify_partners(booking_id)
-    
+
     return {"message": "Booking created and sent to partners", "booking_id": booking_id}
 
+
 @app.post("/partner_pickup/{booking_id}/{partner_name}")
 async def partner_pickup(booking_id: str, partner_name: str):
     # Check if the booking exists
-    if booking_id not in bookings:
+    state = bookings.bookings.get(booking_id)
+    if state is None:
         raise HTTPException(status_code=404, detail="Booking not found")
-    
-    # Check if the partner is valid
-    if partner_name not in partners:
-        raise HTTPException(status_code=400, detail="Invalid partner")
-    
-    # If the partner has not already picked the service, update the status
-    if bookings[booking_id]["partners"][partner_name] == "picked":
-        raise HTTPException(status_code=400, detail="Service already picked by another partner")
-    
-    # Update the partner's status to 'picked'
-    bookings[booking_id]["partners"][partner_name] = "picked"
-    
-    # Remove the booking from the remaining partners
-    for partner in partners:
-        if partner != partner_name:
-            bookings[booking_id]["partners"][partner] = "removed"
-    
-    # Print which partner picked the service and the remaining partners' requests
+
+    partner = partner_index(partner_name)
+    if state.status_for(partner) is None:
+        raise HTTPException(status_code=400, detail="Booking was not offered to this partner")
+
+    # First pickup wins; a retry by the same partner gets the same answer
+    if bookings.claim(booking_id, partner) != partner:
+        raise HTTPException(status_code=409, detail="Service already picked by another partner")
+
     print(f"Partner '{partner_name}' picked the service with Booking ID: {booking_id}")
-    print("Remaining partners whose requests got cancelled:")
-    for partner, status in bookings[booking_id]["partners"].items():
-        if status == "removed":
-            print(f"- {partner}")
+    print(f"Requests to the other {state.audience - 1} partners got cancelled")
 
     return {"message": f"Service picked by {partner_name}", "booking_id": booking_id, "partner": partner_name}
 
+
 @app.get("/get_booking/{booking_id}")
-async def get_booking(booking_id: str):
+async def get_booking(booking_id: str, partner: Optional[str] = None):
+    """Booking status; pass `partner` for that partner's status (pending, picked or removed)."""
     # Check if the booking exists
-    if booking_id not in bookings:
+    state = bookings.bookings.get(booking_id)
+    if state is None:
         raise HTTPException(status_code=404, detail="Booking not found")
-    
-    return bookings[booking_id]
+
+    booking = {
+        "service": state.service,
+        "status": "pending" if state.picked_by is None else "picked",
+        "picked_by": partners.names[state.picked_by] if state.picked_by is not None else None,
+        "partners_notified": state.audience
+    }
+    if partner is not None:
+        booking["partner_status"] = state.status_for(partner_index(partner))
+    return booking
+
+
+@app.get("/partner_bookings/{partner_name}")
+async def partner_bookings(partner_name: str, limit: int = 100):
+    """Bookings this partner can still pick, newest first."""
+    return {"partner": partner_name, "bookings": bookings.pending_for(partner_index(partner_name), limit)}
+
+
+@app.get("/webhooks/stats")
+async def webhook_stats():
+    """Delivery queue, batch, retry and dead-letter counters."""
+    return delivery.stats()
+
+
+@app.get("/webhooks/dead_letters")
+async def dead_letters():
+    return list(delivery.dead_letters.entries)
+
+
+@app.post("/webhooks/dead_letters/retry")
+async def retry_dead_letters():
+    """Send dead-lettered events to their endpoints again."""
+    return {"requeued": delivery.retry_dead_letters()}
+
 
 def notify_partners(booking_id: str):
-    # Here you would send data to the partners via a webhook or some other mechanism
-    # For now, just simulate the notification (print the booking data for each partner)
-    booking = bookings[booking_id]["service"]
-    for partner in partners:
-        print(f"Notifying {partner} about the new service booking: {booking.service_name}")
+    # Queued for the background webhook pipeline; the request does not wait for partners
+    state = bookings.bookings[booking_id]
+    delivery.enqueue(booking_id, state.service.model_dump(), state.audience)
+    print(f"Notifying {state.audience} partners about the new service booking: {state.service.service_name}")
+
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("webhook:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("webhook:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,241 @@
+"""
+Asynchronous webhook delivery for service bookings (webhook.py).
+
+Booking requests only append the booking to a queue and return. A
+background fan-out task turns each queued booking into one event per
+partner endpoint (partners registered with the same URL share an event
+naming all of them), and each endpoint with pending events gets a
+sender task that POSTs them in batches:
+
+    POST <url>  {"events": [{"booking_id": ..., "partners": [...], "booking": {...}}, ...]}
+
+- one pooled httpx client for all endpoints, with at most `concurrency`
+  requests in flight overall and one batch at a time per endpoint;
+- a batch is sent once `batch_size` events are pending or the oldest
+  has waited `batch_window` seconds;
+- network errors, 5xx and 429 are retried up to `max_attempts` times
+  with exponential backoff and jitter; other statuses are not retried;
+- batches that still fail, and events that overflow an endpoint's
+  `max_pending`, go to a bounded dead-letter store and can be requeued.
+
+So throughput grows with the number of endpoints being served in
+parallel rather than with the latency of any single partner.
+"""
+
+from collections import deque
+from typing import Dict, List, Optional
+import asyncio
+import os
+import random
+import time
+
+import httpx
+
+RETRY_STATUSES = {429}
+
+
+class DeadLetterStore:
+    """Batches that could not be delivered, newest last; oldest dropped beyond max_entries."""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        max_entries = max_entries if max_entries is not None else int(os.getenv("WEBHOOK_DEAD_LETTERS", "10000"))
+        self.entries: deque = deque(maxlen=max_entries)
+        self.total = 0
+
+    def add(self, url: str, events: List[dict], reason: str, attempts: int):
+        self.entries.append({"url": url, "events": events, "reason": reason,
+                             "attempts": attempts, "failed_at": time.time()})
+        self.total += 1
+
+    def drain(self) -> List[dict]:
+        entries = list(self.entries)
+        self.entries.clear()
+        return entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class Endpoint:
+    __slots__ = ("url", "partners", "pending", "oldest_at", "task", "delivered", "batches", "retries")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.partners: Dict[int, str] = {}   # partner index -> name
+        self.pending: deque = deque()
+        self.oldest_at = 0.0
+        self.task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.batches = 0
+        self.retries = 0
+
+
+class WebhookDelivery:
+    def __init__(self, concurrency: Optional[int] = None, batch_size: Optional[int] = None,
+                 batch_window: Optional[float] = None, max_attempts: Optional[int] = None,
+                 backoff_base: Optional[float] = None, backoff_max: Optional[float] = None,
+                 timeout: Optional[float] = None, max_pending: Optional[int] = None,
+                 dead_letters: Optional[DeadLetterStore] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.concurrency = concurrency or int(os.getenv("WEBHOOK_CONCURRENCY", "64"))
+        self.batch_size = batch_size or int(os.getenv("WEBHOOK_BATCH_SIZE", "50"))
+        self.batch_window = batch_window if batch_window is not None else float(
+            os.getenv("WEBHOOK_BATCH_WINDOW", "0.05"))
+        self.max_attempts = max_attempts or int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+        self.backoff_base = backoff_base if backoff_base is not None else float(
+            os.getenv("WEBHOOK_BACKOFF_BASE", "0.5"))
+        self.backoff_max = backoff_max if backoff_max is not None else float(
+            os.getenv("WEBHOOK_BACKOFF_MAX", "30"))
+        self.timeout = timeout or float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+        self.max_pending = max_pending or int(os.getenv("WEBHOOK_MAX_PENDING", "10000"))
+        self.dead_letters = dead_letters or DeadLetterStore()
+        self.transport = transport
+        self.endpoints: Dict[str, Endpoint] = {}
+        self.partner_urls: Dict[int, str] = {}
+        # Queued bookings: (booking_id, booking payload, audience)
+        self.bookings: deque = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.queued = 0
+        self.fanned_out = 0
+
+    def register(self, partner: int, name: str, url: Optional[str]):
+        """Deliver `partner`'s bookings to `url` (None stops deliveries)."""
+        previous = self.partner_urls.pop(partner, None)
+        if previous is not None:
+            endpoint = self.endpoints[previous]
+            endpoint.partners.pop(partner, None)
+            if not endpoint.partners and not endpoint.pending:
+                del self.endpoints[previous]
+        if url:
+            self.partner_urls[partner] = url
+            endpoint = self.endpoints.get(url)
+            if endpoint is None:
+                endpoint = self.endpoints[url] = Endpoint(url)
+            endpoint.partners[partner] = name
+
+    def enqueue(self, booking_id: str, booking: dict, audience: int):
+        """Queue a booking for delivery to every endpoint; returns at once."""
+        self.bookings.append((booking_id, booking, audience))
+        self.queued += 1
+        self._ensure_running()
+        self._wake.set()
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Loop-bound primitives and pooled connections belong to one event loop
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                transport=self.transport, timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.concurrency,
+                                    max_keepalive_connections=self.concurrency))
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._wake = asyncio.Event()
+            for endpoint in self.endpoints.values():
+                endpoint.task = None
+        task = self._task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._task = loop.create_task(self._fan_out())
+
+    async def _fan_out(self):
+        while True:
+            while not self.bookings:
+                self._wake.clear()
+                await self._wake.wait()
+            booking_id, booking, audience = self.bookings.popleft()
+            self.fanned_out += 1
+            for count, endpoint in enumerate(list(self.endpoints.values()), 1):
+                partners = [name for partner, name in endpoint.partners.items() if partner < audience]
+                if partners:
+                    self._push(endpoint, [{"booking_id": booking_id, "partners": partners, "booking": booking}])
+                if count % 1000 == 0:
+                    await asyncio.sleep(0)   # large fleets: let requests in between
+
+    def _push(self, endpoint: Endpoint, events: List[dict]):
+        room = self.max_pending - len(endpoint.pending)
+        if room < len(events):
+            self.dead_letters.add(endpoint.url, events[max(room, 0):], "queue_full", 0)
+            events = events[:max(room, 0)]
+        if not events:
+            return
+        if not endpoint.pending:
+            endpoint.oldest_at = time.monotonic()
+        endpoint.pending.extend(events)
+        if endpoint.task is None or endpoint.task.done():
+            endpoint.task = self._loop.create_task(self._send_loop(endpoint))
+
+    async def _send_loop(self, endpoint: Endpoint):
+        while endpoint.pending:
+            wait = endpoint.oldest_at + self.batch_window - time.monotonic()
+            if len(endpoint.pending) < self.batch_size and wait > 0:
+                await asyncio.sleep(wait)
+            batch = [endpoint.pending.popleft() for _ in range(min(self.batch_size, len(endpoint.pending)))]
+            endpoint.oldest_at = time.monotonic()
+            await self._deliver(endpoint, batch)
+
+    async def _deliver(self, endpoint: Endpoint, batch: List[dict]):
+        reason = ""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with self._slots:
+                    response = await self._client.post(endpoint.url, json={"events": batch})
+                if response.status_code < 300:
+                    endpoint.delivered += len(batch)
+                    endpoint.batches += 1
+                    return
+                reason = f"HTTP {response.status_code}"
+                if response.status_code < 500 and response.status_code not in RETRY_STATUSES:
+                    break
+            except httpx.HTTPError as e:
+                reason = f"{type(e).__name__}: {e}"
+            if attempt < self.max_attempts:
+                endpoint.retries += 1
+                delay = min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        print(f"Webhook delivery to {endpoint.url} failed after {attempt} attempts ({reason})")
+        self.dead_letters.add(endpoint.url, batch, reason, attempt)
+
+    def retry_dead_letters(self) -> int:
+        """Requeue dead-lettered events to their endpoints; returns how many."""
+        self._ensure_running()
+        requeued = 0
+        for entry in self.dead_letters.drain():
+            endpoint = self.endpoints.get(entry["url"])
+            if endpoint is None:
+                continue   # the endpoint was removed since
+            self._push(endpoint, entry["events"])
+            requeued += len(entry["events"])
+        return requeued
+
+    async def drain(self, timeout: float = 30.0):
+        """Wait until every queued booking has been delivered or dead-lettered."""
+        deadline = time.monotonic() + timeout
+        while self.bookings or any(endpoint.pending or (endpoint.task and not endpoint.task.done())
+                                   for endpoint in self.endpoints.values()):
+            if time.monotonic() > deadline:
+                raise asyncio.TimeoutError("Webhook deliveries still pending")
+            await asyncio.sleep(0.01)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    def stats(self) -> dict:
+        return {
+            "endpoints": len(self.endpoints),
+            "queued_bookings": len(self.bookings),
+            "bookings": self.queued,
+            "fanned_out": self.fanned_out,
+            "pending_events": sum(len(endpoint.pending) for endpoint in self.endpoints.values()),
+            "delivered_events": sum(endpoint.delivered for endpoint in self.endpoints.values()),
+            "batches": sum(endpoint.batches for endpoint in self.endpoints.values()),
+            "retries": sum(endpoint.retries for endpoint in self.endpoints.values()),
+            "dead_letters": len(self.dead_letters),
+            "dead_lettered_total": self.dead_letters.total
+        }
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Local partner endpoint for testing webhook deliveries (webhook_delivery.py).
+
+Accepts POST /hooks/{name} batches, keeps what it received in memory and
+can be made slow or flaky:
+
+    python webhook_receiver.py --port 9100 --latency 0.2 --error-rate 0.1
+
+then register partners against it:
+
+    curl -X POST localhost:8000/partners/Partner1 -H 'Content-Type: application/json' \\
+         -d '{"url": "http://127.0.0.1:9100/hooks/partner1"}'
+
+GET /hooks/{name} lists what that endpoint received.
+"""
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from typing import Dict, List
+import argparse
+import asyncio
+import random
+
+app = FastAPI()
+
+received: Dict[str, List[dict]] = {}   # {endpoint name: events}
+settings = {"latency": 0.0, "error_rate": 0.0, "error_status": 500, "fail_first": 0}
+attempts: Dict[str, int] = {}
+
+
+def configure(latency: float = 0.0, error_rate: float = 0.0, error_status: int = 500, fail_first: int = 0):
+    """Delay every request by `latency` s; fail `error_rate` of them, and the first `fail_first` per endpoint."""
+    settings.update(latency=latency, error_rate=error_rate, error_status=error_status, fail_first=fail_first)
+    received.clear()
+    attempts.clear()
+
+
+@app.post("/hooks/{name}")
+async def receive(name: str, request: Request):
+    attempts[name] = attempts.get(name, 0) + 1
+    if settings["latency"]:
+        await asyncio.sleep(settings["latency"])
+    if attempts[name] <= settings["fail_first"] or random.random() < settings["error_rate"]:
+        return JSONResponse({"success": False}, status_code=settings["error_status"])
+    events = (await request.json())["events"]
+    received.setdefault(name, []).extend(events)
+    return {"success": True, "received": len(events)}
+
+
+@app.get("/hooks/{name}")
+async def list_received(name: str):
+    return {"attempts": attempts.get(name, 0), "events": received.get(name, [])}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local webhook receiver")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+    configure(args.latency, args.error_rate, args.error_status)
+    uvicorn.run(app, host=args.host, port=args.port)
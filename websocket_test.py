@@ -17,8 +17,8 @@ async def test_delivery_partner_websocket():
         async with websockets.connect(uri) as websocket:
             print("✅ Connected as delivery partner")
 
-            # Send a test message
-            await websocket.send("Hello from delivery partner!")
+            # Share a location fix (typed protocol, see ws_protocol.py)
+            await websocket.send(json.dumps({"type": "location", "lat": 13.0827, "lng": 80.2707}))
 
             # Listen for messages
             while True:
@@ -48,8 +48,8 @@ async def test_customer_websocket():
         async with websockets.connect(uri) as websocket:
             print("✅ Connected as customer")
 
-            # Send a test message
-            await websocket.send("Hello from customer!")
+            # Check the connection with a correlated ping
+            await websocket.send(json.dumps({"type": "ping", "id": "hello"}))
 
             # Listen for messages
             while True:
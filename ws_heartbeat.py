@@ -0,0 +1,83 @@
+"""
+Heartbeat bookkeeping for WebSocket clients.
+
+A single hashed timer wheel drives pings and idle reaping for every
+connection, instead of one timer (or sleeping task) per socket.
+"""
+
+from typing import Dict, List, Optional
+import math
+import os
+
+
+class HeartbeatConfig:
+    """Heartbeat settings, overridable through environment variables."""
+
+    def __init__(self, ping_interval: Optional[float] = None, idle_timeout: Optional[float] = None,
+                 send_timeout: Optional[float] = None, tick: Optional[float] = None):
+        # Send an application ping when a client has been quiet this long
+        self.ping_interval = ping_interval if ping_interval is not None else float(
+            os.getenv("WS_PING_INTERVAL", "25"))
+        # Reap connections with no inbound frame (pong or otherwise) for this long; 0 disables
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(
+            os.getenv("WS_IDLE_TIMEOUT", "120"))
+        # A send that cannot complete in this time means the peer is gone
+        self.send_timeout = send_timeout if send_timeout is not None else float(
+            os.getenv("WS_SEND_TIMEOUT", "5"))
+        self.tick = tick if tick is not None else float(os.getenv("WS_HEARTBEAT_TICK", "1"))
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel with O(1) scheduling. Each call to advance() moves
+    the wheel one tick and returns the entries whose deadline has passed.
+    Entries are not cancelled; callers skip the ones that are stale.
+    """
+
+    def __init__(self, tick: float, slots: int = 512):
+        self.tick = tick
+        self.slots: List[List[list]] = [[] for _ in range(slots)]
+        self.position = 0
+        self.size = 0
+
+    def schedule(self, entry, delay: float):
+        ticks = max(int(math.ceil(delay / self.tick)), 1)
+        rounds, offset = divmod(ticks, len(self.slots))
+        if offset == 0:
+            rounds, offset = rounds - 1, len(self.slots)
+        slot = (self.position + offset) % len(self.slots)
+        self.slots[slot].append([rounds, entry])
+        self.size += 1
+
+    def advance(self) -> list:
+        self.position = (self.position + 1) % len(self.slots)
+        bucket = self.slots[self.position]
+        if not bucket:
+            return []
+        expired = []
+        remaining = []
+        for timer in bucket:
+            if timer[0] == 0:
+                expired.append(timer[1])
+            else:
+                timer[0] -= 1
+                remaining.append(timer)
+        self.slots[self.position] = remaining
+        self.size -= len(expired)
+        return expired
+
+
+class HeartbeatMetrics:
+    def __init__(self):
+        self.pings_sent = 0
+        self.reaped: Dict[str, int] = {}
+
+    def record_reap(self, reason: str):
+        self.reaped[reason] = self.reaped.get(reason, 0) + 1
+
+    def snapshot(self) -> dict:
+        return {
+            "pings_sent": self.pings_sent,
+            "reaped": dict(self.reaped),
+            "reaped_total": sum(self.reaped.values())
+        }
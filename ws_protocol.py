@@ -0,0 +1,135 @@
+"""
+Typed message protocol for the WebSocket endpoints.
+
+Inbound frames are JSON objects with a "type" field. Each type has a
+compact schema (field -> expected type, required or not) checked once
+after decoding, and is routed to a registered handler. Clients may send
+an "id" with any message; replies echo it back for correlation.
+
+    {"type": "ping"}                                   -> {"type": "pong"}
+    {"type": "pong"}                                   (no reply)
+    {"type": "ack", "seq": 12}                         (no reply)
+    {"type": "resume", "last_seq": 12}                 -> missed notifications, or {"type": "resync", ...}
+    {"type": "subscribe", "topic": "order:<id>"}       -> {"type": "subscribed", ...}
+                                                          then {"type": "order_update", ...} frames
+    {"type": "subscribe", "topic": "order_board",      -> {"type": "board_snapshot", ...} or {"type": "board_diff", ...}
+     "version": "<epoch>.<n>"}                            then {"type": "board_diff", ...} frames (delivery partners)
+    {"type": "unsubscribe", "topic": "order:<id>"}     -> {"type": "unsubscribed", ...}
+    {"type": "location", "lat": 13.08, "lng": 80.27}   (delivery partners, no reply)
+    {"type": "accept", "order_id": "<id>"}             -> {"type": "accept_result", ...}
+    {"type": "decline", "order_id": "<id>"}            (delivery partners, declines an order_offer)
+"""
+
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import json
+import math
+
+NUMBER = (int, float)
+# Inclusive ranges for numeric fields that have one
+FIELD_RANGES = {"lat": (-90.0, 90.0), "lng": (-180.0, 180.0)}
+
+# type -> ({field: (expected types, required)}, roles allowed or None for all)
+MESSAGE_SCHEMAS: Dict[str, Tuple[Dict[str, tuple], Optional[set]]] = {
+    "ping": ({}, None),
+    "pong": ({}, None),
+    "ack": ({"seq": (int, True)}, None),
+    "resume": ({"last_seq": (int, True)}, {"customers"}),
+    "subscribe": ({"topic": (str, True), "version": (str, False)}, None),
+    "unsubscribe": ({"topic": (str, True)}, None),
+    "location": ({
+        "lat": (NUMBER, True),
+        "lng": (NUMBER, True),
+        "accuracy": (NUMBER, False),
+        "heading": (NUMBER, False),
+        "speed": (NUMBER, False),
+        "ts": (NUMBER, False),
+    }, {"delivery_partners"}),
+    "accept": ({"order_id": (str, True)}, {"delivery_partners"}),
+    "decline": ({"order_id": (str, True)}, {"delivery_partners"}),
+}
+
+PONG = json.dumps({"type": "pong"})
+
+
+class ProtocolError(Exception):
+    def __init__(self, message: str, msg_id=None):
+        super().__init__(message)
+        self.msg_id = msg_id
+
+
+def parse_message(text: str, client_type: str) -> dict:
+    """Decode and validate one inbound frame; raises ProtocolError."""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        raise ProtocolError("Frames must be JSON objects")
+    if not isinstance(message, dict):
+        raise ProtocolError("Frames must be JSON objects")
+
+    msg_id = message.get("id")
+    msg_type = message.get("type")
+    spec = MESSAGE_SCHEMAS.get(msg_type)
+    if spec is None:
+        raise ProtocolError(f"Unknown message type: {msg_type}", msg_id)
+
+    fields, roles = spec
+    if roles is not None and client_type not in roles:
+        raise ProtocolError(f"'{msg_type}' is not allowed for {client_type}", msg_id)
+    for name, (expected, required) in fields.items():
+        value = message.get(name)
+        if value is None:
+            if required:
+                raise ProtocolError(f"'{msg_type}' requires '{name}'", msg_id)
+            continue
+        # bool is an int subclass but never a valid number here
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ProtocolError(f"Invalid '{name}' for '{msg_type}'", msg_id)
+        # json.loads accepts NaN and Infinity
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ProtocolError(f"Invalid '{name}' for '{msg_type}'", msg_id)
+        bounds = FIELD_RANGES.get(name)
+        if bounds is not None and not bounds[0] <= value <= bounds[1]:
+            raise ProtocolError(f"'{name}' out of range for '{msg_type}'", msg_id)
+    return message
+
+
+def encode_reply(msg_type: str, msg_id=None, **fields) -> str:
+    reply = {"type": msg_type}
+    if msg_id is not None:
+        reply["id"] = msg_id
+    reply.update(fields)
+    return json.dumps(reply)
+
+
+def encode_error(error: str, msg_id=None) -> str:
+    return encode_reply("error", msg_id, error=error)
+
+
+Handler = Callable[[Dict, dict], Awaitable[Optional[str]]]
+
+
+class MessageDispatcher:
+    """Routes validated messages to handlers; a handler may return a reply frame."""
+
+    def __init__(self):
+        self.handlers: Dict[str, Handler] = {}
+
+    def on(self, msg_type: str):
+        if msg_type not in MESSAGE_SCHEMAS:
+            raise ValueError(f"No schema for message type '{msg_type}'")
+
+        def register(handler: Handler) -> Handler:
+            self.handlers[msg_type] = handler
+            return handler
+        return register
+
+    async def dispatch(self, connection: Dict, text: str) -> Optional[str]:
+        try:
+            message = parse_message(text, connection["client_type"])
+        except ProtocolError as e:
+            return encode_error(str(e), e.msg_id)
+
+        handler = self.handlers.get(message["type"])
+        if handler is None:
+            return None
+        return await handler(connection, message)